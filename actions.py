@@ -1,38 +1,42 @@
 # actions.py - Enhanced Version with OCR Support
 import asyncio
 import subprocess
+import hashlib
 import io
+import shlex
+import threading
 import time
 from typing import Dict, List, Tuple, Optional, Set
 from dataclasses import dataclass
 import os
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 
 import numpy as np
 from PIL import Image
 import cv2
 from screenrecord_manager import get_screenrecord_manager, cleanup_all_screenrecord
+from adb_client import adb_session_manager
+from compute_executor import compute_executor
+from pixel_matcher import pixel_matcher_cache
+from task_registry import bucket_tasks
+from template_atlas import TemplateAtlas, build_atlas, collect_template_paths, load_template_png
+from template_matching import TemplateFrame, TemplateInstance, pyramid_scale_for, template_plan_cache, template_match_stats
 import settings
 
-# OCR imports
-try:
-    import pytesseract
-    TESSERACT_AVAILABLE = True
-    # Configure Tesseract path for Windows (adjust as needed)
-    # pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-except ImportError:
+# OCR imports - Tesseract runs in resident tesserocr engines when installed, else via pytesseract
+from tesseract_engine import tesseract_engine
+TESSERACT_AVAILABLE = tesseract_engine.available
+if not TESSERACT_AVAILABLE:
     print("[OCR] Tesseract not available - OCR features disabled")
-    TESSERACT_AVAILABLE = False
 
-try:
-    import easyocr
-    # Initialize EasyOCR reader (supports multiple languages)
-    ocr_reader = easyocr.Reader(['en'], gpu=True)  # Use GPU if available
-    EASYOCR_AVAILABLE = True
-except ImportError:
+# EasyOCR models are loaded on first use (ocr_engine), not at import
+from ocr_engine import EASYOCR_INSTALLED, ocr_engine
+from ocr_worker_pool import ocr_worker_pool
+from glyph_ocr import GlyphReading, glyph_ocr
+from ocr_strategy_scheduler import ocr_strategy_scheduler
+from metrics import metrics
+if not EASYOCR_INSTALLED:
     print("[OCR] EasyOCR not available - falling back to Tesseract")
-    EASYOCR_AVAILABLE = False
-    ocr_reader = None
 
 # PyAutoGUI import with headless environment handling
 try:
@@ -53,12 +57,187 @@ class ScreenshotCache:
     image: np.ndarray
     timestamp: float
     
+# Android PixelFormat values that screencap can emit without -p
+RAW_FORMAT_RGBA_8888 = 1
+RAW_FORMAT_RGBX_8888 = 2
+RAW_FORMAT_BGRA_8888 = 5
+
+def parse_raw_header(data: bytes) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Read (width, height, pixel_format, header_size) from raw `screencap` output.
+    The header is width, height, format (uint32 LE) plus a colorspace field on
+    Android 9+, so it is 12 or 16 bytes; the real size is inferred from the payload.
+    """
+    if len(data) < 12:
+        return None
+
+    width, height, pixel_format = np.frombuffer(data, dtype='<u4', count=3)
+    width, height, pixel_format = int(width), int(height), int(pixel_format)
+    header_size = len(data) - width * height * 4
+
+    if header_size not in (12, 16) or width == 0 or height == 0:
+        return None
+    return width, height, pixel_format, header_size
+
+def raw_pixels_to_rgb(frame: np.ndarray, pixel_format: int) -> Optional[np.ndarray]:
+    """
+    (rows, W, 4) raw pixels as a contiguous, writable RGB array; None for unsupported formats.
+    The input is a read-only view of the adb bytes, so the alpha channel is dropped in one copy
+    instead of handing that view to code that may modify frames in place.
+    """
+    if pixel_format in (RAW_FORMAT_RGBA_8888, RAW_FORMAT_RGBX_8888):
+        return np.ascontiguousarray(frame[:, :, :3])
+    if pixel_format == RAW_FORMAT_BGRA_8888:
+        return np.ascontiguousarray(frame[:, :, 2::-1])
+    return None
+
+def parse_raw_screencap(data: bytes) -> Optional[np.ndarray]:
+    """
+    Raw `screencap` output as an (H, W, 3) RGB array (one copy, no decode).
+    Returns None for headers or pixel formats we don't handle.
+    """
+    header = parse_raw_header(data)
+    if header is None:
+        return None
+
+    width, height, pixel_format, header_size = header
+    frame = np.frombuffer(data, dtype=np.uint8, count=width * height * 4, offset=header_size)
+    return raw_pixels_to_rgb(frame.reshape((height, width, 4)), pixel_format)
+
+class SparseFrame:
+    """
+    A frame where only some row bands were captured (see ScreenshotManager.get_screenshot_for_tasks).
+    Supports the indexing the matchers use: frame[y, x] for a pixel and
+    frame[y0:y1, x0:x1] for an ROI, as long as the rows fall inside one captured band.
+    """
+
+    def __init__(self, width: int, height: int, bands: List[Tuple[int, np.ndarray]]):
+        self.shape = (height, width, 3)
+        self.size = width * height * 3
+        self.bands = bands  # (first_row, (rows, W, 3) RGB array)
+        self.row_band = np.full(height, -1, dtype=np.int32)
+        for index, (first_row, band) in enumerate(bands):
+            self.row_band[first_row:first_row + band.shape[0]] = index
+
+    def _band_for_rows(self, start: int, stop: int) -> Tuple[int, np.ndarray]:
+        index = self.row_band[start]
+        if index < 0:
+            raise IndexError(f"row {start} was not captured")
+        first_row, band = self.bands[index]
+        if stop > first_row + band.shape[0]:
+            raise IndexError(f"rows {start}:{stop} span more than one captured band")
+        return first_row, band
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        row_key, rest = key[0], key[1:]
+        height = self.shape[0]
+
+        if isinstance(row_key, (int, np.integer)):
+            row = int(row_key) + height if row_key < 0 else int(row_key)
+            if not 0 <= row < height:
+                raise IndexError(f"row {row_key} out of range")
+            first_row, band = self._band_for_rows(row, row + 1)
+            return band[(row - first_row,) + rest]
+
+        if isinstance(row_key, slice):
+            start, stop, step = row_key.indices(height)
+            if start >= stop:
+                return np.zeros((0, self.shape[1], 3), dtype=np.uint8)[(slice(None),) + rest]
+            first_row, band = self._band_for_rows(start, stop)
+            return band[(slice(start - first_row, stop - first_row, step),) + rest]
+
+        raise TypeError(f"SparseFrame does not support index {key!r}")
+
+    def gather(self, ys: np.ndarray, xs: np.ndarray) -> np.ndarray:
+        """Equivalent of frame[ys, xs] for many captured pixels at once"""
+        result = np.zeros((len(ys), 3), dtype=np.uint8)
+        band_indices = self.row_band[ys]
+        for index, (first_row, band) in enumerate(self.bands):
+            selected = np.nonzero(band_indices == index)[0]
+            if len(selected):
+                result[selected] = band[ys[selected] - first_row, xs[selected]]
+        return result
+
+def gather_pixels(frame, ys: np.ndarray, xs: np.ndarray) -> np.ndarray:
+    """frame[ys, xs] for a full frame or a SparseFrame"""
+    if isinstance(frame, SparseFrame):
+        return frame.gather(ys, xs)
+    return frame[ys, xs]
+
+def required_frame_rows(tasks: List[dict], frame_height: int) -> Optional[Set[int]]:
+    """
+    Frame rows the matchers will read for these tasks, or None when a task needs
+    the full frame (OCR, orb extraction, screenshot saving, templates without ROI).
+    """
+    rows: Set[int] = set()
+
+    for task in tasks:
+        task_type = task.get("type", "pixel")
+
+        if task.get("save_screenshot_with_username", False):
+            return None
+
+        if task_type == "pixel" or task_type == "Pixel-OneOrMoreMatched":
+            values = task.get("search_array", []) if task_type == "pixel" else task.get("pixel-values", [])
+            for coords_str in values[0::2]:
+                try:
+                    y = int(coords_str.split(',')[1])
+                except (ValueError, IndexError, AttributeError):
+                    continue
+                if 0 <= y < frame_height:
+                    rows.add(y)
+        elif task_type == "template":
+            roi = task.get("roi")
+            if not roi:
+                return None
+            _, y, _, h = roi
+            rows.update(range(max(0, y), min(frame_height, y + h)))
+        elif task_type in ("ocr", "ultra_robust_orb"):
+            return None
+
+    return rows
+
+def merge_rows_into_bands(rows: Set[int], max_bands: int, merge_gap: int = 4) -> List[Tuple[int, int]]:
+    """Merge rows into [start, stop) bands, widening the merge gap until at most max_bands remain"""
+    sorted_rows = sorted(rows)
+    while True:
+        bands: List[Tuple[int, int]] = []
+        for row in sorted_rows:
+            if bands and row - bands[-1][1] <= merge_gap:
+                bands[-1] = (bands[-1][0], row + 1)
+            else:
+                bands.append((row, row + 1))
+        if len(bands) <= max_bands:
+            return bands
+        merge_gap *= 2
+
 class ScreenshotManager:
+    # Seconds before retrying a device whose screenrecord stream is unavailable
+    STREAM_RETRY_INTERVAL = 60.0
+    # Partial capture limits: one dd per band on the device, and not worth it above this fraction
+    MAX_CAPTURE_BANDS = 24
+    MAX_PARTIAL_FRACTION = 0.6
+    # Consecutive bad raw captures (short read, unknown header) before a device switches to PNG
+    RAW_FALLBACK_AFTER = 3
+
     def __init__(self, cache_duration: float = 0.1):
         self.cache: Dict[str, ScreenshotCache] = {}
         self.cache_duration = cache_duration
         self.locks: Dict[str, asyncio.Lock] = {}
-        self.streaming_enabled = False
+        self.streaming_enabled = getattr(settings, 'USE_SCREENRECORD_STREAMING', False)
+        self.streaming_retry_after: Dict[str, float] = {}  # Devices whose stream failed -> retry time
+        self.capture_mode = getattr(settings, 'SCREENSHOT_CAPTURE_MODE', 'png')
+        self.png_fallback_devices: Set[str] = set()  # Devices whose raw format isn't supported
+        self.raw_failures: Dict[str, int] = defaultdict(int)  # Consecutive bad raw captures per device
+        self.partial_capture_enabled = getattr(settings, 'ROI_PARTIAL_CAPTURE', False)
+        self.raw_geometry: Dict[str, Tuple[int, int, int, int]] = {}  # width, height, format, header size
+        self.partial_unsupported_devices: Set[str] = set()  # Devices where the dd chain didn't work
+        self.row_plans: Dict[str, Tuple[tuple, Optional[List[Tuple[int, int]]]]] = {}
+        self.partial_capture_stats = defaultdict(int)
+        # Called with (device_id, frame) for every full frame captured (sharded runtime: shared memory)
+        self.frame_publisher = None
     
     async def get_screenshot(self, device_id: str) -> Optional[np.ndarray]:
         """Get screenshot using ADB screencap with caching"""
@@ -74,31 +253,186 @@ class ScreenshotManager:
                 if current_time - cached.timestamp < self.cache_duration:
                     return cached.image
             
-            img = await self._capture_screenshot_adb(device_id)
-            
+            img = None
+            if self.streaming_enabled:
+                img = await self._get_stream_frame(device_id)
+
+            if img is None:
+                if self.capture_mode == "raw" and device_id not in self.png_fallback_devices:
+                    img = await self._capture_screenshot_raw(device_id)
+                else:
+                    img = await self._capture_screenshot_adb(device_id)
+
             if img is not None:
                 self.cache[device_id] = ScreenshotCache(img, current_time)
+                if self.frame_publisher is not None:
+                    self.frame_publisher(device_id, img)
             return img
-    
+
+    async def get_screenshot_for_tasks(self, device_id: str, tasks: List[dict]):
+        """
+        Screenshot for a batch of tasks. With ROI_PARTIAL_CAPTURE only the framebuffer
+        rows those tasks read are pulled from the device and returned as a SparseFrame;
+        otherwise (or whenever a task needs the whole screen, or a healthy screenrecord
+        stream serves the device) this is get_screenshot().
+        """
+        geometry = self.raw_geometry.get(device_id)
+        if (not self.partial_capture_enabled or geometry is None
+                or self.capture_mode != "raw"
+                or device_id in self.png_fallback_devices
+                or device_id in self.partial_unsupported_devices
+                or (self.streaming_enabled and time.time() >= self.streaming_retry_after.get(device_id, 0))):
+            return await self.get_screenshot(device_id)
+
+        cached = self.cache.get(device_id)
+        if cached is not None and time.time() - cached.timestamp < self.cache_duration:
+            return cached.image
+
+        bands = self._plan_bands(device_id, tasks, geometry)
+        if bands is None:
+            return await self.get_screenshot(device_id)
+
+        if device_id not in self.locks:
+            self.locks[device_id] = asyncio.Lock()
+
+        async with self.locks[device_id]:
+            frame = await self._capture_raw_bands(device_id, geometry, bands)
+
+        if frame is None:
+            return await self.get_screenshot(device_id)
+        return frame
+
+    def _plan_bands(self, device_id: str, tasks: List[dict],
+                    geometry: Tuple[int, int, int, int]) -> Optional[List[Tuple[int, int]]]:
+        """Row bands to capture for these tasks, or None if a full frame is needed"""
+        plan_key = tuple(id(task) for task in tasks)
+        cached_plan = self.row_plans.get(device_id)
+        if cached_plan is not None and cached_plan[0] == plan_key:
+            return cached_plan[1]
+
+        width, height = geometry[0], geometry[1]
+        rows = required_frame_rows(tasks, height)
+        bands = None
+        if rows:
+            bands = merge_rows_into_bands(rows, self.MAX_CAPTURE_BANDS)
+            captured_rows = sum(stop - start for start, stop in bands)
+            if captured_rows > height * self.MAX_PARTIAL_FRACTION:
+                bands = None
+
+        self.row_plans[device_id] = (plan_key, bands)
+        return bands
+
+    async def _capture_raw_bands(self, device_id: str, geometry: Tuple[int, int, int, int],
+                                 bands: List[Tuple[int, int]]) -> Optional[SparseFrame]:
+        """Pull only the given row bands of the raw framebuffer with an on-device dd chain"""
+        width, height, pixel_format, header_size = geometry
+        row_bytes = width * 4
+
+        # Each dd continues reading the same screencap pipe, so skips are relative
+        # to where the previous band ended
+        commands = []
+        position = 0
+        expected_size = 0
+        for start, stop in bands:
+            offset = header_size + start * row_bytes
+            count = (stop - start) * row_bytes
+            commands.append(
+                f"dd bs=65536 skip={offset - position} count={count} "
+                f"iflag=skip_bytes,count_bytes,fullblock 2>/dev/null"
+            )
+            position = offset + count
+            expected_size += count
+        script = f"screencap | {{ {'; '.join(commands)}; }}"
+
+        try:
+            with metrics.timer("screencap", device_id):
+                stdout = await run_adb_command(f"exec-out {shlex.quote(script)}", device_id)
+        except Exception as e:
+            print(f"ADB partial screenshot failed for {device_id}: {e}")
+            return None
+
+        if len(stdout) != expected_size:
+            print(f"[{device_id}] Partial capture returned {len(stdout)} bytes (expected {expected_size}), "
+                  f"using full frames")
+            self.partial_unsupported_devices.add(device_id)
+            return None
+
+        data = np.frombuffer(stdout, dtype=np.uint8)
+        band_frames = []
+        offset = 0
+        for start, stop in bands:
+            count = (stop - start) * row_bytes
+            band = data[offset:offset + count].reshape((stop - start, width, 4))
+            band_frames.append((start, raw_pixels_to_rgb(band, pixel_format)))
+            offset += count
+
+        self.partial_capture_stats['captures'] += 1
+        self.partial_capture_stats['bytes'] += expected_size
+        self.partial_capture_stats['bytes_saved'] += width * height * 4 - expected_size
+        return SparseFrame(width, height, band_frames)
+
+    async def _get_stream_frame(self, device_id: str) -> Optional[np.ndarray]:
+        """Latest frame from the screenrecord stream, or None to use screencap"""
+        if time.time() < self.streaming_retry_after.get(device_id, 0):
+            return None
+
+        manager = await get_screenrecord_manager(device_id)
+        frame = None
+        if manager is not None:
+            with metrics.timer("screencap", device_id):
+                frame = manager.get_latest_frame()
+        if frame is None:
+            # Don't retry the (slow) stream start on every poll
+            self.streaming_retry_after[device_id] = time.time() + self.STREAM_RETRY_INTERVAL
+        return frame
+
+    async def _capture_screenshot_raw(self, device_id: str) -> Optional[np.ndarray]:
+        """Capture the raw framebuffer and convert it to RGB without a PNG encode/decode"""
+        try:
+            with metrics.timer("screencap", device_id):
+                stdout = await run_adb_command("exec-out screencap", device_id)
+
+            if not stdout:
+                return None
+
+            with metrics.timer("decode", device_id):
+                header = parse_raw_header(stdout)
+                img = parse_raw_screencap(stdout) if header is not None else None
+            if img is not None:
+                self.raw_geometry[device_id] = header
+                self.raw_failures[device_id] = 0
+                return img
+
+            if header is not None:
+                # Valid header with a pixel format we can't convert - that won't change
+                print(f"[{device_id}] Raw pixel format {header[2]} not supported, switching to PNG capture")
+                self.png_fallback_devices.add(device_id)
+            else:
+                # Truncated or short read - only give up on raw after it keeps happening
+                self.raw_failures[device_id] += 1
+                if self.raw_failures[device_id] >= self.RAW_FALLBACK_AFTER:
+                    print(f"[{device_id}] {self.raw_failures[device_id]} bad raw captures in a row "
+                          f"({len(stdout)} bytes), switching to PNG capture")
+                    self.png_fallback_devices.add(device_id)
+            return await self._capture_screenshot_adb(device_id)
+
+        except Exception as e:
+            print(f"ADB raw screenshot failed for {device_id}: {e}")
+            return None
+
     async def _capture_screenshot_adb(self, device_id: str) -> Optional[np.ndarray]:
         """Capture screenshot using ADB (fallback)"""
         try:
-            command = f"adb -s {device_id} exec-out screencap -p"
-            
-            process = await asyncio.create_subprocess_shell(
-                command,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await process.communicate()
-            
+            with metrics.timer("screencap", device_id):
+                stdout = await run_adb_command("exec-out screencap -p", device_id)
+
             if not stdout:
                 return None
-            
-            pil_image = Image.open(io.BytesIO(stdout)).convert('RGB')
-            return np.asarray(pil_image)
-            
+
+            with metrics.timer("decode", device_id):
+                pil_image = Image.open(io.BytesIO(stdout)).convert('RGB')
+                return np.asarray(pil_image)
+
         except Exception as e:
             print(f"ADB screenshot failed for {device_id}: {e}")
             return None
@@ -106,17 +440,150 @@ class ScreenshotManager:
 # Global screenshot manager
 screenshot_manager = ScreenshotManager()
 
+# --- Frame Change Detection ---
+class FrameChangeDetector:
+    """
+    Fingerprints each polled frame so template/pixel detection results can be reused
+    while the screen is static (loading screens, battle animations that don't touch
+    the watched pixels). Only detection is memoized - cooldowns and actions still run.
+    """
+    GRID_STEP = 4  # Sample every 4th row/column for the coarse part of the fingerprint
+
+    def __init__(self):
+        self.enabled = getattr(settings, 'FRAME_CHANGE_DETECTION', False)
+        self.last_fingerprint: Dict[str, bytes] = {}
+        self.memos: Dict[str, dict] = {}
+        self.coord_plans: Dict[str, Tuple[tuple, np.ndarray, np.ndarray]] = {}
+        self.stats = defaultdict(lambda: {
+            'frames': 0, 'static_frames': 0, 'static_streak': 0, 'longest_static_streak': 0
+        })
+
+    def _task_coordinates(self, device_id: str, tasks: List[dict], shape) -> Tuple[np.ndarray, np.ndarray]:
+        """Every pixel coordinate the pixel tasks read, cached per task list"""
+        plan_key = tuple(id(task) for task in tasks)
+        cached = self.coord_plans.get(device_id)
+        if cached is not None and cached[0] == plan_key:
+            return cached[1], cached[2]
+
+        ys, xs = [], []
+        for task in tasks:
+            task_type = task.get("type", "pixel")
+            if task_type == "pixel":
+                values = task.get("search_array", [])
+            elif task_type == "Pixel-OneOrMoreMatched":
+                values = task.get("pixel-values", [])
+            else:
+                continue
+            for coords_str in values[0::2]:
+                try:
+                    x, y = map(int, coords_str.split(','))
+                except (ValueError, AttributeError):
+                    continue
+                if 0 <= y < shape[0] and 0 <= x < shape[1]:
+                    ys.append(y)
+                    xs.append(x)
+
+        plan = (plan_key, np.array(ys, dtype=np.intp), np.array(xs, dtype=np.intp))
+        self.coord_plans[device_id] = plan
+        return plan[1], plan[2]
+
+    def fingerprint(self, device_id: str, frame, tasks: List[dict]) -> bytes:
+        """Coarse grid of the frame plus the exact pixels the pixel tasks compare"""
+        digest = hashlib.blake2b(digest_size=16)
+
+        if isinstance(frame, SparseFrame):
+            for first_row, band in frame.bands:
+                digest.update(first_row.to_bytes(4, 'little'))
+                digest.update(np.ascontiguousarray(band[::self.GRID_STEP, ::self.GRID_STEP]).data)
+        else:
+            digest.update(np.ascontiguousarray(frame[::self.GRID_STEP, ::self.GRID_STEP]).data)
+
+        ys, xs = self._task_coordinates(device_id, tasks, frame.shape)
+        if len(ys):
+            digest.update(np.ascontiguousarray(gather_pixels(frame, ys, xs)).data)
+
+        return digest.digest()
+
+    def begin_frame(self, device_id: str, frame, tasks: List[dict]) -> dict:
+        """Detection memo for this frame - the previous one if the frame is unchanged, else empty"""
+        if not self.enabled:
+            return {}
+
+        fingerprint = self.fingerprint(device_id, frame, tasks)
+        stats = self.stats[device_id]
+        stats['frames'] += 1
+
+        if fingerprint == self.last_fingerprint.get(device_id):
+            stats['static_frames'] += 1
+            stats['static_streak'] += 1
+            stats['longest_static_streak'] = max(stats['longest_static_streak'], stats['static_streak'])
+            return self.memos[device_id]
+
+        stats['static_streak'] = 0
+        self.last_fingerprint[device_id] = fingerprint
+        self.memos[device_id] = {}
+        return self.memos[device_id]
+
+    def format_stats(self, device_id: str) -> str:
+        """One-line static frame summary for a device"""
+        stats = self.stats[device_id]
+        ratio = stats['static_frames'] / stats['frames'] * 100 if stats['frames'] else 0.0
+        return (f"static frames {stats['static_frames']}/{stats['frames']} ({ratio:.0f}%), "
+                f"current streak {stats['static_streak']}, longest {stats['longest_static_streak']}")
+
+# Global frame change detector
+frame_change_detector = FrameChangeDetector()
+
 # --- Template Cache ---
 class TemplateCache:
-    """Cache for template images to avoid repeated loading"""
+    """
+    RGB templates for matching, served from the memory-mapped template atlas.
+    preload() resolves every template the task lists reference once (atlas views, or the
+    PNG for templates missing from / stale in the atlas); nothing is ever evicted, so the
+    matching path does no disk I/O.
+    """
     def __init__(self):
         self.templates: Dict[str, np.ndarray] = {}
-        self.cache_size_limit = 50
+        self.atlas = TemplateAtlas()
+        self.preloaded = False
+    
+    def preload(self):
+        """Map the atlas (rebuilding it first when stale and TEMPLATE_ATLAS_AUTO_BUILD is on)"""
+        if self.preloaded:
+            return
+        self.preloaded = True
+        
+        atlas_ok = self.atlas.load()
+        if (not atlas_ok or self.atlas.stale) and getattr(settings, 'TEMPLATE_ATLAS_AUTO_BUILD', True):
+            reason = f"{len(self.atlas.stale)} stale templates" if atlas_ok else "no atlas"
+            print(f"[ATLAS] Rebuilding template atlas ({reason})...")
+            try:
+                build_atlas()
+                self.atlas.load()
+            except Exception as e:
+                print(f"[ATLAS] Atlas build failed, using PNGs: {e}")
+        
+        self.templates.update(self.atlas.templates)
+        loaded_from_png = 0
+        for template_path in collect_template_paths():
+            if template_path not in self.templates:
+                template = load_template_png(template_path)
+                if template is not None:
+                    self.templates[template_path] = template
+                    loaded_from_png += 1
+        
+        print(f"[ATLAS] {len(self.atlas.templates)} templates mapped from atlas, "
+              f"{loaded_from_png} loaded from PNG")
     
     def get_template(self, template_path: str) -> Optional[np.ndarray]:
-        """Load and cache template image"""
-        if template_path in self.templates:
-            return self.templates[template_path]
+        """RGB template for a path (templates outside the task lists are loaded once and kept)"""
+        if not self.preloaded:
+            self.preload()
+        
+        key = os.path.normpath(template_path)
+        template = self.templates.get(key)
+        if template is not None:
+            return template
         
         if not os.path.exists(template_path):
             if settings.SPAM_LOGS:
@@ -124,16 +591,9 @@ class TemplateCache:
             return None
         
         try:
-            template = cv2.imread(template_path, cv2.IMREAD_COLOR)
-            if template is None:
-                return None
-            
-            template = cv2.cvtColor(template, cv2.COLOR_BGR2RGB)
-            
-            if len(self.templates) >= self.cache_size_limit:
-                self.templates.pop(next(iter(self.templates)))
-            
-            self.templates[template_path] = template
+            template = load_template_png(template_path)
+            if template is not None:
+                self.templates[key] = template
             return template
         except Exception as e:
             if settings.SPAM_LOGS:
@@ -143,75 +603,179 @@ class TemplateCache:
 template_cache = TemplateCache()
 
 # --- OCR Functions ---
+class OCRResultCache:
+    """
+    Content-addressed OCR results: (crop digest, strategy, backend) -> result, LRU-bounded.
+    Identical crops (static screens, repeated consensus attempts, preprocessing that maps
+    slightly different frames to the same binary image) return the earlier result instead
+    of running OCR again. Shared by the compute executor threads.
+    """
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[tuple, object]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(img: np.ndarray) -> bytes:
+        """Hash of a crop's pixels and shape"""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(str((img.shape, img.dtype.str)).encode())
+        digest.update(np.ascontiguousarray(img).data)
+        return digest.digest()
+
+    def key(self, img: np.ndarray, strategy: str, backend: str) -> tuple:
+        return (self.digest(img), strategy, backend)
+
+    def get(self, key: tuple):
+        """Cached result or None (counts a hit/miss)"""
+        if self.max_entries <= 0:
+            return None
+        with self.lock:
+            result = self.entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: tuple, result):
+        if self.max_entries <= 0 or result is None:
+            return
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def format_stats(self) -> str:
+        with self.lock:
+            lookups = self.hits + self.misses
+            ratio = self.hits / lookups * 100 if lookups else 0.0
+            return (f"OCR cache: {self.hits}/{lookups} hits ({ratio:.0f}%), "
+                    f"{len(self.entries)}/{self.max_entries} entries")
+
+
 class OCRManager:
     """Enhanced OCR Manager optimized for game UI number extraction"""
     
     def __init__(self):
-        self.ocr_cache: Dict[str, Dict] = {}
-        self.cache_duration = 0.5
-        
-        # Initialize multiple EasyOCR readers if available
-        if EASYOCR_AVAILABLE:
-            self.ocr_reader = easyocr.Reader(['en'], gpu=True)
-            # Additional reader for pure numbers
-            try:
-                self.ocr_reader_digits = easyocr.Reader(['en'], gpu=True, recog_network='digit')
-            except:
-                self.ocr_reader_digits = self.ocr_reader
+        self.ocr_cache = OCRResultCache(getattr(settings, 'OCR_CACHE_MAX_ENTRIES', 2048))
+    
+    @property
+    def ocr_reader(self):
+        """General EasyOCR reader (loaded on first use)"""
+        return ocr_engine.get_reader("general")
+    
+    @property
+    def ocr_reader_digits(self):
+        """Digit-network reader (the general one if the digit network isn't installed)"""
+        return ocr_engine.get_reader("digits")
     
     async def extract_numbers_enhanced(self, screenshot: np.ndarray, 
                                       roi: Tuple[int, int, int, int],
-                                      is_id: bool = False) -> str:
+                                      is_id: bool = False,
+                                      device_id: Optional[str] = None,
+                                      glyph_field: Optional[str] = None) -> str:
         """
         Enhanced number extraction with multiple preprocessing passes.
         is_id: True if extracting IDs (expects spaces), False for regular numbers (commas)
+        glyph_field: game-font field (glyph_ocr) to read first; the passes only run if it is unsure
+        Runs on the compute executor (device_id is the fairness key).
         """
         x, y, w, h = roi
+        cache_key = self.ocr_cache.key(screenshot[y:y+h, x:x+w], "account_id" if is_id else "numbers", "pipeline")
+        cached = self.ocr_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        text = ""
+        metrics.count("ocr_calls", device_id)
+        with metrics.timer("ocr", device_id):
+            if glyph_field:
+                reading = self._read_glyphs(screenshot, glyph_field, roi, device_id)
+                if reading is not None:
+                    text = self._post_process_numbers(reading.text, is_id)
+            if not text:
+                text = await compute_executor.run(device_id, self._extract_numbers_sync, screenshot, roi, is_id)
+        self.ocr_cache.put(cache_key, text)
+        return text
+    
+    def crop_digest(self, screenshot: np.ndarray, roi) -> str:
+        """Content hash of an OCR ROI - equal digests mean the same pixels were read again"""
+        x, y, w, h = roi
+        return self.ocr_cache.digest(screenshot[y:y+h, x:x+w]).hex()
+    
+    def _read_glyphs(self, screenshot: np.ndarray, field: str, roi: Optional[Tuple[int, int, int, int]],
+                     device_id: Optional[str]) -> Optional[GlyphReading]:
+        """Glyph OCR reading of a fixed game-font field, or None when unavailable or below GLYPH_OCR_MIN_CONFIDENCE"""
+        if not getattr(settings, 'GLYPH_OCR_ENABLED', True) or not glyph_ocr.available(field):
+            return None
+        reading = glyph_ocr.read(screenshot, field, roi)
+        if reading is None:
+            return None
+        if reading.confidence < getattr(settings, 'GLYPH_OCR_MIN_CONFIDENCE', 0.8):
+            print(f"[{device_id}] 🔡 Glyph OCR unsure of '{reading.text}' {reading.glyph_confidences} - using EasyOCR")
+            return None
+        return reading
+    
+    def _extract_numbers_sync(self, screenshot: np.ndarray, roi: Tuple[int, int, int, int],
+                              is_id: bool) -> str:
+        x, y, w, h = roi
         roi_img = screenshot[y:y+h, x:x+w]
         
         if roi_img.size == 0:
             return ""
         
-        # Try multiple preprocessing strategies
-        results = []
-        
-        # Strategy 1: Upscale + Sharp contrast
-        preprocessed_1 = self._preprocess_for_numbers(roi_img, scale=3, invert=False)
-        result_1 = await self._ocr_pass(preprocessed_1, digits_only=not is_id)
-        if result_1:
-            results.append((result_1, self._calculate_confidence(result_1, is_id)))
-        
-        # Strategy 2: Inverted colors
-        preprocessed_2 = self._preprocess_for_numbers(roi_img, scale=3, invert=True)
-        result_2 = await self._ocr_pass(preprocessed_2, digits_only=not is_id)
-        if result_2:
-            results.append((result_2, self._calculate_confidence(result_2, is_id)))
-        
-        # Strategy 3: Adaptive threshold
-        preprocessed_3 = self._preprocess_adaptive(roi_img)
-        result_3 = await self._ocr_pass(preprocessed_3, digits_only=not is_id)
-        if result_3:
-            results.append((result_3, self._calculate_confidence(result_3, is_id)))
-        
-        # Strategy 4: Color isolation (for colored text)
-        preprocessed_4 = self._preprocess_color_isolation(roi_img)
-        result_4 = await self._ocr_pass(preprocessed_4, digits_only=not is_id)
-        if result_4:
-            results.append((result_4, self._calculate_confidence(result_4, is_id)))
-        
+        # Preprocessing strategies: name -> (preprocess, digits_only)
+        strategies = {
+            # Strategy 1: Upscale + Sharp contrast
+            "upscale": (lambda: self._preprocess_for_numbers(roi_img, scale=3, invert=False), not is_id),
+            # Strategy 2: Inverted colors
+            "inverted": (lambda: self._preprocess_for_numbers(roi_img, scale=3, invert=True), not is_id),
+            # Strategy 3: Adaptive threshold
+            "adaptive": (lambda: self._preprocess_adaptive(roi_img), not is_id),
+            # Strategy 4: Color isolation (for colored text)
+            "color_isolation": (lambda: self._preprocess_color_isolation(roi_img), not is_id),
+        }
         # Strategy 5: Enhanced comma detection (for numbers only)
         if not is_id:
-            preprocessed_5 = self._preprocess_for_commas(roi_img)
-            result_5 = await self._ocr_pass(preprocessed_5, digits_only=True)
-            if result_5:
-                results.append((result_5, self._calculate_confidence(result_5, is_id)))
+            strategies["commas"] = (lambda: self._preprocess_for_commas(roi_img), True)
         
-        # Select best result based on confidence
-        if results:
-            best_result = max(results, key=lambda x: x[1])
-            return self._post_process_numbers(best_result[0], is_id)
+        # Historically best strategies first; stop once a quorum of passes agrees
+        backend = "easyocr" if ocr_engine.available else "tesseract"
+        combos = {f"{backend}_{name}": name for name in strategies}
+        session = ocr_strategy_scheduler.session("account_id" if is_id else "numbers", list(combos))
+        # The OCR pool takes a quorum's worth of passes per request, in-process OCR runs one at a time
+        round_size = max(1, session.quorum) if ocr_worker_pool.enabled and EASYOCR_INSTALLED else 1
         
-        return ""
+        results = []
+        while True:
+            batch = session.next_batch(round_size)
+            if not batch:
+                break
+            passes = []
+            for combo in batch:
+                preprocess, digits_only = strategies[combos[combo]]
+                passes.append((preprocess(), digits_only))
+            for combo, result in zip(batch, self._ocr_passes(passes)):
+                if result:
+                    results.append((result, self._calculate_confidence(result, is_id)))
+                session.observe(combo, self._post_process_numbers(result, is_id) if result else None)
+        
+        if session.winner:
+            value = session.winner
+        elif results:
+            # Select best result based on confidence
+            best_result = max(results, key=lambda x: x[1])
+            value = self._post_process_numbers(best_result[0], is_id)
+        else:
+            value = ""
+        session.finish(value or None)
+        return value
     
     def _preprocess_for_numbers(self, img: np.ndarray, scale: int = 2, invert: bool = False) -> np.ndarray:
         """Advanced preprocessing optimized for game UI numbers"""
@@ -312,38 +876,75 @@ class OCRManager:
         
         return mask
     
-    async def _ocr_pass(self, img: np.ndarray, digits_only: bool = False) -> str:
+    def _ocr_passes(self, passes: List[Tuple[np.ndarray, bool]]) -> List[str]:
+        """_ocr_pass for each (image, digits_only); one OCR pool request when the pool is enabled"""
+        if ocr_worker_pool.enabled and EASYOCR_INSTALLED:
+            items = [(img, "digits" if digits_only else "general", self._ocr_allowlist(digits_only))
+                     for img, digits_only in passes]
+            try:
+                return [self._join_candidates(candidates) for candidates in self._recognize_cached(items)]
+            except Exception as e:
+                print(f"[OCR POOL] ⚠️ Falling back to in-process OCR: {e}")
+        return [self._ocr_pass(img, digits_only) for img, digits_only in passes]
+    
+    def _recognize_cached(self, items: list) -> List[list]:
+        """ocr_worker_pool.recognize for the items the OCR cache doesn't already have"""
+        keys, results, missing = self._cached_candidates(items)
+        if missing:
+            self._store_candidates(keys, results, missing,
+                                   ocr_worker_pool.recognize([items[index] for index in missing]))
+        return results
+    
+    def _cached_candidates(self, items: list) -> Tuple[list, list, list]:
+        """Cache keys, cached candidates (None when missing) and missing indexes of (img, model, allowlist) items"""
+        keys = [self.ocr_cache.key(img, f"{model}:{allowlist}", "easyocr") for img, model, allowlist in items]
+        results = [self.ocr_cache.get(key) for key in keys]
+        return keys, results, [index for index, result in enumerate(results) if result is None]
+    
+    def _store_candidates(self, keys: list, results: list, missing: list, recognized: list):
+        for index, candidates in zip(missing, recognized):
+            results[index] = candidates
+            self.ocr_cache.put(keys[index], candidates)
+    
+    def _readtext_cached(self, img: np.ndarray, model: str, allowlist: str) -> list:
+        """ocr_engine.readtext (detail=1) through the OCR cache"""
+        key = self.ocr_cache.key(img, f"{model}:{allowlist}", "easyocr")
+        results = self.ocr_cache.get(key)
+        if results is None:
+            results = ocr_engine.readtext(img, model, allowlist=allowlist, detail=1)
+            self.ocr_cache.put(key, results)
+        return results
+    
+    def _ocr_allowlist(self, digits_only: bool) -> str:
+        return '0123456789,. ' if digits_only else '0123456789,. :ID'
+    
+    def _join_candidates(self, results: list) -> str:
+        """Combine EasyOCR results of one pass"""
+        texts = []
+        for (bbox, text, confidence) in results:
+            if confidence > 0.3:  # Lower threshold for multiple passes
+                texts.append(text)
+        return ' '.join(texts).strip()
+    
+    def _ocr_pass(self, img: np.ndarray, digits_only: bool = False) -> str:
         """Perform OCR with specified configuration"""
         detected_text = ""
         
         try:
-            if EASYOCR_AVAILABLE:
+            if ocr_engine.available:
                 # Use EasyOCR
-                if digits_only and hasattr(self, 'ocr_reader_digits'):
-                    results = self.ocr_reader_digits.readtext(img, 
-                                                             allowlist='0123456789,. ',
-                                                             detail=1)
-                else:
-                    allowlist = '0123456789,. :ID' if not digits_only else '0123456789,. '
-                    results = self.ocr_reader.readtext(img, 
-                                                      allowlist=allowlist,
-                                                      detail=1)
-                
-                # Combine results
-                texts = []
-                for (bbox, text, confidence) in results:
-                    if confidence > 0.3:  # Lower threshold for multiple passes
-                        texts.append(text)
-                detected_text = ' '.join(texts)
+                results = self._readtext_cached(img, "digits" if digits_only else "general",
+                                                self._ocr_allowlist(digits_only))
+                detected_text = self._join_candidates(results)
                 
             elif TESSERACT_AVAILABLE:
-                # Tesseract with digit-specific config
-                if digits_only:
-                    custom_config = r'--oem 3 --psm 7 -c tessedit_char_whitelist=0123456789, '
-                else:
-                    custom_config = r'--oem 3 --psm 7 -c tessedit_char_whitelist=0123456789,:ID '
-                
-                detected_text = pytesseract.image_to_string(img, config=custom_config)
+                # Tesseract with digit-specific whitelist, single line
+                whitelist = '0123456789,' if digits_only else '0123456789,:ID'
+                key = self.ocr_cache.key(img, f"psm7:{whitelist}", "tesseract")
+                detected_text = self.ocr_cache.get(key)
+                if detected_text is None:
+                    detected_text = tesseract_engine.image_to_string(img, psm=7, whitelist=whitelist)
+                    self.ocr_cache.put(key, detected_text)
                 
         except Exception as e:
             print(f"OCR pass error: {e}")
@@ -487,8 +1088,13 @@ class OCRManager:
     
     async def extract_text_from_region(self, screenshot: np.ndarray, 
                                       roi: Tuple[int, int, int, int],
-                                      use_easyocr: bool = True) -> List[Tuple[str, Tuple[int, int]]]:
-        """Enhanced version with number optimization"""
+                                      use_easyocr: bool = True,
+                                      device_id: Optional[str] = None) -> List[Tuple[str, Tuple[int, int]]]:
+        """Enhanced version with number optimization (runs on the compute executor)"""
+        return await compute_executor.run(device_id, self._extract_text_sync, screenshot, roi, use_easyocr)
+    
+    def _extract_text_sync(self, screenshot: np.ndarray, roi: Tuple[int, int, int, int],
+                           use_easyocr: bool) -> List[Tuple[str, Tuple[int, int]]]:
         x, y, w, h = roi
         roi_img = screenshot[y:y+h, x:x+w]
         
@@ -500,14 +1106,14 @@ class OCRManager:
         
         if is_number_region:
             # Use enhanced number extraction
-            extracted = await self.extract_numbers_enhanced(screenshot, roi, is_id=False)
+            extracted = self._extract_numbers_sync(screenshot, roi, is_id=False)
             if extracted:
                 center_x = x + w // 2
                 center_y = y + h // 2
                 return [(extracted, (center_x, center_y))]
         
         # Fall back to original implementation for text
-        return await self._original_extract_text(screenshot, roi, use_easyocr)
+        return self._original_extract_text(screenshot, roi, use_easyocr)
     
     def _is_likely_number_region(self, img: np.ndarray) -> bool:
         """Heuristic to detect if region likely contains numbers"""
@@ -526,9 +1132,9 @@ class OCRManager:
         ratio = white_pixels / total_pixels
         return 0.1 < ratio < 0.9
     
-    async def _original_extract_text(self, screenshot: np.ndarray, 
-                                    roi: Tuple[int, int, int, int],
-                                    use_easyocr: bool = True) -> List[Tuple[str, Tuple[int, int]]]:
+    def _original_extract_text(self, screenshot: np.ndarray, 
+                              roi: Tuple[int, int, int, int],
+                              use_easyocr: bool = True) -> List[Tuple[str, Tuple[int, int]]]:
         """Original extract_text_from_region implementation"""
         x, y, w, h = roi
         roi_img = screenshot[y:y+h, x:x+w]
@@ -539,9 +1145,9 @@ class OCRManager:
         detected_texts = []
         
         try:
-            if use_easyocr and EASYOCR_AVAILABLE:
+            if use_easyocr and ocr_engine.available:
                 # Use EasyOCR for better accuracy
-                results = ocr_reader.readtext(roi_img, detail=1)
+                results = ocr_engine.readtext(roi_img, "general", detail=1)
                 
                 for (bbox, text, confidence) in results:
                     if confidence > 0.5:  # Filter low confidence
@@ -564,18 +1170,16 @@ class OCRManager:
                 # Apply threshold to get black text on white background
                 _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
                 
-                # Get OCR data with positions
-                data = pytesseract.image_to_data(thresh, output_type=pytesseract.Output.DICT)
-                
-                for i in range(len(data['text'])):
-                    text = data['text'][i].strip().lower()
-                    conf = int(data['conf'][i])
+                # Get OCR words with positions
+                for word in tesseract_engine.words(thresh):
+                    text = word['text'].strip().lower()
+                    conf = word['conf']
                     
                     if text and conf > 50:  # Filter empty and low confidence
-                        box_x = data['left'][i]
-                        box_y = data['top'][i]
-                        box_w = data['width'][i]
-                        box_h = data['height'][i]
+                        box_x = word['left']
+                        box_y = word['top']
+                        box_w = word['width']
+                        box_h = word['height']
                         
                         center_x = x + box_x + box_w // 2
                         center_y = y + box_y + box_h // 2
@@ -589,12 +1193,13 @@ class OCRManager:
     
     async def find_text_in_region(self, screenshot: np.ndarray,
                                  search_texts: List[str],
-                                 roi: Tuple[int, int, int, int]) -> Optional[Tuple[str, Tuple[int, int]]]:
+                                 roi: Tuple[int, int, int, int],
+                                 device_id: Optional[str] = None) -> Optional[Tuple[str, Tuple[int, int]]]:
         """
         Find any of the search texts in the specified region.
         Returns (matched_text, position) or None.
         """
-        detected_texts = await self.extract_text_from_region(screenshot, roi)
+        detected_texts = await self.extract_text_from_region(screenshot, roi, device_id=device_id)
         
         for search_text in search_texts:
             search_lower = search_text.lower().strip()
@@ -619,89 +1224,218 @@ class OCRManager:
             [726, 10, 51, 16],
         ]
         
+        # Identical orb counter pixels -> the value extracted last time
+        x0, y0 = min(roi[0] for roi in roi_variations), min(roi[1] for roi in roi_variations)
+        x1 = max(roi[0] + roi[2] for roi in roi_variations)
+        y1 = max(roi[1] + roi[3] for roi in roi_variations)
+        cache_key = self.ocr_cache.key(screenshot[y0:y1, x0:x1], "orbs", "pipeline")
+        cached = self.ocr_cache.get(cache_key)
+        if cached is not None:
+            print(f"[{device_id}] ♻️ Orb counter unchanged - cached value {cached}")
+            return cached
+        
+        metrics.count("ocr_calls", device_id)
+        with metrics.timer("ocr_orbs", device_id):
+            value = await self._extract_orbs_uncached(screenshot, device_id, roi_variations)
+        self.ocr_cache.put(cache_key, value)
+        return value
+    
+    async def _extract_orbs_uncached(self, screenshot: np.ndarray, device_id: str, roi_variations: list) -> str:
+        # Deterministic game-font read first - no strategies or consensus when it is confident
+        reading = self._read_glyphs(screenshot, "orbs", None, device_id)
+        if reading is not None:
+            cleaned = self._validate_orb_format(reading.text, device_id)
+            if cleaned and self._is_reasonable_orb_value(cleaned):
+                print(f"[{device_id}] 🔡 Glyph OCR: {cleaned} (min glyph confidence {reading.confidence:.2f})")
+                return cleaned
+            print(f"[{device_id}] 🔡 Glyph OCR read '{reading.text}' - not a valid orb count, using EasyOCR")
+        
+        combos = self._orb_combos(len(roi_variations))
+        session = ocr_strategy_scheduler.session("orbs", list(combos), validate=self._orb_quorum_valid)
+        crops = {}  # (roi_idx, strat_idx) -> preprocessed crop, shared by the EasyOCR and Tesseract combos
         all_results = []
+        
+        if ocr_worker_pool.enabled and EASYOCR_INSTALLED:
+            await self._extract_orbs_batched(screenshot, device_id, roi_variations, combos, crops,
+                                             session, all_results)
+        
         start_time = time.time()
         max_extraction_time = 30.0  # 30 second timeout
         
-        for roi_idx, roi in enumerate(roi_variations):
+        while True:
             # Check timeout
             if time.time() - start_time > max_extraction_time:
                 print(f"[{device_id}] ⏰ Extraction timeout after {max_extraction_time}s, using current results")
                 break
-                
-            x, y, w, h = roi
+            
+            # Up to 8 attempts per compute job: the timeout is checked between jobs
+            batch = session.next_batch(8)
+            if not batch:
+                break
+            await compute_executor.run(device_id, self._orb_attempts, screenshot, roi_variations, combos,
+                                       batch, crops, session, all_results, device_id)
+        
+        if session.winner:
+            print(f"[{device_id}] 🎯 Orb quorum after {len(session.observed)}/{len(combos)} attempts: {session.winner}")
+            value = session.winner
+        else:
+            # Intelligent consensus with validation
+            value = self._get_orb_consensus_ultra(all_results, device_id)
+        session.finish(value if value != "0" else None)
+        return value
+    
+    def _orb_quorum_valid(self, value: str, confidence: float) -> bool:
+        """A quorum value must be a plausible orb count read confidently at least once"""
+        return (confidence >= getattr(settings, 'OCR_ORB_QUORUM_MIN_CONFIDENCE', 0.85)
+                and self._is_reasonable_orb_value(value))
+    
+    def _observe_orb_attempt(self, session, combo: str, crop: Optional[np.ndarray], candidates: list):
+        """Report an attempt's best candidate; all attempts on the same crop pixels share one vote"""
+        if not candidates:
+            session.observe(combo, None)
+            return
+        best = max(candidates, key=lambda c: c['confidence'])
+        session.observe(combo, best['value'], source=self.ocr_cache.digest(crop), confidence=best['confidence'])
+    
+    def _orb_combos(self, roi_count: int) -> Dict[str, tuple]:
+        """Every orb attempt: method name -> (backend, roi_idx, strat_idx, psm)"""
+        combos = {}
+        for roi_idx in range(roi_count):
+            for strat_idx in range(len(self._orb_strategies())):
+                if ocr_engine.available:
+                    combos[f'easyocr_roi{roi_idx}_strat{strat_idx}'] = ("easyocr", roi_idx, strat_idx, None)
+                if TESSERACT_AVAILABLE:
+                    for psm in [7, 8, 11, 13]:
+                        combos[f'tesseract_roi{roi_idx}_strat{strat_idx}_psm{psm}'] = \
+                            ("tesseract", roi_idx, strat_idx, psm)
+        return combos
+    
+    def _orb_crop(self, screenshot: np.ndarray, roi_variations: list, roi_idx: int, strat_idx: int,
+                  crops: dict) -> Optional[np.ndarray]:
+        """Preprocessed crop for one ROI variation and strategy (None if the ROI is empty)"""
+        key = (roi_idx, strat_idx)
+        if key not in crops:
+            x, y, w, h = roi_variations[roi_idx]
             roi_img = screenshot[y:y+h, x:x+w]
+            crops[key] = self._orb_strategies()[strat_idx](roi_img) if roi_img.size else None
+        return crops[key]
+    
+    def _orb_attempts(self, screenshot: np.ndarray, roi_variations: list, combos: Dict[str, tuple],
+                      batch: List[str], crops: dict, session, all_results: list, device_id: str):
+        """Run scheduled orb attempts in-process, reporting each attempt's best value to the session"""
+        for combo in batch:
+            backend, roi_idx, strat_idx, psm = combos[combo]
+            try:
+                crop = self._orb_crop(screenshot, roi_variations, roi_idx, strat_idx, crops)
+                if crop is None:
+                    candidates = []
+                elif backend == "easyocr":
+                    # EasyOCR with strict whitelist
+                    results = self._readtext_cached(crop, "general", '0123456789,')
+                    candidates = self._orb_easyocr_candidates(results, roi_idx, strat_idx, device_id)
+                else:
+                    candidates = self._orb_tesseract_candidates(crop, roi_idx, strat_idx, device_id, psms=(psm,))
+            except Exception:
+                crop, candidates = None, []
+            all_results.extend(candidates)
+            self._observe_orb_attempt(session, combo, crop, candidates)
+    
+    def _orb_easyocr_candidates(self, results: list, roi_idx: int, strat_idx: int, device_id: str) -> list:
+        """Valid orb values among one EasyOCR pass's results"""
+        candidates = []
+        for (bbox, text, confidence) in results:
+            if confidence > 0.3 and text:
+                cleaned = self._validate_orb_format(text, device_id)
+                if cleaned:
+                    candidates.append({
+                        'value': cleaned,
+                        'confidence': confidence,
+                        'method': f'easyocr_roi{roi_idx}_strat{strat_idx}'
+                    })
+        return candidates
+    
+    def _orb_strategies(self) -> list:
+        """The 8 orb preprocessing strategies tried on every ROI variation"""
+        return [
+            # Strategy 1: Standard with different scales
+            lambda img: self._preprocess_orb_v1(img, scale=2),
+            lambda img: self._preprocess_orb_v1(img, scale=3),
+            lambda img: self._preprocess_orb_v1(img, scale=4),
             
-            if roi_img.size == 0:
-                continue
+            # Strategy 2: Inverted
+            lambda img: self._preprocess_orb_v2(img, invert=True),
+            lambda img: self._preprocess_orb_v2(img, invert=False),
             
-            # Try 8 different preprocessing strategies per ROI
-            strategies = [
-                # Strategy 1: Standard with different scales
-                lambda img: self._preprocess_orb_v1(img, scale=2),
-                lambda img: self._preprocess_orb_v1(img, scale=3),
-                lambda img: self._preprocess_orb_v1(img, scale=4),
-                
-                # Strategy 2: Inverted
-                lambda img: self._preprocess_orb_v2(img, invert=True),
-                lambda img: self._preprocess_orb_v2(img, invert=False),
-                
-                # Strategy 3: Enhanced comma detection
-                lambda img: self._preprocess_orb_comma_enhanced(img),
-                
-                # Strategy 4: Morphological focus
-                lambda img: self._preprocess_orb_morphological(img),
-                
-                # Strategy 5: Edge detection based
-                lambda img: self._preprocess_orb_edge_based(img)
-            ]
+            # Strategy 3: Enhanced comma detection
+            lambda img: self._preprocess_orb_comma_enhanced(img),
             
-            for strat_idx, strategy in enumerate(strategies):
-                try:
-                    preprocessed = strategy(roi_img)
-                    
-                    # Try both EasyOCR and Tesseract
-                    if EASYOCR_AVAILABLE:
-                        # EasyOCR with strict whitelist
-                        results = self.ocr_reader.readtext(preprocessed, 
-                                                          allowlist='0123456789,',
-                                                          detail=1)
-                        for (bbox, text, confidence) in results:
-                            if confidence > 0.3 and text:
-                                cleaned = self._validate_orb_format(text, device_id)
-                                if cleaned:
-                                    all_results.append({
-                                        'value': cleaned,
-                                        'confidence': confidence,
-                                        'method': f'easyocr_roi{roi_idx}_strat{strat_idx}'
-                                    })
-                                    
-                                    # Early success detection - if we have a high-confidence reasonable result
-                                    if confidence > 0.85 and len(all_results) >= 8 and self._is_reasonable_orb_value(cleaned):
-                                        early_consensus = self._get_orb_consensus_ultra(all_results, device_id)
-                                        if early_consensus != "0" and self._is_reasonable_orb_value(early_consensus):
-                                            print(f"[{device_id}] 🎯 Early consensus found: {early_consensus}")
-                                            return early_consensus
-                    
-                    if TESSERACT_AVAILABLE:
-                        # Tesseract with multiple PSM modes
-                        for psm in [7, 8, 11, 13]:
-                            config = f'--oem 3 --psm {psm} -c tessedit_char_whitelist=0123456789,'
-                            text = pytesseract.image_to_string(preprocessed, config=config).strip()
-                            if text:
-                                cleaned = self._validate_orb_format(text, device_id)
-                                if cleaned:
-                                    all_results.append({
-                                        'value': cleaned,
-                                        'confidence': 0.5,  # Default confidence for Tesseract
-                                        'method': f'tesseract_roi{roi_idx}_strat{strat_idx}_psm{psm}'
-                                    })
-                    
-                except Exception:
-                    continue
-        
-        # Intelligent consensus with validation
-        return self._get_orb_consensus_ultra(all_results, device_id)
+            # Strategy 4: Morphological focus
+            lambda img: self._preprocess_orb_morphological(img),
+            
+            # Strategy 5: Edge detection based
+            lambda img: self._preprocess_orb_edge_based(img)
+        ]
+    
+    def _orb_tesseract_candidates(self, preprocessed: np.ndarray, roi_idx: int, strat_idx: int,
+                                  device_id: str, psms: tuple = (7, 8, 11, 13)) -> list:
+        """Tesseract with multiple PSM modes on one preprocessed orb crop"""
+        candidates = []
+        for psm in psms:
+            key = self.ocr_cache.key(preprocessed, f"psm{psm}:0123456789,", "tesseract")
+            text = self.ocr_cache.get(key)
+            if text is None:
+                text = tesseract_engine.image_to_string(preprocessed, psm=psm, whitelist='0123456789,').strip()
+                self.ocr_cache.put(key, text)
+            if text:
+                cleaned = self._validate_orb_format(text, device_id)
+                if cleaned:
+                    candidates.append({
+                        'value': cleaned,
+                        'confidence': 0.5,  # Default confidence for Tesseract
+                        'method': f'tesseract_roi{roi_idx}_strat{strat_idx}_psm{psm}'
+                    })
+        return candidates
+    
+    def _orb_crop_batch(self, screenshot: np.ndarray, roi_variations: list, combos: Dict[str, tuple],
+                        batch: List[str], crops: dict) -> list:
+        return [self._orb_crop(screenshot, roi_variations, combos[combo][1], combos[combo][2], crops)
+                for combo in batch]
+    
+    async def _extract_orbs_batched(self, screenshot: np.ndarray, device_id: str, roi_variations: list,
+                                    combos: Dict[str, tuple], crops: dict, session, all_results: list):
+        """
+        Scheduled EasyOCR attempts through the OCR pool, 8 per request (merged with other
+        devices' requests) until a quorum agrees. Tesseract attempts, and everything left if
+        the pool fails, are run in-process by the caller.
+        """
+        while True:
+            batch = session.next_batch(8, accept=lambda combo: combos[combo][0] == "easyocr")
+            if not batch:
+                return
+            batch_crops = await compute_executor.run(device_id, self._orb_crop_batch, screenshot,
+                                                     roi_variations, combos, batch, crops)
+            runnable = [(combo, crop) for combo, crop in zip(batch, batch_crops) if crop is not None]
+            items = [(crop, "general", '0123456789,') for _, crop in runnable]
+            keys, results, missing = self._cached_candidates(items)
+            try:
+                if missing:
+                    recognized = await asyncio.wait_for(
+                        asyncio.wrap_future(ocr_worker_pool.submit([items[index] for index in missing])),
+                        ocr_worker_pool.result_timeout)
+                    self._store_candidates(keys, results, missing, recognized)
+            except Exception as e:
+                print(f"[{device_id}] ⚠️ OCR pool failed ({e}) - extracting in-process")
+                session.requeue(batch)
+                return
+            
+            for combo in batch:
+                if all(combo != runnable_combo for runnable_combo, _ in runnable):
+                    session.observe(combo, None)
+            for (combo, crop), candidates in zip(runnable, results):
+                _, roi_idx, strat_idx, _ = combos[combo]
+                candidates = self._orb_easyocr_candidates(candidates, roi_idx, strat_idx, device_id)
+                all_results.extend(candidates)
+                self._observe_orb_attempt(session, combo, crop, candidates)
 
     def _preprocess_orb_v1(self, img: np.ndarray, scale: int = 3) -> np.ndarray:
         """Standard preprocessing with scaling"""
@@ -1071,234 +1805,248 @@ task_tracker = TaskExecutionTracker()
 # --- Smart Template Matching Functions ---
 async def find_all_templates_smart(screenshot: np.ndarray, 
                                   templates_to_check: List[Tuple[str, Tuple[int, int, int, int], float]],
-                                  min_distance: int = 30) -> Dict[str, List[Tuple[int, int]]]:
+                                  min_distance: int = 30,
+                                  device_id: Optional[str] = None) -> Dict[str, List[Tuple[int, int]]]:
     """
     Find all instances of multiple templates in a single screenshot.
     Returns dict of template_path -> list of (x, y) positions
     """
-    all_matches = {}
-    
-    for template_path, roi, confidence in templates_to_check:
-        try:
-            template = template_cache.get_template(template_path)
-            if template is None:
-                continue
-            
-            x, y, w, h = roi
-            roi_img = screenshot[y:y+h, x:x+w]
-            
-            if roi_img.size == 0:
-                continue
-            
-            result = cv2.matchTemplate(roi_img.astype(np.uint8), 
-                                     template.astype(np.uint8), 
-                                     cv2.TM_CCOEFF_NORMED)
-            
-            locations = np.where(result >= confidence)
-            
-            if len(locations[0]) == 0:
-                continue
-            
-            matches = []
-            template_h, template_w = template.shape[:2]
-            
-            for pt_y, pt_x in zip(locations[0], locations[1]):
-                center_x = x + pt_x + template_w // 2
-                center_y = y + pt_y + template_h // 2
-                
-                is_duplicate = False
-                for existing_x, existing_y in matches:
-                    dist_sq = (center_x - existing_x)**2 + (center_y - existing_y)**2
-                    if dist_sq < min_distance**2:
-                        is_duplicate = True
-                        break
-                
-                if not is_duplicate:
-                    matches.append((center_x, center_y))
-            
-            if matches:
-                all_matches[template_path] = matches
-                
-        except Exception as e:
-            if settings.SPAM_LOGS:
-                print(f"Error matching template {template_path}: {e}")
-            continue
-    
-    return all_matches
+    try:
+        template_frame = TemplateFrame(screenshot, template_cache.get_template)
+        return await compute_executor.run(device_id, template_frame.find_all, templates_to_check, min_distance)
+    except Exception as e:
+        if settings.SPAM_LOGS:
+            print(f"Error matching templates: {e}")
+        return {}
+
+async def find_template_instances(screenshot: np.ndarray, template_path: str,
+                                  roi: Tuple[int, int, int, int], confidence: float,
+                                  min_distance: int = 30,
+                                  max_instances: Optional[int] = None,
+                                  device_id: Optional[str] = None,
+                                  template_frame: Optional[TemplateFrame] = None) -> List[TemplateInstance]:
+    """
+    Every instance of one template in a region, ranked by score (best first).
+    Returns list of TemplateInstance(x, y, score); x, y are click centers.
+    Pass the frame's TemplateFrame to reuse its region crops.
+    """
+    try:
+        if template_frame is None:
+            template_frame = TemplateFrame(screenshot, template_cache.get_template)
+        return await compute_executor.run(device_id, template_frame.find_instances,
+                                          template_path, roi, confidence, min_distance, max_instances)
+    except Exception as e:
+        if settings.SPAM_LOGS:
+            print(f"Error matching template {template_path}: {e}")
+        return []
+
+def template_memo_key(template_path: str, roi, confidence: float, pyramid_scale: int) -> tuple:
+    return ("template", template_path, tuple(roi), confidence, pyramid_scale)
+
+def match_template_checks(template_frame: TemplateFrame, checks: List[tuple],
+                          known: Optional[dict] = None) -> Dict[tuple, Optional[Tuple[int, int]]]:
+    """
+    Run find_best for each (template_paths, roi, confidence, pyramid_scale) check, stopping
+    at its first matching path. Returns memo key -> match position (or None) for new results.
+    """
+    known = known or {}
+    results = {}
+    for template_paths, roi, confidence, pyramid_scale in checks:
+        for template_path in template_paths:
+            memo_key = template_memo_key(template_path, roi, confidence, pyramid_scale)
+            if memo_key in known:
+                match_pos = known[memo_key]
+            else:
+                try:
+                    match_pos = template_frame.find_best(template_path, roi, confidence, pyramid_scale)
+                except Exception as e:
+                    if settings.SPAM_LOGS:
+                        print(f"Template matching error: {e}")
+                    match_pos = None
+                results[memo_key] = match_pos
+            if match_pos:
+                break
+    return results
 
 async def batch_check_pixels_enhanced(device_id: str, tasks: List[dict], 
-                                     screenshot: Optional[np.ndarray] = None) -> List[dict]:
-    """Enhanced batch checking with proper task filtering"""
+                                     screenshot: Optional[np.ndarray] = None,
+                                     prefiltered: bool = False) -> List[dict]:
+    """
+    Enhanced batch checking with proper task filtering.
+    Pass prefiltered=True when `tasks` already went through should_skip_task
+    (ProcessMonitor.get_active_tasks) to avoid filtering twice.
+    """
+    if prefiltered:
+        filtered_tasks = tasks
+    else:
+        # Filter tasks BEFORE processing them
+        filtered_tasks = []
+        for task in tasks:
+            # Apply StopSupport and ConditionalRun filtering here too
+            from background_process import monitor
+            if not monitor.process_monitor.should_skip_task(device_id, task):
+                filtered_tasks.append(task)
+            else:
+                # Debug logging for skipped tasks
+                if "Yukio" in task.get("task_name", ""):
+                    print(f"[{device_id}] Pre-filtered out: {task.get('task_name')}")
+                elif "Character" in task.get("task_name", "") or "Purchase" in task.get("task_name", ""):
+                    print(f"[{device_id}] *** PRE-FILTERED CHARACTER SLOTS TASK: {task.get('task_name')} ***")
+    
+    # Now process only the filtered tasks (task_registry views come with their buckets precomputed)
+    buckets = getattr(filtered_tasks, 'buckets', None)
+    if buckets is None:
+        buckets = bucket_tasks(filtered_tasks)
+    
+    pixel_tasks = buckets["pixel"]
+    template_tasks = buckets["template"]
+    ocr_tasks = buckets["ocr"]
+    shared_detection_tasks = buckets["shared_detection"]
+    ultra_robust_orb_tasks = buckets["ultra_robust_orb"]
+    
+    if prefiltered:
+        pixel_one_or_more_tasks = buckets["pixel_one_or_more"]
+        frame_tasks = filtered_tasks
+    else:
+        pixel_one_or_more_tasks = [task for task in tasks if task.get("type") == "Pixel-OneOrMoreMatched"]
+        frame_tasks = filtered_tasks + pixel_one_or_more_tasks
+    
     if screenshot is not None:
         img_gpu = screenshot
     else:
-        img_gpu = await screenshot_manager.get_screenshot(device_id)
+        # Only the rows these tasks read are captured when ROI_PARTIAL_CAPTURE is on
+        img_gpu = await screenshot_manager.get_screenshot_for_tasks(device_id, frame_tasks)
     
     if img_gpu is None:
         return []
+    metrics.count("frames", device_id)
     
-    # Filter tasks BEFORE processing them
-    filtered_tasks = []
-    for task in tasks:
-        # Apply StopSupport and ConditionalRun filtering here too
-        from background_process import monitor
-        if not monitor.process_monitor.should_skip_task(device_id, task):
-            filtered_tasks.append(task)
-        else:
-            # Debug logging for skipped tasks
-            if "Yukio" in task.get("task_name", ""):
-                print(f"[{device_id}] Pre-filtered out: {task.get('task_name')}")
-            elif "Character" in task.get("task_name", "") or "Purchase" in task.get("task_name", ""):
-                print(f"[{device_id}] *** PRE-FILTERED CHARACTER SLOTS TASK: {task.get('task_name')} ***")
-    
-    # Now process only the filtered tasks
-    pixel_tasks = []
-    template_tasks = []
-    ocr_tasks = []
-    shared_detection_tasks = []
-    ultra_robust_orb_tasks = []
-    
-    for task in filtered_tasks:  # Use filtered_tasks instead of tasks
-        task_type = task.get("type", "pixel")
-        
-        if task_type == "pixel":
-            pixel_tasks.append(task)
-        elif task_type == "ocr":
-            ocr_tasks.append(task)
-        elif task_type == "ultra_robust_orb":
-            ultra_robust_orb_tasks.append(task)
-        elif task_type == "template":
-            if task.get("shared_detection", False):
-                shared_detection_tasks.append(task)
-            else:
-                template_tasks.append(task)
+    # Detection results are reused while the frame fingerprint is unchanged
+    detection_memo = frame_change_detector.begin_frame(device_id, img_gpu, frame_tasks)
+    
+    # Template ROIs of this task list share region crops (planned once per task list)
+    template_plan = template_plan_cache.get(template_tasks + shared_detection_tasks, img_gpu.shape)
+    template_frame = template_plan.frame(img_gpu, template_cache.get_template)
     
     matched_tasks = []
     
-    # Process pixel tasks
-    for task in pixel_tasks:
-        search_array = task["search_array"]
-        all_match = True
-        
-        for i in range(0, len(search_array), 2):
-            coords_str, hex_color = search_array[i], search_array[i+1]
-            x, y = map(int, coords_str.split(','))
-            
-            expected_rgb = hex_to_rgb(hex_color)
-            expected_rgb_gpu = np.array(expected_rgb)
+    # Process pixel tasks - every pixel of every task is checked in one vectorized pass
+    compiled_pixels = pixel_matcher_cache.get(pixel_tasks, img_gpu.shape)
+    memo_key = ("pixel", compiled_pixels.key)
+    pixel_matches = detection_memo.get(memo_key)
+    if pixel_matches is None:
+        with metrics.timer("pixel_match", device_id):
+            pixel_matches = compiled_pixels.match(img_gpu)
+        detection_memo[memo_key] = pixel_matches
+    
+    for task_index in np.flatnonzero(pixel_matches):
+        task = pixel_tasks[task_index]
+        task_cooldown = task.get("cooldown", 2.0)
+        if task_tracker.can_execute_task(device_id, task["task_name"], task_cooldown):
+            # Check for swipe functionality in pixel tasks
+            swipe_command = task.get("swipe_command")
+            min_matches_for_swipe = task.get("min_matches_for_swipe")
+            multi_click = task.get("multi_click")
             
-            if 0 <= y < img_gpu.shape[0] and 0 <= x < img_gpu.shape[1]:
-                pixel_color_gpu = img_gpu[y, x]
-                if not np.array_equal(pixel_color_gpu, expected_rgb_gpu):
-                    all_match = False
-                    break
-            else:
-                all_match = False
-                break
-        
-        if all_match:
-            task_cooldown = task.get("cooldown", 2.0)
-            if task_tracker.can_execute_task(device_id, task["task_name"], task_cooldown):
-                # Check for swipe functionality in pixel tasks
-                swipe_command = task.get("swipe_command")
-                min_matches_for_swipe = task.get("min_matches_for_swipe")
-                multi_click = task.get("multi_click")
-                
-                # Check for swipe_count functionality (new feature)
-                swipe_count = task.get("swipe_count")
-                if swipe_command and swipe_count:
-                    print(f"[SWIPE] {task['task_name']}: Executing swipe command {swipe_count} times")
+            # Check for swipe_count functionality (new feature)
+            swipe_count = task.get("swipe_count")
+            if swipe_command and swipe_count:
+                print(f"[SWIPE] {task['task_name']}: Executing swipe command {swipe_count} times")
+                print(f"[SWIPE] Command: {swipe_command}")
+                for i in range(swipe_count):
+                    await run_adb_command(swipe_command, device_id)
+                    if i < swipe_count - 1:  # Don't sleep after the last swipe
+                        await asyncio.sleep(2.0)  # 2 second delay between swipes
+                task_copy = task.copy()
+                task_copy["task_name"] = f"{task['task_name']} [Swipe {swipe_count}x executed]"
+                matched_tasks.append(task_copy)
+                task_tracker.record_execution(device_id, task["task_name"])
+            elif swipe_command and (multi_click or min_matches_for_swipe):
+                # For min_matches_for_swipe, we assume all pixels matched = 1 match
+                if min_matches_for_swipe and min_matches_for_swipe <= 1:
+                    print(f"[SWIPE] {task['task_name']}: Pixel match meets swipe threshold ({min_matches_for_swipe})")
                     print(f"[SWIPE] Command: {swipe_command}")
-                    for i in range(swipe_count):
-                        await run_adb_command(swipe_command, device_id)
-                        if i < swipe_count - 1:  # Don't sleep after the last swipe
-                            await asyncio.sleep(2.0)  # 2 second delay between swipes
+                    await run_adb_command(swipe_command, device_id)
                     task_copy = task.copy()
-                    task_copy["task_name"] = f"{task['task_name']} [Swipe {swipe_count}x executed]"
+                    task_copy["task_name"] = f"{task['task_name']} [Swipe executed]"
+                    matched_tasks.append(task_copy)
+                    task_tracker.record_execution(device_id, task["task_name"])
+                elif multi_click:
+                    print(f"[SWIPE] {task['task_name']}: Executing swipe command")
+                    print(f"[SWIPE] Command: {swipe_command}")
+                    await run_adb_command(swipe_command, device_id)
+                    task_copy = task.copy()
+                    task_copy["task_name"] = f"{task['task_name']} [Swipe executed]"
                     matched_tasks.append(task_copy)
                     task_tracker.record_execution(device_id, task["task_name"])
-                elif swipe_command and (multi_click or min_matches_for_swipe):
-                    # For min_matches_for_swipe, we assume all pixels matched = 1 match
-                    if min_matches_for_swipe and min_matches_for_swipe <= 1:
-                        print(f"[SWIPE] {task['task_name']}: Pixel match meets swipe threshold ({min_matches_for_swipe})")
-                        print(f"[SWIPE] Command: {swipe_command}")
-                        await run_adb_command(swipe_command, device_id)
-                        task_copy = task.copy()
-                        task_copy["task_name"] = f"{task['task_name']} [Swipe executed]"
-                        matched_tasks.append(task_copy)
-                        task_tracker.record_execution(device_id, task["task_name"])
-                    elif multi_click:
-                        print(f"[SWIPE] {task['task_name']}: Executing swipe command")
-                        print(f"[SWIPE] Command: {swipe_command}")
-                        await run_adb_command(swipe_command, device_id)
-                        task_copy = task.copy()
-                        task_copy["task_name"] = f"{task['task_name']} [Swipe executed]"
-                        matched_tasks.append(task_copy)
-                        task_tracker.record_execution(device_id, task["task_name"])
-                    else:
-                        # min_matches_for_swipe > 1, but we only have 1 pixel match
-                        matched_tasks.append(task)
-                        if task.get("click_location_str") == "0,0":
-                            task_tracker.record_execution(device_id, task["task_name"])
                 else:
-                    # Check for special screenshot saving functionality
-                    if task.get("save_screenshot_with_username", False):
-                        await save_screenshot_with_username(device_id, img_gpu)
-                        task_copy = task.copy()
-                        task_copy["task_name"] = f"{task['task_name']} [Screenshot saved with username]"
-                        matched_tasks.append(task_copy)
-                    else:
-                        matched_tasks.append(task)
-                    
-                    # IMPORTANT: Record execution immediately for detection-only tasks
+                    # min_matches_for_swipe > 1, but we only have 1 pixel match
+                    matched_tasks.append(task)
                     if task.get("click_location_str") == "0,0":
                         task_tracker.record_execution(device_id, task["task_name"])
-    
+            else:
+                # Check for special screenshot saving functionality
+                if task.get("save_screenshot_with_username", False):
+                    await save_screenshot_with_username(device_id, img_gpu)
+                    task_copy = task.copy()
+                    task_copy["task_name"] = f"{task['task_name']} [Screenshot saved with username]"
+                    matched_tasks.append(task_copy)
+                else:
+                    matched_tasks.append(task)
+                
+                # IMPORTANT: Record execution immediately for detection-only tasks
+                if task.get("click_location_str") == "0,0":
+                    task_tracker.record_execution(device_id, task["task_name"])
+
     # Process Pixel-OneOrMoreMatched tasks
-    pixel_one_or_more_tasks = [task for task in tasks if task.get("type") == "Pixel-OneOrMoreMatched"]
-    
     for task in pixel_one_or_more_tasks:
         pixel_values = task.get("pixel-values", [])
         if len(pixel_values) < 4:  # Need at least 2 pairs (coord, color, coord, color)
             continue
-            
-        match_found = False
         
-        # Check consecutive pairs: (coord1, color1, coord2, color2), (color1, coord2, color2, coord3), etc.
-        for i in range(0, len(pixel_values) - 3, 2):
-            try:
-                # Get first pair
-                coords1_str = pixel_values[i]
-                color1 = pixel_values[i + 1]
-                
-                # Get second pair  
-                coords2_str = pixel_values[i + 2]
-                color2 = pixel_values[i + 3]
-                
-                # Parse coordinates
-                x1, y1 = map(int, coords1_str.split(','))
-                x2, y2 = map(int, coords2_str.split(','))
-                
-                # Convert colors to RGB
-                expected_rgb1 = hex_to_rgb(color1)
-                expected_rgb2 = hex_to_rgb(color2)
-                expected_rgb1_gpu = np.array(expected_rgb1)
-                expected_rgb2_gpu = np.array(expected_rgb2)
-                
-                # Check if both pixels are within bounds and match
-                if (0 <= y1 < img_gpu.shape[0] and 0 <= x1 < img_gpu.shape[1] and
-                    0 <= y2 < img_gpu.shape[0] and 0 <= x2 < img_gpu.shape[1]):
+        memo_key = ("pixel_one_or_more", id(task))
+        match_found = detection_memo.get(memo_key)
+        
+        if match_found is None:
+            match_found = False
+            
+            # Check consecutive pairs: (coord1, color1, coord2, color2), (color1, coord2, color2, coord3), etc.
+            for i in range(0, len(pixel_values) - 3, 2):
+                try:
+                    # Get first pair
+                    coords1_str = pixel_values[i]
+                    color1 = pixel_values[i + 1]
+                    
+                    # Get second pair  
+                    coords2_str = pixel_values[i + 2]
+                    color2 = pixel_values[i + 3]
+                    
+                    # Parse coordinates
+                    x1, y1 = map(int, coords1_str.split(','))
+                    x2, y2 = map(int, coords2_str.split(','))
                     
-                    pixel_color1 = img_gpu[y1, x1]
-                    pixel_color2 = img_gpu[y2, x2]
+                    # Convert colors to RGB
+                    expected_rgb1 = hex_to_rgb(color1)
+                    expected_rgb2 = hex_to_rgb(color2)
+                    expected_rgb1_gpu = np.array(expected_rgb1)
+                    expected_rgb2_gpu = np.array(expected_rgb2)
                     
-                    if (np.array_equal(pixel_color1, expected_rgb1_gpu) and 
-                        np.array_equal(pixel_color2, expected_rgb2_gpu)):
-                        match_found = True
-                        break
+                    # Check if both pixels are within bounds and match
+                    if (0 <= y1 < img_gpu.shape[0] and 0 <= x1 < img_gpu.shape[1] and
+                        0 <= y2 < img_gpu.shape[0] and 0 <= x2 < img_gpu.shape[1]):
                         
-            except (ValueError, IndexError):
-                continue
+                        pixel_color1 = img_gpu[y1, x1]
+                        pixel_color2 = img_gpu[y2, x2]
+                        
+                        if (np.array_equal(pixel_color1, expected_rgb1_gpu) and 
+                            np.array_equal(pixel_color2, expected_rgb2_gpu)):
+                            match_found = True
+                            break
+                            
+                except (ValueError, IndexError):
+                    continue
+            
+            detection_memo[memo_key] = match_found
         
         if match_found:
             task_cooldown = task.get("cooldown", 2.0)
@@ -1371,10 +2119,14 @@ async def batch_check_pixels_enhanced(device_id: str, tasks: List[dict],
         
         if is_id is not None:  # Support both True and False when explicitly set
             # Use enhanced number extraction for number/ID detection
-            extracted_text = await ocr_manager.extract_numbers_enhanced(img_gpu, roi, is_id=is_id)
+            extracted_text = await ocr_manager.extract_numbers_enhanced(img_gpu, roi, is_id=is_id,
+                                                                         device_id=device_id,
+                                                                         glyph_field=task.get("glyph_field"))
             
             # Always create task_copy for potential processing
             task_copy = task.copy()
+            # Lets consensus checks tell a re-read of the same pixels from a new observation
+            task_copy["ocr_digest"] = ocr_manager.crop_digest(img_gpu, roi)
             center_x = roi[0] + roi[2] // 2
             center_y = roi[1] + roi[3] // 2
             
@@ -1500,7 +2252,7 @@ async def batch_check_pixels_enhanced(device_id: str, tasks: List[dict],
             search_texts = [text.strip().lower() for text in ocr_text.split(",")]
             
             # Find text in region
-            result = await ocr_manager.find_text_in_region(img_gpu, search_texts, roi)
+            result = await ocr_manager.find_text_in_region(img_gpu, search_texts, roi, device_id=device_id)
             
             if result:
                 matched_text, position = result
@@ -1537,9 +2289,19 @@ async def batch_check_pixels_enhanced(device_id: str, tasks: List[dict],
                 templates_to_check.append((template_path, roi, confidence))
                 task_map[template_path] = task
         
-        all_matches = await find_all_templates_smart(img_gpu, templates_to_check)
-        
-        for template_path, positions in all_matches.items():
+        # Ranked instances (best score first) per template, shared across task sets via the memo
+        all_matches: Dict[str, List[TemplateInstance]] = {}
+        for template_path, roi, confidence in templates_to_check:
+            memo_key = ("instances", template_path, tuple(roi), confidence)
+            instances = detection_memo.get(memo_key)
+            if instances is None:
+                instances = await find_template_instances(img_gpu, template_path, roi, confidence,
+                                                          device_id=device_id, template_frame=template_frame)
+                detection_memo[memo_key] = instances
+            if instances:
+                all_matches[template_path] = instances
+        
+        for template_path, instances in all_matches.items():
             task = task_map[template_path]
             task_name = task["task_name"]
             
@@ -1551,7 +2313,8 @@ async def batch_check_pixels_enhanced(device_id: str, tasks: List[dict],
             
             if task.get("multi_click", False) or "UnClear" in task_name:
                 if settings.SPAM_LOGS:
-                    print(f"[MULTI-DETECT] {task_name}: Found {len(positions)} matches")
+                    print(f"[MULTI-DETECT] {task_name}: Found {len(instances)} matches "
+                          f"(best {instances[0].score:.2f})")
                 
                 # Check for swipe condition
                 min_matches_for_swipe = task.get("min_matches_for_swipe")
@@ -1569,21 +2332,21 @@ async def batch_check_pixels_enhanced(device_id: str, tasks: List[dict],
                     task_copy = task.copy()
                     task_copy["task_name"] = f"{task_name} [Swipe {swipe_count}x executed]"
                     matched_tasks.append(task_copy)
-                elif min_matches_for_swipe and swipe_command and len(positions) >= min_matches_for_swipe:
-                    print(f"[SWIPE] {task_name}: {len(positions)} matches >= {min_matches_for_swipe}, executing swipe")
+                elif min_matches_for_swipe and swipe_command and len(instances) >= min_matches_for_swipe:
+                    print(f"[SWIPE] {task_name}: {len(instances)} matches >= {min_matches_for_swipe}, executing swipe")
                     print(f"[SWIPE] Command: {swipe_command}")
                     await run_adb_command(swipe_command, device_id)
                     task_copy = task.copy()
-                    task_copy["task_name"] = f"{task_name} [Swipe: {len(positions)} matches]"
+                    task_copy["task_name"] = f"{task_name} [Swipe: {len(instances)} matches]"
                     matched_tasks.append(task_copy)
                 else:
-                    # Regular multi-click behavior
-                    for i, (x, y) in enumerate(positions):
-                        await execute_tap(device_id, f"{x},{y}")
+                    # Regular multi-click behavior, most confident match first
+                    for instance in instances:
+                        await execute_tap(device_id, f"{instance.x},{instance.y}")
                         await asyncio.sleep(0.05)
                     
                     task_copy = task.copy()
-                    task_copy["task_name"] = f"{task_name} [Multi: {len(positions)} clicks]"
+                    task_copy["task_name"] = f"{task_name} [Multi: {len(instances)} clicks]"
                     matched_tasks.append(task_copy)
                 
                 task_tracker.record_execution(device_id, task_name)
@@ -1607,42 +2370,67 @@ async def batch_check_pixels_enhanced(device_id: str, tasks: List[dict],
                     task_tracker.record_execution(device_id, task_name)
                 elif min_matches_for_swipe and swipe_command:
                     # Detection-only mode - check if swipe threshold is met
-                    if len(positions) >= min_matches_for_swipe:
-                        print(f"[SWIPE] {task_name}: {len(positions)} matches >= {min_matches_for_swipe}, executing swipe")
+                    if len(instances) >= min_matches_for_swipe:
+                        print(f"[SWIPE] {task_name}: {len(instances)} matches >= {min_matches_for_swipe}, executing swipe")
                         print(f"[SWIPE] Command: {swipe_command}")
                         await run_adb_command(swipe_command, device_id)
                         task_copy = task.copy()
-                        task_copy["task_name"] = f"{task_name} [Swipe: {len(positions)} matches]"
+                        task_copy["task_name"] = f"{task_name} [Swipe: {len(instances)} matches]"
                         matched_tasks.append(task_copy)
                     # If threshold not met, do nothing (detection-only)
                     task_tracker.record_execution(device_id, task_name)
-                elif positions:
-                    # Regular template matching behavior
-                    x, y = positions[0]
+                else:
+                    # Regular template matching behavior: click the best-scoring match
+                    best = instances[0]
                     task_copy = task.copy()
-                    task_copy["click_location_str"] = f"{x},{y}"
+                    task_copy["click_location_str"] = f"{best.x},{best.y}"
                     task_copy["use_match_position"] = True
                     matched_tasks.append(task_copy)
                     task_tracker.record_execution(device_id, task_name)
     
     # Process regular template tasks
+    pyramid_enabled = getattr(settings, 'TEMPLATE_PYRAMID_MATCHING', False)
+    pyramid_default_scale = getattr(settings, 'TEMPLATE_PYRAMID_SCALE', 2)
+    template_checks = []
     for task in template_tasks:
-        task_name = task["task_name"]
-        
-        task_cooldown = task.get("cooldown", 2.0)
-        if not task_tracker.can_execute_task(device_id, task_name, task_cooldown):
+        if not task_tracker.can_execute_task(device_id, task["task_name"], task.get("cooldown", 2.0)):
             continue
-        
         template_paths = task.get("template_paths", [])
         if task.get("template_path"):
             template_paths = [task["template_path"]]
-        
         roi = task.get("roi", [0, 0, img_gpu.shape[1], img_gpu.shape[0]])
         confidence = task.get("confidence", 0.9)
+        pyramid_scale = pyramid_scale_for(task, pyramid_enabled, pyramid_default_scale)
+        template_checks.append((task, (template_paths, roi, confidence, pyramid_scale)))
+    
+    # Everything the memo can't answer is matched in one compute job, off the event loop
+    pending_checks = [check for _, check in template_checks
+                      if any(template_memo_key(path, *check[1:]) not in detection_memo for path in check[0])]
+    if pending_checks:
+        with metrics.timer("template_match", device_id):
+            detection_memo.update(await compute_executor.run(
+                device_id, match_template_checks, template_frame, pending_checks, detection_memo))
+    
+    for task, (template_paths, roi, confidence, pyramid_scale) in template_checks:
+        task_name = task["task_name"]
+        
+        task_cooldown = task.get("cooldown", 2.0)
+        if not task_tracker.can_execute_task(device_id, task_name, task_cooldown):
+            continue
         
         match_found = False
         for template_path in template_paths:
-            match_pos = await find_template_in_region(img_gpu, template_path, roi, confidence)
+            memo_key = template_memo_key(template_path, roi, confidence, pyramid_scale)
+            if memo_key in detection_memo:
+                match_pos = detection_memo[memo_key]
+            else:
+                try:
+                    match_pos = template_frame.find_best(template_path, roi, confidence, pyramid_scale)
+                except Exception as e:
+                    if settings.SPAM_LOGS:
+                        print(f"Template matching error: {e}")
+                    match_pos = None
+                detection_memo[memo_key] = match_pos
             if match_pos:
                 task_copy = task.copy()
                 if task.get("use_match_position", False):
@@ -1677,6 +2465,8 @@ async def batch_check_pixels_enhanced(device_id: str, tasks: List[dict],
         if match_found:
             break
     
+    template_match_stats.record(device_id, template_frame)
+    metrics.count("matches", device_id, len(matched_tasks))
     return matched_tasks
 
 # Helper functions
@@ -1687,6 +2477,23 @@ def hex_to_rgb(hex_color: str) -> Tuple[int, int, int]:
 
 async def run_adb_command(command: str, device_id: Optional[str] = None) -> bytes:
     """Optimized ADB command execution"""
+    metrics.count("adb_calls", device_id)
+    with metrics.timer("adb", device_id):
+        return await _run_adb_command(command, device_id)
+
+async def _run_adb_command(command: str, device_id: Optional[str] = None) -> bytes:
+    if device_id and getattr(settings, 'USE_PERSISTENT_ADB', False):
+        try:
+            # Same word splitting the host shell would do, then adb joins the args with spaces
+            args = shlex.split(command)
+            if len(args) > 1 and args[0] == "shell":
+                return await adb_session_manager.shell(device_id, " ".join(args[1:]))
+            if len(args) > 1 and args[0] == "exec-out":
+                return await adb_session_manager.exec_out(device_id, " ".join(args[1:]))
+        except Exception as e:
+            # Persistent session unavailable - fall back to a one-off adb process
+            print(f"[ADB] {device_id} persistent session failed for '{command}': {e}")
+
     full_command = f"adb -s {device_id} {command}" if device_id else f"adb {command}"
     
     process = await asyncio.create_subprocess_shell(
@@ -1701,7 +2508,8 @@ async def run_adb_command(command: str, device_id: Optional[str] = None) -> byte
 async def execute_tap(device_id: str, location_str: str):
     """Execute tap command asynchronously"""
     coords = location_str.replace(',', ' ')
-    await run_adb_command(f"shell input tap {coords}", device_id)
+    with metrics.timer("tap", device_id):
+        await run_adb_command(f"shell input tap {coords}", device_id)
 
 async def execute_text_input(device_id: str, text: str):
     """Execute text input command with proper special character handling"""
@@ -1762,33 +2570,12 @@ async def execute_swipe(device_id: str, x1: int, y1: int, x2: int, y2: int, dura
 
 async def find_template_in_region(screenshot: np.ndarray, template_path: str, 
                                  roi: Tuple[int, int, int, int], 
-                                 confidence: float = 0.9) -> Optional[Tuple[int, int]]:
-    """Find template in a specific region of the screenshot."""
+                                 confidence: float = 0.9,
+                                 device_id: Optional[str] = None) -> Optional[Tuple[int, int]]:
+    """Find template in a specific region of the screenshot (on the compute executor)."""
     try:
-        template = template_cache.get_template(template_path)
-        if template is None:
-            return None
-        
-        x, y, w, h = roi
-        roi_img = screenshot[y:y+h, x:x+w]
-        
-        if roi_img.size == 0:
-            return None
-        
-        result = cv2.matchTemplate(roi_img.astype(np.uint8), 
-                                  template.astype(np.uint8), 
-                                  cv2.TM_CCOEFF_NORMED)
-        
-        min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
-        
-        if max_val >= confidence:
-            template_h, template_w = template.shape[:2]
-            center_x = x + max_loc[0] + template_w // 2
-            center_y = y + max_loc[1] + template_h // 2
-            return (center_x, center_y)
-        
-        return None
-        
+        template_frame = TemplateFrame(screenshot, template_cache.get_template)
+        return await compute_executor.run(device_id, template_frame.find_best, template_path, roi, confidence)
     except Exception as e:
         if settings.SPAM_LOGS:
             print(f"Template matching error: {e}")
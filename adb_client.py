@@ -0,0 +1,188 @@
+"""
+Direct adb-server client with persistent per-device shell sessions.
+Talks the adb smart-socket protocol (host:transport:<serial>, shell:, exec:) on
+127.0.0.1:5037 instead of spawning `adb` + `/bin/sh` for every tap, pidof and screencap.
+"""
+import asyncio
+import itertools
+from typing import Dict, List, Optional
+
+import settings
+
+ADB_SERVER_HOST = "127.0.0.1"
+ADB_SERVER_PORT = 5037
+
+# Large enough for any shell output we read line-framed (pm list, dumpsys, ...)
+STREAM_LIMIT = 16 * 1024 * 1024
+
+
+class AdbProtocolError(Exception):
+    """Raised when the adb server rejects a request or returns a malformed reply"""
+
+
+async def _send_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, payload: str):
+    """Send one length-prefixed smart-socket request and wait for OKAY/FAIL"""
+    data = payload.encode('utf-8')
+    writer.write(b"%04x" % len(data) + data)
+    await writer.drain()
+
+    status = await reader.readexactly(4)
+    if status == b"OKAY":
+        return
+    if status == b"FAIL":
+        length = int(await reader.readexactly(4), 16)
+        message = (await reader.readexactly(length)).decode('utf-8', errors='replace')
+        raise AdbProtocolError(message)
+    raise AdbProtocolError(f"Unexpected adb server reply: {status!r}")
+
+
+async def open_device_service(device_id: str, service: str):
+    """Open a stream to `service` on the given device through the adb server"""
+    reader, writer = await asyncio.open_connection(ADB_SERVER_HOST, ADB_SERVER_PORT, limit=STREAM_LIMIT)
+    try:
+        await _send_request(reader, writer, f"host:transport:{device_id}")
+        await _send_request(reader, writer, service)
+    except Exception:
+        writer.close()
+        raise
+    return reader, writer
+
+
+class AdbShellSession:
+    """
+    One long-lived non-interactive `sh` on the device.
+    Each command is framed with a unique end marker so many commands can share
+    the same connection without re-spawning anything on the host.
+    """
+
+    _marker_ids = itertools.count()
+
+    def __init__(self, device_id: str):
+        self.device_id = device_id
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    @property
+    def connected(self) -> bool:
+        return self.writer is not None and not self.writer.is_closing()
+
+    async def connect(self):
+        # A non-empty command makes adbd use a raw (non-pty) subprocess, so nothing is echoed back
+        self.reader, self.writer = await open_device_service(self.device_id, "shell:sh")
+
+    async def run(self, command: str) -> bytes:
+        """Run one command and return its stdout (stderr is discarded, like run_adb_command's subprocess path)"""
+        if not self.connected:
+            await self.connect()
+
+        marker = f"__ADB_END_{next(self._marker_ids)}__".encode()
+        # Braces group the whole command so stdin/stderr redirection covers pipelines too.
+        # stderr goes to /dev/null: `adb shell` keeps it off stdout, and callers parse stdout
+        # (pidof, dumpsys, screencap bytes).
+        script = b"{ " + command.encode('utf-8') + b"\n} </dev/null 2>/dev/null\necho " + marker + b"\n"
+        self.writer.write(script)
+        await self.writer.drain()
+
+        data = await self.reader.readuntil(marker + b"\n")
+        return data[:-len(marker) - 1]
+
+    def close(self):
+        if self.writer is not None:
+            try:
+                self.writer.close()
+            except Exception:
+                pass
+        self.reader = None
+        self.writer = None
+
+
+class AdbDeviceSessions:
+    """Pool of shell sessions for one device (bounded by settings.MAX_ADB_CONNECTIONS)"""
+
+    def __init__(self, device_id: str, pool_size: int):
+        self.device_id = device_id
+        self.sessions: List[AdbShellSession] = [AdbShellSession(device_id) for _ in range(pool_size)]
+        self.idle: asyncio.Queue = asyncio.Queue()
+        for session in self.sessions:
+            self.idle.put_nowait(session)
+
+    async def shell(self, command: str, timeout: float) -> bytes:
+        session = await self.idle.get()
+        try:
+            for attempt in range(2):
+                try:
+                    return await asyncio.wait_for(session.run(command), timeout)
+                except asyncio.TimeoutError:
+                    # Output framing is unknown after a timeout - drop the connection
+                    session.close()
+                    raise
+                except (ConnectionError, OSError, asyncio.IncompleteReadError,
+                        asyncio.LimitOverrunError, AdbProtocolError) as e:
+                    session.close()
+                    if attempt == 1:
+                        raise
+                    print(f"[ADB] {self.device_id} shell session lost ({e}), reconnecting...")
+                    await AdbSessionManager.ensure_server_running()
+        finally:
+            self.idle.put_nowait(session)
+
+    def close(self):
+        for session in self.sessions:
+            session.close()
+
+
+class AdbSessionManager:
+    """Routes shell and exec-out commands to per-device persistent sessions"""
+
+    def __init__(self):
+        self.devices: Dict[str, AdbDeviceSessions] = {}
+        self.pool_size = max(1, getattr(settings, 'MAX_ADB_CONNECTIONS', 2))
+        self.command_timeout = 30.0
+
+    def _get_device(self, device_id: str) -> AdbDeviceSessions:
+        if device_id not in self.devices:
+            self.devices[device_id] = AdbDeviceSessions(device_id, self.pool_size)
+        return self.devices[device_id]
+
+    @classmethod
+    async def ensure_server_running(cls):
+        """Start the adb server if nothing is listening on its port"""
+        try:
+            _, writer = await asyncio.open_connection(ADB_SERVER_HOST, ADB_SERVER_PORT)
+            writer.close()
+        except OSError:
+            print("[ADB] adb server not reachable, starting it...")
+            process = await asyncio.create_subprocess_exec(
+                "adb", "start-server",
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL
+            )
+            await process.wait()
+
+    async def shell(self, device_id: str, command: str) -> bytes:
+        """Equivalent of `adb -s <device> shell <command>`"""
+        return await self._get_device(device_id).shell(command, self.command_timeout)
+
+    async def exec_out(self, device_id: str, command: str) -> bytes:
+        """Equivalent of `adb -s <device> exec-out <command>` (binary-safe, own stream)"""
+        for attempt in range(2):
+            try:
+                reader, writer = await open_device_service(device_id, f"exec:{command}")
+                try:
+                    return await asyncio.wait_for(reader.read(), self.command_timeout)
+                finally:
+                    writer.close()
+            except (ConnectionError, OSError, asyncio.IncompleteReadError, AdbProtocolError) as e:
+                if attempt == 1:
+                    raise
+                print(f"[ADB] {device_id} exec-out failed ({e}), retrying...")
+                await self.ensure_server_running()
+
+    def close_all(self):
+        for device in self.devices.values():
+            device.close()
+        self.devices.clear()
+
+
+# Global session manager
+adb_session_manager = AdbSessionManager()
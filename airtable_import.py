@@ -17,15 +17,8 @@ AIRTABLE_TABLE_ID = os.getenv('AIRTABLE_TABLE_ID')
 AIRTABLE_BASE_URL = f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{AIRTABLE_TABLE_ID}"
 
 def get_current_stock_number():
-    """Get current stock number from currentlyStock.json (same as airtable_stock_fetcher.py)"""
-    stock_file_path = os.path.join(device_state_manager.state_dir, "currentlyStock.json")
-    if os.path.exists(stock_file_path):
-        with open(stock_file_path, 'r') as f:
-            stock_data = json.load(f)
-            return stock_data.get('STOCK', 999)
-    else:
-        print("[System] ⚠️ currentlyStock.json not found, using default stock 999")
-        return 999
+    """Get current stock number (same as airtable_stock_fetcher.py)"""
+    return device_state_manager.get_current_stock()
 
 def get_stock_account_details(device_id: str, order_number: int, stock_number: int):
     """Fetch account details from Airtable by Order and STOCK (same as airtable_stock_fetcher.py)"""
@@ -83,33 +83,18 @@ async def check_and_fetch_all_accounts():
     """
     try:
         # Check if all 10 devices have isLinked = 1
-        all_linked = True
-        device_states = {}
+        unlinked_devices = device_state_manager.get_unlinked_devices()
+        for device_id in unlinked_devices:
+            print(f"[{device_id}] Not linked yet")
         
-        for i in range(1, 11):
-            device_id = f"DEVICE{i}"
-            state = device_state_manager.get_state(device_id)
-            device_states[device_id] = state
-            
-            if not state.get("isLinked", False):
-                all_linked = False
-                print(f"[{device_id}] Not linked yet (isLinked={state.get('isLinked', False)})")
-        
-        if not all_linked:
+        if unlinked_devices:
             print("[System] Not all devices are linked yet. Skipping account fetch.")
             return False
         
         print("[System] ✅ All devices are linked! Starting account fetch process...")
         
         # Get current stock number
-        stock_file_path = os.path.join(device_state_manager.state_dir, "currentlyStock.json")
-        if os.path.exists(stock_file_path):
-            with open(stock_file_path, 'r') as f:
-                stock_data = json.load(f)
-                stock_number = stock_data.get('STOCK', 999)
-        else:
-            print("[System] ⚠️ currentlyStock.json not found, using default stock 999")
-            stock_number = 999
+        stock_number = device_state_manager.get_current_stock()
         
         print(f"[System] Current STOCK number: {stock_number}")
         
@@ -194,14 +179,8 @@ async def check_and_fetch_all_accounts():
                     device_state_manager.states[device_id] = minimal_state
                     device_state_manager._save_state(device_id)
         
-        # Increment stock number for next batch
-        stock_number += 1
-        stock_data = {
-            "STOCK": stock_number,
-            "LastUpdated": datetime.now().isoformat()
-        }
-        with open(stock_file_path, 'w') as f:
-            json.dump(stock_data, f, indent=2)
+        # Increment stock number for next batch (atomic - never overwrite a concurrent increment)
+        stock_number = device_state_manager.increment_stock()
         print(f"[System] ✅ Incremented STOCK to {stock_number} for next batch")
         
         return True
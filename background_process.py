@@ -13,6 +13,9 @@ import settings
 from actions import (
     batch_check_pixels_enhanced, 
     ScreenshotManager,
+    screenshot_manager,
+    frame_change_detector,
+    ocr_manager,
     execute_tap,
     execute_text_input,
     execute_swipe,
@@ -20,6 +23,13 @@ from actions import (
     save_screenshot_with_username
 )
 from device_state_manager import device_state_manager
+from task_registry import task_registry
+from compute_executor import compute_executor
+from frame_scheduler import frame_scheduler
+from metrics import metrics
+from ocr_worker_pool import ocr_worker_pool
+from ocr_engine import ocr_engine
+from template_matching import template_match_stats
 from airtable_helper import airtable_helper
 from airtable_sync import sync_device_to_airtable
 from tasks import (
@@ -73,6 +83,27 @@ from tasks import (
 BLEACH_PACKAGE_NAME = "com.klab.bleach"
 BLEACH_ACTIVITY_NAME = "com.klab.bleach.MainActivity"
 
+def count_ocr_votes(readings) -> Dict[str, int]:
+    """
+    Consensus votes per value from (value, crop digest or None) readings. Re-reads of
+    identical pixels are one observation, but the re-read confirms it once: a static screen
+    read four times gives 2 votes, two different frames agreeing give 2, both give 3.
+    """
+    votes: Dict[str, int] = {}
+    digests: Dict[str, Set[str]] = {}
+    confirmed: Set[str] = set()
+    for value, digest in readings:
+        if digest:
+            seen = digests.setdefault(value, set())
+            if digest in seen:
+                if value not in confirmed:
+                    confirmed.add(value)
+                    votes[value] += 1
+                continue
+            seen.add(digest)
+        votes[value] = votes.get(value, 0) + 1
+    return votes
+
 
 class ProcessMonitor:
     """Monitors game processes and manages task switching with state persistence"""
@@ -297,99 +328,20 @@ class ProcessMonitor:
         return False
         
     def get_active_tasks(self, device_id: str) -> List[dict]:
-        """Get the currently active task set"""
+        """Get the currently active task set (filtered view is cached by task_registry)"""
         task_set = self.active_task_set.get(device_id, "restarting")
         
-        task_map = {
-            "main": StoryMode_Tasks,
-            "restarting": Restarting_Tasks,
-            "guild_tutorial": GUILD_TUTORIAL_TASKS,
-            "guild_rejoin": Guild_Rejoin,
-            "sell_characters": Sell_Characters,
-            "sell_accsesurry": Sell_Accessury,
-            "hardstory": HardStory_Tasks,
-            "sidestory": SideStory,
-            "substories": SubStories,
-            "substories_check": SubStories_check,
-            "character_slots_purchase": Character_Slots_Purchase,
-            "recive_gold_from_box_for_characters_purchase": Recive_Gold_From_Box_For_Characters_Purchase,
-            "exchange_gold_characters": Exchange_Gold_Characters,
-            "recive_giftbox": Recive_GiftBox,
-            "recive_giftbox_check": Recive_Giftbox_Check,
-            "recive_giftbox_orbs": Recive_Giftbox_Orbs,
-            "recive_giftbox_orbs_check": Recive_Giftbox_Orbs_Check,
-            "skip_kon_bonaza": Skip_Kon_Bonaza,
-            "kon_bonaza_1match_tasks": Kon_Bonaza_1Match_Tasks,
-            "skip_yukio_event": Skip_Yukio_Event_Tasks,
-            "sort_characters_lowest_level": Sort_Characters_Lowest_Level_Tasks,
-            "sort_filter_ascension": Sort_Filter_Ascension_Tasks,
-            "sort_multi_select_garbage_first": Sort_Multi_Select_Garbage_First_Tasks,
-            "upgrade_characters_level": Upgrade_Characters_Level,
-            "upgrade_characters_back_to_edit": Upgrade_Characters_Back_To_Edit,
-            # Reroll tasks
-            "reroll_earse_gamedata": reroll_earse_gamedata_tasks,
-            "reroll_earse_gamedatapart2": reroll_earse_gamedatapart2_tasks,
-            "reroll_tutorial_firstmatch": reroll_tutorial_firstmatch_tasks,
-            "reroll_tutorial_characterchoose": reroll_tutorial_characterchoose_tasks,
-            "reroll_tutorial_characterchoosepart2": reroll_tutorial_characterchoosepart2_tasks,
-            "reroll_tutorial_secondmatch": reroll_tutorial_secondmatch_tasks,
-            "reroll_replaceichigowithfivestar": reroll_replaceichigowithfivestar_tasks,
-            # Other tasks
-            "main_screenshot": Main_Screenshot_Tasks,
-            "extract_orb_counts": Extract_Orb_Counts_Tasks,
-            "extract_account_id": Extract_Account_ID_Tasks,
-            "login1_prepare_for_link": Login1_Prepare_For_Link_Tasks,
-            "login2_klab_login": Login2_Klab_Login_Tasks,
-            "login3_wait_for_2fa": Login3_Wait_For_2FA_Tasks,
-            "login4_confirm_link": Login4_Confirm_Link_Tasks,
-            "wait_for_other_devices": Wait_For_Other_Devices,
-            "endgame": Endgame_Tasks
-        }
-        
-        # Get base tasks or default to restarting
-        base_tasks = task_map.get(task_set, Restarting_Tasks)
-        print(f"[{device_id}] Active task set: {task_set}, Base tasks: {len(base_tasks)}")
-        
-        # Check if we're in reroll phase - DON'T add Restarting_Tasks if we are
-        device_state = device_state_manager.get_state(device_id)
-        is_reroll_phase = (
-            task_set.startswith("reroll_") or 
-            device_state.get("Reroll_Earse_GameData", 1) == 0 or
-            device_state.get("Reroll_Earse_GameDataPart2", 1) == 0 or
-            device_state.get("Reroll_Tutorial_FirstMatch", 1) == 0 or
-            device_state.get("Reroll_Tutorial_CharacterChoose", 1) == 0 or
-            device_state.get("Reroll_Tutorial_CharacterChoosePart2", 1) == 0 or
-            device_state.get("Reroll_Tutorial_SecondMatch", 1) == 0 or
-            device_state.get("Reroll_ReplaceIchigoWithFiveStar", 1) == 0
-        )
-        
-        # ALWAYS include Shared_Tasks and Switcher_Tasks for all task sets
-        # Restarting_Tasks should ONLY be used when task_set is "restarting"
-        if is_reroll_phase:
-            # In reroll mode: only base tasks + shared + switcher (NO restarting)
-            all_tasks = base_tasks + Shared_Tasks + Switcher_Tasks
-        elif task_set == "restarting":
-            # Restarting task set: restarting tasks are already the base tasks
-            all_tasks = base_tasks + Shared_Tasks + Switcher_Tasks
-        else:
-            # Other task sets: only base + shared + switcher (NO restarting tasks)
-            all_tasks = base_tasks + Shared_Tasks + Switcher_Tasks
-            
-        print(f"[{device_id}] Total tasks loaded: {len(all_tasks)} (Base: {len(base_tasks)}, Shared: {len(Shared_Tasks)}, Switcher: {len(Switcher_Tasks)})")
-            
-        # Filter out tasks with StopSupport flag if condition is met
-        filtered_tasks = []
-        skipped_count = 0
-        for task in all_tasks:
-            skip_result = self.should_skip_task(device_id, task)
-            if not skip_result:
-                filtered_tasks.append(task)
-            else:
-                skipped_count += 1
+        # base + Shared_Tasks + Switcher_Tasks, sorted by priority, filtered with should_skip_task.
+        # Only re-filtered when a device state flag the set depends on changes.
+        view, changed = task_registry.get_filtered_view(device_id, task_set, self.should_skip_task)
         
+        if changed:
+            compiled = task_registry.get_task_set(task_set)
+            print(f"[{device_id}] Active task set: {task_set}, Base tasks: {compiled.base_count}")
+            print(f"[{device_id}] Total tasks loaded: {len(compiled.tasks)} (Base: {compiled.base_count}, "
+                  f"Shared: {len(Shared_Tasks)}, Switcher: {len(Switcher_Tasks)}), active after filtering: {len(view)}")
         
-        # Sort by priority (lower number = higher priority)
-        return sorted(filtered_tasks, key=lambda x: x.get('priority', 999))
+        return view
     
     def set_active_tasks(self, device_id: str, task_set: str):
         """Set the active task set for a device and update state"""
@@ -477,6 +429,7 @@ class BackgroundMonitor:
         self.max_restart_attempts = 3
         self.is_running = False
         self.account_id_attempts = {}  # Store account ID extraction attempts per device
+        self.account_id_attempt_digests = {}  # OCR crop digest of each account ID attempt
         self.orb_multi_attempts = {}  # Store multiple orb attempts for consensus
         self.initial_setup_complete = {}
         self.last_action_time = {}
@@ -833,6 +786,11 @@ class OptimizedBackgroundMonitor:
         self.keep_checking_until: Dict[str, float] = {}
         self.keep_checking_task: Dict[str, str] = {}
         self.text_input_active: Dict[str, float] = {}  # Track when text input is happening
+        self._last_frame_stats_log_time: Dict[str, float] = {}  # Last periodic stats print per device
+        # Sharded runtime workers: the supervisor runs the all-linked check / account fetch
+        self.coordinated_by_supervisor = False
+        self.fetch_parked: Set[str] = set()  # Devices idling in the fetch-mode skip (nothing in flight)
+        self.ocr_preload_enabled = getattr(settings, 'OCR_BACKGROUND_PRELOAD', False)
         
         # Print initial device states on startup
         device_state_manager.print_all_device_states()
@@ -1028,19 +986,20 @@ class OptimizedBackgroundMonitor:
         
         return all_tasks
 
-    def get_adaptive_interval(self, device_id: str) -> float:
-        """Get adaptive check interval based on device stability"""
+    def get_frame_state(self, device_id: str) -> str:
+        """Device state the frame scheduler bases the next capture deadline on"""
+        if time.time() < self.keep_checking_until.get(device_id, 0):
+            return "keep_checking"
         if not getattr(settings, 'ADAPTIVE_CHECK_INTERVAL', True):
-            return self.check_interval
-            
-        device_state = self.device_states.get(device_id, {'stable_count': 0, 'last_action': 0})
+            return "active"
         
-        if device_state['stable_count'] > 10:
-            return self.check_interval * 2
-        elif device_state['stable_count'] > 5:
-            return self.check_interval * 1.5
-        else:
-            return self.check_interval
+        if (frame_change_detector.enabled and
+                frame_change_detector.stats[device_id]['static_streak'] >= getattr(settings, 'FRAME_STATIC_STREAK', 5)):
+            return "static"
+        device_state = self.device_states.get(device_id, {'stable_count': 0, 'last_action': 0})
+        if device_state['stable_count'] > 5:
+            return "idle"
+        return "active"
     
     async def handle_task_flags(self, device_id: str, task: dict):
         """Handle all task switching flags and update device state"""
@@ -1141,8 +1100,8 @@ class OptimizedBackgroundMonitor:
             ocr_result = None
             
             # Try to get OCR result from task object first
-            if hasattr(task, 'ocr_result') and task.ocr_result and task.ocr_result.strip():
-                ocr_result = task.ocr_result.strip()
+            if task.get("ocr_result") and task["ocr_result"].strip():
+                ocr_result = task["ocr_result"].strip()
                 print(f"[{device_id}] 🔍 Got OCR from task.ocr_result: '{ocr_result}'")
             
             # Fallback: Extract OCR result from task name (Enhanced OCR: 'value')
@@ -1157,7 +1116,7 @@ class OptimizedBackgroundMonitor:
             if ocr_result:
                 attempt_num = task.get("orb_multi_attempt", 0)
                 print(f"[{device_id}] 🔄 Storing orb attempt {attempt_num}: '{ocr_result}'")
-                self.store_multi_orb_attempt(device_id, attempt_num, ocr_result)
+                self.store_multi_orb_attempt(device_id, attempt_num, ocr_result, task.get("ocr_digest"))
                 
                 # Check if this is a next_task_only task - don't trigger task set completion
                 if task.get("next_task_only", False):
@@ -1178,8 +1137,8 @@ class OptimizedBackgroundMonitor:
             
             # Extract OCR result using same logic as above
             ocr_result = None
-            if hasattr(task, 'ocr_result') and task.ocr_result and task.ocr_result.strip():
-                ocr_result = task.ocr_result.strip()
+            if task.get("ocr_result") and task["ocr_result"].strip():
+                ocr_result = task["ocr_result"].strip()
             elif 'Enhanced OCR:' in task.get('task_name', ''):
                 import re
                 task_name = task.get('task_name', '')
@@ -1191,7 +1150,7 @@ class OptimizedBackgroundMonitor:
                 # Store the final attempt
                 attempt_num = task.get("orb_multi_attempt", 0)
                 print(f"[{device_id}] 🔄 Storing final orb attempt {attempt_num}: '{ocr_result}'")
-                self.store_multi_orb_attempt(device_id, attempt_num, ocr_result)
+                self.store_multi_orb_attempt(device_id, attempt_num, ocr_result, task.get("ocr_digest"))
                 
                 # Get best consensus value
                 best_orb = self.get_best_orb_consensus(device_id)
@@ -1231,15 +1190,15 @@ class OptimizedBackgroundMonitor:
         # Handle temporary account ID storage for consensus
         if task.get("temp_account_id_storage", False):
             attempt_num = task.get("account_id_extraction_attempt", 0)
-            if hasattr(task, 'ocr_result') and task.ocr_result:
-                self.store_account_id_attempt(device_id, attempt_num, task.ocr_result)
+            if task.get("ocr_result"):
+                self.store_account_id_attempt(device_id, attempt_num, task["ocr_result"], task.get("ocr_digest"))
             # Continue processing - don't return early
         
         # Handle account ID consensus check
         if task.get("account_id_consensus_check", False):
             attempt_num = task.get("account_id_extraction_attempt", 0)
-            if hasattr(task, 'ocr_result') and task.ocr_result:
-                self.store_account_id_attempt(device_id, attempt_num, task.ocr_result)
+            if task.get("ocr_result"):
+                self.store_account_id_attempt(device_id, attempt_num, task["ocr_result"], task.get("ocr_digest"))
                 consensus_value = self.check_account_id_consensus(device_id)
                 if consensus_value:
                     device_state_manager.update_state(device_id, "AccountID", consensus_value)
@@ -1632,10 +1591,14 @@ class OptimizedBackgroundMonitor:
         
         while not self.stop_event.is_set():
             try:
+                # The frame scheduler owns the cadence: wait for this device's next deadline
+                await frame_scheduler.wait_turn(device_id)
+                
                 # Check if all devices are linked periodically (every 10 seconds)
                 # BUT ONLY if not already fetching and hasn't fetched recently
                 current_time = time.time()
-                if (current_time - self.last_endgame_check > 10 and 
+                if (not self.coordinated_by_supervisor and
+                    current_time - self.last_endgame_check > 10 and 
                     not self.fetch_in_progress and 
                     current_time - self.last_successful_fetch > 300):  # Wait 5 minutes between fetches
                     
@@ -1720,16 +1683,18 @@ class OptimizedBackgroundMonitor:
                 
                 # Skip all monitoring during fetch mode
                 if self.fetch_in_progress or getattr(device_state_manager, 'fetch_mode', False):
-                    await asyncio.sleep(1)
+                    self.fetch_parked.add(device_id)
+                    frame_scheduler.schedule(device_id, "fetch")
                     continue
+                self.fetch_parked.discard(device_id)
                 
                 if self.is_device_sleeping(device_id):
-                    await asyncio.sleep(0.1)
+                    frame_scheduler.schedule(device_id, "sleeping", until=self.device_sleep_until[device_id])
                     continue
                 
                 # Check if text input is active - pause all other tasks
                 if self.is_text_input_active(device_id):
-                    await asyncio.sleep(0.5)
+                    frame_scheduler.schedule(device_id, "text_input", until=self.text_input_active[device_id])
                     continue
                 
                 self.frame_processed_tasks[device_id].clear()
@@ -1783,7 +1748,8 @@ class OptimizedBackgroundMonitor:
                 # Task progression should ONLY happen through flags (BackToStory, NextTaskSet_Tasks, etc.)
                 # This prevents premature switching before tasks complete their objectives
                 
-                all_tasks = self.get_prioritized_tasks(device_id)
+                with metrics.timer("task_filter", device_id):
+                    all_tasks = self.get_prioritized_tasks(device_id)
                 
                 # CRITICAL FIX: Add detection logging for reroll tasks to diagnose issue #3
                 current_task_set = self.process_monitor.active_task_set.get(device_id, "unknown")
@@ -1800,7 +1766,33 @@ class OptimizedBackgroundMonitor:
                         print(f"[{device_name}] 🔍 Searching {len(all_tasks)} tasks ({reroll_task_count} reroll tasks) in '{current_task_set}'")
                 
                 with suppress_stdout_stderr():
-                    matched_tasks = await batch_check_pixels_enhanced(device_id, all_tasks)
+                    # Captured by the frame scheduler within the global capture budget
+                    frame = await frame_scheduler.next_frame(device_id, all_tasks)
+                    matched_tasks = []
+                    if frame is not None:
+                        matched_tasks = await batch_check_pixels_enhanced(device_id, all_tasks, frame,
+                                                                          prefiltered=True)
+                
+                # Warm the OCR models before the first OCR task needs them (no-op after the first call)
+                if ocr_engine.preload_thread is None and (
+                        self.ocr_preload_enabled
+                        or any(task.get("type") in ("ocr", "ultra_robust_orb") for task in all_tasks)):
+                    ocr_engine.preload_in_background()
+                
+                if frame_change_detector.enabled:
+                    current_time = time.time()
+                    stats_interval = getattr(settings, 'FRAME_STATS_LOG_INTERVAL', 60)
+                    if current_time - self._last_frame_stats_log_time.setdefault(device_id, current_time) > stats_interval:
+                        self._last_frame_stats_log_time[device_id] = current_time
+                        device_name = device_state_manager._get_device_name(device_id)
+                        print(f"[{device_name}] 🧊 {frame_change_detector.format_stats(device_id)}")
+                        print(f"[{device_name}] 🖼️ {template_match_stats.format_stats(device_id)}")
+                        print(f"[{device_name}] ⚙️ {compute_executor.format_stats(device_id)}")
+                        print(f"[{device_name}] ⏱️ {frame_scheduler.format_stats(device_id)}")
+                        if ocr_worker_pool.enabled:
+                            print(f"[{device_name}] 🔤 {ocr_worker_pool.format_stats()}")
+                        print(f"[{device_name}] ♻️ {ocr_manager.ocr_cache.format_stats()}")
+                        print(f"[{device_name}] 💾 {device_state_manager.format_persist_stats()}")
                 
                 if matched_tasks:
                     # Log matched reroll tasks
@@ -1833,14 +1825,13 @@ class OptimizedBackgroundMonitor:
                     
                     self.device_states[device_id]['stable_count'] += 1
                 
-                interval = self.get_adaptive_interval(device_id)
-                await asyncio.sleep(interval)
+                frame_scheduler.schedule(device_id, self.get_frame_state(device_id))
                 
             except Exception as e:
                 print(f"[{device_id}] Monitoring error: {e}")
                 import traceback
                 traceback.print_exc()
-                await asyncio.sleep(1)
+                frame_scheduler.schedule(device_id, "error")
         
         return True
     
@@ -1929,16 +1920,21 @@ class OptimizedBackgroundMonitor:
             print(f"[{device_id}] ❌ OCR cleanup error: {e}")
             return ocr_result  # Return original if cleanup fails
     
-    def store_multi_orb_attempt(self, device_id: str, attempt_num: int, ocr_result: str):
-        """Store multiple orb attempts for intelligent consensus"""
+    def store_multi_orb_attempt(self, device_id: str, attempt_num: int, ocr_result: str,
+                                digest: Optional[str] = None):
+        """Store multiple orb attempts for intelligent consensus (digest: OCR crop content hash)"""
         if device_id not in self.orb_multi_attempts:
             self.orb_multi_attempts[device_id] = {}
         
+        if digest and any(attempt.get('digest') == digest for attempt in self.orb_multi_attempts[device_id].values()):
+            print(f"[{device_id}] ♻️ Orb attempt {attempt_num} re-read the same pixels - confirms, not a new observation")
+        
         # Clean the result using robust cleanup
         cleaned_result = self.robust_number_ocr_cleanup(device_id, ocr_result)
         self.orb_multi_attempts[device_id][attempt_num] = {
             'raw': ocr_result,
-            'cleaned': cleaned_result
+            'cleaned': cleaned_result,
+            'digest': digest
         }
         print(f"[{device_id}] 📝 Orb attempt {attempt_num}: '{ocr_result}' → '{cleaned_result}'")
     
@@ -1955,6 +1951,7 @@ class OptimizedBackgroundMonitor:
         for attempt_num, attempt_data in attempts.items():
             raw = attempt_data['raw']
             cleaned = attempt_data['cleaned']
+            digest = attempt_data.get('digest')
             
             # Score each result based on quality indicators
             score = 0
@@ -2000,7 +1997,8 @@ class OptimizedBackgroundMonitor:
                 'attempt': attempt_num,
                 'raw': raw,
                 'cleaned': cleaned,
-                'score': score
+                'score': score,
+                'digest': digest
             })
         
         # Sort by score (highest first)
@@ -2010,13 +2008,9 @@ class OptimizedBackgroundMonitor:
         for result in scored_results:
             print(f"[{device_id}]   #{result['attempt']}: '{result['raw']}' → '{result['cleaned']}' (score: {result['score']})")
         
-        # Count frequency of top-scored results
-        value_counts = {}
+        # Count frequency of top-scored results (re-reads of identical pixels: see count_ocr_votes)
         valid_results = [r for r in scored_results if r['score'] > 0]
-        
-        for result in valid_results:
-            cleaned = result['cleaned']
-            value_counts[cleaned] = value_counts.get(cleaned, 0) + 1
+        value_counts = count_ocr_votes((r['cleaned'], r['digest']) for r in valid_results)
         
         print(f"[{device_id}] 📊 Valid value frequencies: {value_counts}")
         
@@ -2107,11 +2101,17 @@ class OptimizedBackgroundMonitor:
             print(f"[{device_id}] ❌ Account ID cleanup error: {e}")
             return ocr_result  # Return original if cleanup fails
     
-    def store_account_id_attempt(self, device_id: str, attempt_num: int, ocr_result: str):
-        """Store account ID extraction attempt for consensus checking"""
+    def store_account_id_attempt(self, device_id: str, attempt_num: int, ocr_result: str,
+                                 digest: Optional[str] = None):
+        """Store account ID extraction attempt for consensus checking (digest: OCR crop content hash)"""
         if device_id not in self.account_id_attempts:
             self.account_id_attempts[device_id] = {}
         
+        digests = self.account_id_attempt_digests.setdefault(device_id, {})
+        if digest and digest in digests.values():
+            print(f"[{device_id}] ♻️ Account ID attempt {attempt_num} re-read the same pixels - confirms, not a new observation")
+        digests[attempt_num] = digest
+        
         # Clean the result (remove extra spaces, fix common OCR errors)
         cleaned_result = ocr_result.strip().replace("  ", " ").replace("O", "0").replace("o", "0").replace("l", "1").replace("I", "1")
         self.account_id_attempts[device_id][attempt_num] = cleaned_result
@@ -2124,11 +2124,11 @@ class OptimizedBackgroundMonitor:
         
         attempts = self.account_id_attempts[device_id]
         
-        # Count occurrences of each value
-        value_counts = {}
-        for attempt_num, value in attempts.items():
-            if value and value.strip() and len(value.strip()) > 5:  # Only count non-empty values with reasonable length
-                value_counts[value] = value_counts.get(value, 0) + 1
+        # Count occurrences of each value (re-reads of identical pixels: see count_ocr_votes)
+        digests = self.account_id_attempt_digests.pop(device_id, {})
+        value_counts = count_ocr_votes(
+            (value, digests.get(attempt_num)) for attempt_num, value in attempts.items()
+            if value and value.strip() and len(value.strip()) > 5)  # Only count non-empty values with reasonable length
         
         # Find values that appear 2 or more times
         consensus_candidates = [value for value, count in value_counts.items() if count >= 2]
@@ -2245,7 +2245,7 @@ class OptimizedBackgroundMonitor:
                         all_tasks = self.get_prioritized_tasks(device_id)
                         
                         with suppress_stdout_stderr():
-                            matched_tasks = await batch_check_pixels_enhanced(device_id, all_tasks, screenshot)
+                            matched_tasks = await batch_check_pixels_enhanced(device_id, all_tasks, screenshot, prefiltered=True)
                         
                         if matched_tasks:
                             logical_triggered = await self.process_matched_tasks(device_id, matched_tasks)
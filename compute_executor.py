@@ -0,0 +1,160 @@
+"""
+Compute executor: runs OpenCV / OCR work on a bounded thread pool instead of the asyncio
+event loop, so one device's OCR burst no longer stalls capture and taps on the others.
+
+cv2 (matchTemplate, filters, resizes) and EasyOCR inference release the GIL, so worker
+threads run them in parallel. Jobs are queued per device and workers take them round-robin
+across devices, so a device submitting many jobs can't starve the rest. Each device may
+have at most COMPUTE_MAX_PENDING_PER_DEVICE jobs queued or running; further callers wait
+(asynchronously) for a slot.
+
+    result = await compute_executor.run(device_id, func, *args)
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import settings
+
+SHARED_QUEUE = "shared"  # Fairness key for work that isn't tied to a device
+
+
+class ComputeExecutor:
+    """Thread pool with per-device round-robin queues, backpressure and wait-time stats"""
+
+    def __init__(self, workers: int = 4, max_pending_per_device: int = 2, enabled: bool = True):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending_per_device)
+        self.enabled = enabled
+        self.queues: Dict[str, Deque[Tuple[Future, Callable, tuple, dict, float]]] = {}
+        self.ready: Deque[str] = deque()  # Devices with queued jobs, in service order
+        self.cond = threading.Condition()
+        self.threads: List[threading.Thread] = []
+        self.slots: Dict[str, asyncio.Semaphore] = {}
+        self.depth = 0
+        self.max_depth = 0
+        self.busy = 0
+        self.stats: Dict[str, Dict[str, float]] = {}
+        self.stopped = False
+
+    async def run(self, device_id: Optional[str], func: Callable, *args, **kwargs) -> Any:
+        """Run func(*args, **kwargs) on a worker thread and return its result"""
+        if not self.enabled:
+            return func(*args, **kwargs)
+        key = device_id or SHARED_QUEUE
+        slots = self.slots.get(key)
+        if slots is None:
+            slots = self.slots.setdefault(key, asyncio.Semaphore(self.max_pending))
+        async with slots:
+            return await asyncio.wrap_future(self.submit(key, func, *args, **kwargs))
+
+    def submit(self, key: str, func: Callable, *args, **kwargs) -> Future:
+        """Queue a job (no backpressure - prefer run()) and return its concurrent Future"""
+        future = Future()
+        with self.cond:
+            if not self.threads:
+                self._start_workers()
+            queue = self.queues.setdefault(key, deque())
+            queue.append((future, func, args, kwargs, time.perf_counter()))
+            if len(queue) == 1:
+                self.ready.append(key)
+            self.depth += 1
+            self.max_depth = max(self.max_depth, self.depth)
+            stats = self._stats_for(key)
+            stats["max_depth"] = max(stats["max_depth"], len(queue))
+            self.cond.notify()
+        return future
+
+    def _start_workers(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"compute-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _stats_for(self, key: str) -> Dict[str, float]:
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = {"jobs": 0, "wait_total": 0.0, "wait_max": 0.0,
+                                       "run_total": 0.0, "max_depth": 0}
+        return stats
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                while not self.ready and not self.stopped:
+                    self.cond.wait()
+                if not self.ready:
+                    return
+                key = self.ready.popleft()
+                queue = self.queues[key]
+                future, func, args, kwargs, queued_at = queue.popleft()
+                if queue:
+                    self.ready.append(key)  # Back of the line - the other devices go first
+                self.depth -= 1
+                self.busy += 1
+
+            started = time.perf_counter()
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(func(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+            finished = time.perf_counter()
+
+            with self.cond:
+                self.busy -= 1
+                stats = self._stats_for(key)
+                stats["jobs"] += 1
+                stats["wait_total"] += started - queued_at
+                stats["wait_max"] = max(stats["wait_max"], started - queued_at)
+                stats["run_total"] += finished - started
+
+    def queue_depth(self, device_id: Optional[str] = None) -> int:
+        """Jobs waiting for a worker (for one device, or in total)"""
+        with self.cond:
+            if device_id is None:
+                return self.depth
+            return len(self.queues.get(device_id, ()))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Copy of the counters, for sizing COMPUTE_WORKERS"""
+        with self.cond:
+            return {
+                "workers": self.workers,
+                "busy": self.busy,
+                "depth": self.depth,
+                "max_depth": self.max_depth,
+                "devices": {key: dict(stats) for key, stats in self.stats.items()},
+            }
+
+    def format_stats(self, device_id: str) -> str:
+        with self.cond:
+            stats = self.stats.get(device_id)
+            if not stats or not stats["jobs"]:
+                return "Compute: no offloaded jobs yet"
+            jobs = stats["jobs"]
+            return (f"Compute: {jobs} jobs, wait avg {stats['wait_total'] / jobs * 1000:.1f}ms "
+                    f"max {stats['wait_max'] * 1000:.0f}ms, run avg {stats['run_total'] / jobs * 1000:.1f}ms, "
+                    f"queue {len(self.queues.get(device_id, ()))} (max {stats['max_depth']:.0f}), "
+                    f"pool {self.busy}/{self.workers} busy, {self.depth} queued")
+
+    def shutdown(self, wait: bool = True):
+        """Finish queued jobs and stop the workers"""
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        if wait:
+            for thread in self.threads:
+                thread.join()
+        self.threads = []
+
+
+# Global executor
+compute_executor = ComputeExecutor(
+    workers=getattr(settings, 'COMPUTE_WORKERS', 4),
+    max_pending_per_device=getattr(settings, 'COMPUTE_MAX_PENDING_PER_DEVICE', 2),
+    enabled=getattr(settings, 'COMPUTE_EXECUTOR_ENABLED', True),
+)
@@ -1,10 +1,23 @@
 # device_state_manager.py - Enhanced with new account management and task progression
+import atexit
+import copy
 import json
 import os
-from typing import Dict, Any
+import time
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple
 from datetime import datetime
 import asyncio
-from threading import Lock
+from threading import Lock, Event, Thread, local
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import settings
+from metrics import metrics
+from sqlite_state_store import SQLiteStateStore
 
 # Timezone support
 try:
@@ -16,13 +29,106 @@ except ImportError:
     TIMEZONE_AVAILABLE = False
     ISTANBUL_TZ = None
 
+# StopSupport / RequireSupport flag -> device state key it checks
+STOP_SUPPORT_FLAG_MAPPING = {
+    "json_EasyMode": "EasyMode",
+    "json_HardMode": "HardMode",
+    "json_SideMode": "SideMode",
+    "json_SubStory": "SubStory",
+    "json_Character_Slots_Purchased": "Character_Slots_Purchased",
+    "json_Recive_Gold_From_Box_For_Characters_Purchase": "Recive_Gold_From_Box_For_Characters_Purchase",
+    "json_Recive_GiftBox": "Recive_GiftBox",
+    "json_Skip_Kon_Bonaza_Complete": "Skip_Kon_Bonaza_100Times",
+    "json_Kon_Bonaza": "Skip_Kon_Bonaza",
+    "json_Skip_Yukio_Event": "Skip_Yukio_Event",
+    "json_Sort_Characters_Lowest_Level": "Sort_Characters_Lowest_Level",
+    "json_Sort_Filter_Ascension": "Sort_Filter_Ascension",
+    "json_Sort_Multi_Select_Garbage_First": "Sort_Multi_Select_Garbage_First",
+    "json_Upgrade_Characters_Level": "Upgrade_Characters_Level",
+    "json_Recive_Giftbox_Orbs": "Recive_Giftbox_Orbs",
+    "Skip_Yukio_Event_Retry_At_3": "Skip_Yukio_Event_Retry_Count",
+}
+
+# Changes to these keys are fsynced to the journal immediately instead of in the next group commit
+CRITICAL_STATE_KEYS = {"isLinked", "AccountID", "UserName", "Email", "Password", "Orbs", "CurrentTaskSet"}
+
+# Set by the sharded runtime before a process starts: comma-separated device IDs whose state
+# this process owns (writes). Every other device is remote - see DeviceStateManager.remote_devices.
+OWNED_DEVICES_ENV = "BLEACH_OWNED_DEVICES"
+
+def _try_lock_file(path: str):
+    """Non-blocking exclusive lock on `path` across processes; the open file, or None if held elsewhere"""
+    handle = open(path, 'a+')
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        handle.close()
+        return None
+    return handle
+
+def _fsync_dir(path: str):
+    """Make a rename inside `path` durable (no-op on Windows, where directories can't be opened)"""
+    if os.name == 'nt':
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
 class DeviceStateManager:
-    """Manages persistent state for each device including account info and task progression"""
+    """
+    Manages persistent state for each device including account info and task progression.
+
+    self.states is the authoritative copy. Every change bumps the device version and
+    appends one compact record to DEVICEn.journal (the primary persistence path). The
+    background thread fsyncs all journals together every JOURNAL_FSYNC_INTERVAL seconds
+    (immediately for CRITICAL_STATE_KEYS) and compacts a journal into the DEVICEn.json
+    snapshot once it holds COMPACT_MAX_RECORDS records or COMPACT_INTERVAL seconds of
+    changes. Startup recovers snapshot + journal.
+
+    Only one process writes a device's journal: the one holding DEVICEn.lock (main.py, or
+    the shard worker that owns the device). Other processes that import this module
+    (force_fetch_accounts.py, the airtable scripts, testing/) read the journal but never
+    append to or truncate it - the keys they change are merged straight into the snapshot,
+    which the owner picks up as an external edit and replays its journal on top of. The
+    background writer only runs in a journal owner.
+
+    With settings.STATE_BACKEND = "sqlite" the SQLite store (device_states.db, WAL)
+    takes the journal's place and also holds the stock counter; the JSON files are
+    still compacted as read-only mirrors for scripts that read them directly. Changes
+    other processes commit are picked up from the database (PRAGMA data_version), and
+    edits to the mirrors are never written back.
+    """
+    
+    JOURNAL_FSYNC_INTERVAL = 1.0  # Group-commit window for journal fsyncs (seconds)
+    COMPACT_MAX_RECORDS = 500  # Compact a journal once it holds this many records
+    COMPACT_INTERVAL = 30.0  # ...or once its oldest uncompacted change is this old (seconds)
+    EXTERNAL_CHECK_INTERVAL = 2.0  # Seconds between checks for edits made by other scripts
     
     def __init__(self):
         self.states: Dict[str, Dict[str, Any]] = {}
         self.state_dir = "device_states"
         self.locks: Dict[str, Lock] = {}
+        
+        # Write-behind bookkeeping
+        self.versions: Dict[str, int] = {}
+        self._journaled: Dict[str, Dict[str, Any]] = {}  # State as of the last journal entry
+        self._journal_files: Dict[str, Any] = {}
+        self._file_mtimes: Dict[str, int] = {}  # Snapshot mtime we last wrote/read
+        self._store_versions = local()  # Per thread: SQLite data_version last seen per device
+        self._dirty: Dict[str, float] = {}  # device_id -> time of first change not in the snapshot
+        self._journal_records: Dict[str, int] = {}  # Records since the last compaction
+        self._unsynced: set = set()  # Journals with appends not yet fsynced
+        self._journal_locks: Dict[str, Any] = {}  # device_id -> locked DEVICEn.lock (journal owner)
+        self.persist_stats = {"mutations": 0, "journal_bytes": 0, "fsyncs": 0, "compactions": 0}
+        self._subscribers: List[Callable[[str, int, List[str]], None]] = []
+        self._flush_event = Event()
+        self._stop_event = Event()
         self.device_mapping = {
             "127.0.0.1:16800": "DEVICE1",
             "127.0.0.1:16832": "DEVICE2",
@@ -42,14 +148,66 @@ class DeviceStateManager:
         # Flag to prevent auto-generation during fetch
         self.fetch_mode = False
         
+        # Devices whose state another process owns (sharded runtime): they are loaded read-only,
+        # never reloaded, compacted or journaled here, and only change via apply_remote_changes
+        self.remote_devices: set = set()
+        owned = os.environ.get(OWNED_DEVICES_ENV)
+        if owned is not None:
+            owned_ids = {device_id for device_id in owned.split(",") if device_id}
+            self.remote_devices = set(self.device_mapping) - owned_ids
+        # Sharded workers route stock increments to the supervisor (device_id -> estimated new stock)
+        self.stock_forwarder: Optional[Callable[[Optional[str]], int]] = None
+        
         # Create state directory if it doesn't exist
         os.makedirs(self.state_dir, exist_ok=True)
         
+        # Optional SQLite backend
+        self.store = None
+        self.stock_lock = Lock()
+        if getattr(settings, 'STATE_BACKEND', 'json') == 'sqlite':
+            self.store = SQLiteStateStore(os.path.join(self.state_dir, "device_states.db"))
+            print("[STATE] Using SQLite state backend (device_states/device_states.db)")
+        
         # Initialize states for all devices
         self._initialize_all_devices()
         
         # Initialize stock management
         self._initialize_stock_file()
+        
+        # Background snapshot writer - only in the process that owns journals (every process with SQLite)
+        self._flusher_thread = None
+        if self._journal_locks or self.store is not None:
+            self._start_flusher()
+        atexit.register(self.close)
+    
+    def _start_flusher(self):
+        if self._flusher_thread is None:
+            self._flusher_thread = Thread(target=self._flush_loop, name="state-flusher", daemon=True)
+            self._flusher_thread.start()
+    
+    def _acquire_journal(self, device_id: str) -> bool:
+        """Become the journal writer for a device, unless another process already is"""
+        if device_id in self._journal_locks:
+            return True
+        device_name = self._get_device_name(device_id)
+        handle = _try_lock_file(os.path.join(self.state_dir, f"{device_name}.lock"))
+        if handle is None:
+            return False
+        self._journal_locks[device_id] = handle
+        return True
+    
+    def _release_journal(self, device_id: str):
+        """Stop writing a device's journal and let another process own it (device lock held)"""
+        journal = self._journal_files.pop(device_id, None)
+        if journal is not None:
+            journal.close()
+        handle = self._journal_locks.pop(device_id, None)
+        if handle is not None:
+            handle.close()
+    
+    def owns_journal(self, device_id: str) -> bool:
+        """True if this process writes the device's journal (always with the SQLite store)"""
+        return self.store is not None or device_id in self._journal_locks
     
     def _get_istanbul_time(self) -> str:
         """Get current time in Istanbul timezone as ISO string"""
@@ -127,10 +285,22 @@ class DeviceStateManager:
     
     def _initialize_all_devices(self):
         """Initialize state files for all configured devices"""
+        owned_elsewhere = []
         for device_id in self.device_mapping.keys():
             device_name = self._get_device_name(device_id)
             self.locks[device_id] = Lock()
             
+            if device_id in self.remote_devices:
+                self._load_remote_device(device_id)
+                continue
+            
+            if self.store is None and not self._acquire_journal(device_id):
+                owned_elsewhere.append(device_name)
+            
+            if self.store is not None and self.store.has_device(device_name):
+                self._load_from_store(device_id)
+                continue
+            
             # Load or create state file
             state_file = self._get_state_file_path(device_name)
             
@@ -158,8 +328,14 @@ class DeviceStateManager:
                         if key not in loaded_state:
                             loaded_state[key] = value
                     
+                    self._file_mtimes[device_id] = os.stat(state_file).st_mtime_ns
+                    replayed = self._replay_journal(device_id, loaded_state)
+                    self._journaled[device_id] = copy.deepcopy(loaded_state)
                     self.states[device_id] = loaded_state
                     print(f"[STATE] Loaded existing state for {device_name}")
+                    if replayed and self.owns_journal(device_id):
+                        print(f"[STATE] 🔁 Replayed {replayed} journal entries for {device_name}")
+                        self._save_state(device_id, flush=True)
                 except json.JSONDecodeError as e:
                     # JSON CORRUPTION DETECTED - Try to restore from backup
                     print(f"[STATE] ❌ CRITICAL - JSON CORRUPTION in {device_name}: {e}")
@@ -173,9 +349,10 @@ class DeviceStateManager:
                             with open(backup_file, 'r') as f:
                                 backup_state = json.load(f)
                             
-                            # Backup is valid, restore it
+                            # Backup is valid, restore it (plus anything journaled after it)
+                            self._replay_journal(device_id, backup_state)
                             self.states[device_id] = backup_state
-                            self._save_state(device_id)  # Save the restored backup
+                            self._save_state(device_id, flush=True)  # Save the restored backup
                             print(f"[STATE] ✅ Successfully restored {device_name} from backup!")
                             print(f"[STATE] 📊 Restored state: EasyMode={backup_state.get('EasyMode', 0)}, "
                                   f"HardMode={backup_state.get('HardMode', 0)}, "
@@ -193,64 +370,405 @@ class DeviceStateManager:
                     # Load empty state to memory but DON'T auto-save
                     self.states[device_id] = self._get_default_state()
             else:
+                # A journal without its snapshot belongs to a deleted state file
+                self._discard_journal(device_id)
                 if not self.fetch_mode:  # Only auto-generate if not in fetch mode
                     self.states[device_id] = self._get_default_state()
-                    self._save_state(device_id)
+                    self._save_state(device_id, flush=True)
                     print(f"[STATE] Created new state file for {device_name}")
+            
+            if self.store is not None and device_id in self.states:
+                self.store.replace_state(device_name, self.states[device_id])
+                print(f"[STATE] Imported {device_name} into SQLite store")
+        
+        if owned_elsewhere:
+            print(f"[STATE] ⚠️ {', '.join(owned_elsewhere)} journaled by another process (main.py running?) - "
+                  f"changes here go straight to the snapshots")
     
-    def _save_state(self, device_id: str):
-        """Save device state to JSON file with atomic write to prevent corruption"""
+    def _load_remote_device(self, device_id: str):
+        """Read another process's device without replaying, compacting or creating anything"""
         device_name = self._get_device_name(device_id)
         state_file = self._get_state_file_path(device_name)
+        loaded_state = {}
+        try:
+            if self.store is not None and self.store.has_device(device_name):
+                loaded_state = self.store.load_state(device_name)
+            elif os.path.exists(state_file):
+                with open(state_file, 'r') as f:
+                    loaded_state = json.load(f)
+                self._file_mtimes[device_id] = os.stat(state_file).st_mtime_ns
+        except Exception as e:
+            print(f"[STATE] Error reading remote state for {device_name}: {e}")
+        for key, value in self._get_default_state().items():
+            loaded_state.setdefault(key, value)
+        self.states[device_id] = loaded_state
+        self._journaled[device_id] = copy.deepcopy(loaded_state)
+    
+    def _load_from_store(self, device_id: str):
+        """Load a device from the SQLite store and refresh its JSON mirror"""
+        device_name = self._get_device_name(device_id)
+        loaded_state = self.store.load_state(device_name)
+        for key, value in self._get_default_state().items():
+            if key not in loaded_state:
+                loaded_state[key] = value
+        
+        self.states[device_id] = loaded_state
+        self._journaled[device_id] = copy.deepcopy(loaded_state)
+        self._write_snapshot(device_id)
+        print(f"[STATE] Loaded existing state for {device_name} (SQLite)")
+    
+    def _get_journal_path(self, device_id: str) -> str:
+        """Path of the append-only change journal for a device"""
+        return os.path.join(self.state_dir, f"{self._get_device_name(device_id)}.journal")
+    
+    def _replay_journal(self, device_id: str, state: Dict[str, Any]) -> int:
+        """Apply journaled changes newer than the snapshot to `state`; returns entries applied"""
+        journal_path = self._get_journal_path(device_id)
+        if not os.path.exists(journal_path):
+            return 0
+        
+        applied = 0
+        try:
+            with open(journal_path, 'rb') as f:
+                data = f.read()
+            valid_bytes = 0
+            for line in data.splitlines(keepends=True):
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("unterminated record")
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn last record: a crash mid-append (cut it so new records stay readable),
+                    # or the owner is appending right now (leave it alone)
+                    if self.owns_journal(device_id):
+                        print(f"[STATE] ⚠️ Dropping torn journal tail for {self._get_device_name(device_id)}")
+                        with open(journal_path, 'r+b') as f:
+                            f.truncate(valid_bytes)
+                    break
+                state.update(entry.get("set", {}))
+                for key in entry.get("del", []):
+                    state.pop(key, None)
+                self.versions[device_id] = max(self.versions.get(device_id, 0), entry.get("v", 0))
+                valid_bytes += len(line)
+                applied += 1
+        except Exception as e:
+            print(f"[STATE] ⚠️ Could not replay journal for {self._get_device_name(device_id)}: {e}")
+        return applied
+    
+    def _discard_journal(self, device_id: str):
+        """Empty the journal once a snapshot covers everything in it (only the owner touches the file)"""
+        journal = self._journal_files.get(device_id)
+        if journal is not None:
+            journal.seek(0)
+            journal.truncate()
+        elif self.owns_journal(device_id) and os.path.exists(self._get_journal_path(device_id)):
+            open(self._get_journal_path(device_id), 'w').close()
+        self._journal_records[device_id] = 0
+        self._unsynced.discard(device_id)
+        self._dirty.pop(device_id, None)
+    
+    def _append_journal(self, device_id: str, entry: Dict[str, Any], sync: bool = False,
+                        previous: Dict[str, Any] = None):
+        if self.store is not None:
+            # SQLite commit replaces the journal record; durable commits fsync like a journal sync
+            self.store.apply_changes(self._get_device_name(device_id), entry["set"],
+                                     entry.get("del", []), previous, durable=sync)
+            self.persist_stats["mutations"] += 1
+            self.persist_stats["fsyncs"] += 1 if sync else 0
+            metrics.count("fsyncs", device_id, 1 if sync else 0)
+            self._journal_records[device_id] = self._journal_records.get(device_id, 0) + 1
+            self._dirty.setdefault(device_id, time.time())
+            return
+        
+        journal = self._journal_files.get(device_id)
+        if journal is None:
+            journal = open(self._get_journal_path(device_id), 'a')
+            self._journal_files[device_id] = journal
+        record = json.dumps(entry, separators=(',', ':')) + "\n"
+        journal.write(record)
+        journal.flush()  # Survives a process crash; fsync is grouped below
+        
+        self.persist_stats["mutations"] += 1
+        self.persist_stats["journal_bytes"] += len(record)
+        self._journal_records[device_id] = self._journal_records.get(device_id, 0) + 1
+        self._dirty.setdefault(device_id, time.time())
+        
+        if sync:
+            self._sync_journal(device_id)
+        else:
+            self._unsynced.add(device_id)
+    
+    def _sync_journal(self, device_id: str):
+        """fsync one device journal (device lock held)"""
+        journal = self._journal_files.get(device_id)
+        self._unsynced.discard(device_id)
+        if journal is not None:
+            with metrics.timer("fsync", device_id):
+                os.fsync(journal.fileno())
+            self.persist_stats["fsyncs"] += 1
+            metrics.count("fsyncs", device_id)
+    
+    def _save_state(self, device_id: str, flush: bool = False):
+        """
+        Record a change to self.states[device_id]: bump its version and journal the
+        diff. Critical keys are fsynced at once; flush=True also compacts into the
+        snapshot immediately. Callers hold the device lock.
+        """
+        device_name = self._get_device_name(device_id)
         
         try:
-            self.states[device_id]["LastUpdated"] = self._get_istanbul_time()
+            state = self.states[device_id]
+            state["LastUpdated"] = self._get_istanbul_time()
             
             # CRITICAL FIX: Validate all required keys exist before saving
             # This ensures 100% key consistency and prevents missing keys
             default_state = self._get_default_state()
-            required_keys = set(default_state.keys())
-            current_keys = set(self.states[device_id].keys())
-            missing_keys = required_keys - current_keys
+            missing_keys = set(default_state.keys()) - set(state.keys())
             
             if missing_keys:
                 print(f"[STATE] ⚠️ MISSING KEYS DETECTED in {device_name}: {missing_keys}")
                 print(f"[STATE] 🔧 Auto-adding missing keys with default values...")
                 for key in missing_keys:
-                    self.states[device_id][key] = default_state[key]
+                    state[key] = default_state[key]
                     print(f"[STATE]    Added: {key} = {default_state[key]}")
             
-            # Create backup of existing file before overwriting
-            backup_file = state_file + ".backup"
-            if os.path.exists(state_file):
-                try:
-                    import shutil
-                    shutil.copy2(state_file, backup_file)
-                except Exception as backup_error:
-                    print(f"[STATE] ⚠️ Could not create backup for {device_name}: {backup_error}")
+            previous = self._journaled.get(device_id, {})
+            changed = {key: value for key, value in state.items() if previous.get(key, object()) != value}
+            removed = [key for key in previous if key not in state]
+            
+            version = self.versions.get(device_id, 0) + 1
+            self.versions[device_id] = version
+            
+            entry = {"v": version, "set": changed}
+            if removed:
+                entry["del"] = removed
+            critical = bool(CRITICAL_STATE_KEYS.intersection(changed) or removed)
+            direct = not self.owns_journal(device_id)
+            if not direct:
+                self._append_journal(device_id, entry, sync=critical and not flush, previous=previous)
+            journaled = self._journaled.setdefault(device_id, {})
+            journaled.update(copy.deepcopy(changed))
+            for key in removed:
+                journaled.pop(key, None)
             
+            if direct:
+                # Another process owns the journal: the snapshot is the only place to write
+                self._merge_into_snapshot(device_id, changed, removed)
+            elif flush:
+                self._write_snapshot(device_id)
+            else:
+                self._flush_event.set()
+            
+            self._notify(device_id, version, list(changed) + removed)
+            
+        except Exception as e:
+            print(f"[STATE] ❌ CRITICAL - Error saving state for {device_name}: {e}")
+    
+    def _write_snapshot(self, device_id: str):
+        """Compact: atomically write the device's JSON snapshot and empty its journal (device lock held)"""
+        device_name = self._get_device_name(device_id)
+        state_file = self._get_state_file_path(device_name)
+        temp_file = state_file + ".tmp"
+        
+        try:
+            # No .backup copy: the snapshot is only ever replaced atomically and the
+            # journal is kept until the new snapshot is durable
             # ATOMIC WRITE: Write to temporary file first, then rename
             # This prevents file corruption if write is interrupted
-            temp_file = state_file + ".tmp"
-            
             with open(temp_file, 'w') as f:
                 json.dump(self.states[device_id], f, indent=2)
                 f.flush()  # Ensure data is written to disk
-                os.fsync(f.fileno())  # Force write to physical storage
+                with metrics.timer("fsync", device_id):
+                    os.fsync(f.fileno())  # Force write to physical storage
             
             # Atomic rename - replaces old file only after new one is complete
             os.replace(temp_file, state_file)
+            # The rename must reach the disk before the journal is emptied, or a crash
+            # could leave the old snapshot next to an empty journal
+            with metrics.timer("fsync", device_id):
+                _fsync_dir(self.state_dir)
+            self.persist_stats["fsyncs"] += 2
+            self.persist_stats["compactions"] += 1
+            metrics.count("fsyncs", device_id, 2)
+            
+            self._file_mtimes[device_id] = os.stat(state_file).st_mtime_ns
+            self._discard_journal(device_id)
             
         except Exception as e:
+            # The journal still has the changes; compaction is retried on the next pass
             print(f"[STATE] ❌ CRITICAL - Error saving state for {device_name}: {e}")
             # Clean up temp file if it exists
-            temp_file = state_file + ".tmp"
             if os.path.exists(temp_file):
                 try:
                     os.remove(temp_file)
                 except:
                     pass
     
+    def _merge_into_snapshot(self, device_id: str, changed: Dict[str, Any], removed: List[str]):
+        """
+        Non-owner write: apply only the keys this process changed to the current snapshot,
+        so a stale in-memory copy never overwrites what the owner compacted (device lock held)
+        """
+        state_file = self._get_state_file_path(self._get_device_name(device_id))
+        try:
+            with open(state_file, 'r') as f:
+                current = json.load(f)
+        except (OSError, ValueError):
+            current = None  # Missing or unreadable - write our whole state
+        
+        if current is not None:
+            current.update(copy.deepcopy(changed))
+            for key in removed:
+                current.pop(key, None)
+            state = self.states[device_id]
+            state.clear()
+            state.update(current)
+            self._journaled[device_id] = copy.deepcopy(current)
+        self._write_snapshot(device_id)
+    
+    def _get_lock(self, device_id: str):
+        if device_id not in self.locks:
+            self.locks[device_id] = Lock()
+        return self.locks[device_id]
+    
+    def sync_journals(self):
+        """Group commit: fsync every journal with pending appends"""
+        for device_id in list(self._unsynced):
+            with self._get_lock(device_id):
+                if device_id in self._unsynced:
+                    try:
+                        self._sync_journal(device_id)
+                    except Exception as e:
+                        print(f"[STATE] ⚠️ Journal fsync failed for {self._get_device_name(device_id)}: {e}")
+    
+    def compact_due(self):
+        """Compact journals that are large or old enough"""
+        now = time.time()
+        for device_id, first_change in list(self._dirty.items()):
+            if (self._journal_records.get(device_id, 0) >= self.COMPACT_MAX_RECORDS
+                    or now - first_change >= self.COMPACT_INTERVAL):
+                with self._get_lock(device_id):
+                    if device_id in self._dirty and device_id in self.states:
+                        self._write_snapshot(device_id)
+    
+    def flush_all(self):
+        """Compact every device with journaled changes into its snapshot"""
+        for device_id in list(self._dirty):
+            with self._get_lock(device_id):
+                if device_id in self._dirty and device_id in self.states:
+                    self._write_snapshot(device_id)
+    
+    def format_persist_stats(self) -> str:
+        stats = self.persist_stats
+        return (f"State: {stats['mutations']} mutations, {stats['fsyncs']} fsyncs, "
+                f"{stats['compactions']} compactions, {stats['journal_bytes'] / 1024:.0f} KB journaled")
+    
+    def _flush_loop(self):
+        """Background writer: group-commits journals, compacts, and watches for external file edits"""
+        while not self._stop_event.is_set():
+            if self._flush_event.wait(timeout=self.EXTERNAL_CHECK_INTERVAL):
+                self._stop_event.wait(self.JOURNAL_FSYNC_INTERVAL)
+                self._flush_event.clear()
+                self.sync_journals()
+            self.compact_due()
+            
+            for device_id in list(self.states.keys()):
+                if device_id not in self.locks or device_id in self.remote_devices:
+                    continue
+                with self.locks[device_id]:
+                    self._reload_state(device_id)
+    
+    def close(self):
+        """Flush pending changes and stop the background writer"""
+        self._stop_event.set()
+        self.flush_all()
+        for journal in self._journal_files.values():
+            try:
+                journal.close()
+            except Exception:
+                pass
+        self._journal_files.clear()
+        if self.store is not None:
+            self.store.close()
+    
+    def subscribe(self, callback: Callable[[str, int, List[str]], None]):
+        """
+        Call callback(device_id, version, changed_keys) after every state change.
+        Runs on the thread that made the change with the device lock held - keep it short
+        (e.g. loop.call_soon_threadsafe to wake an asyncio task).
+        """
+        self._subscribers.append(callback)
+    
+    def unsubscribe(self, callback: Callable[[str, int, List[str]], None]):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+    
+    def _notify(self, device_id: str, version: int, changed_keys: List[str]):
+        for callback in list(self._subscribers):
+            try:
+                callback(device_id, version, changed_keys)
+            except Exception as e:
+                print(f"[STATE] Subscriber error: {e}")
+    
+    def get_devices_where(self, key: str, *values: Any) -> List[str]:
+        """Device names whose state `key` equals one of `values` (one indexed query with SQLite)"""
+        if self.store is not None:
+            return self.store.devices_where(key, *values)
+        return sorted(self._get_device_name(device_id) for device_id, state in list(self.states.items())
+                      if state.get(key) in values)
+    
+    def get_unlinked_devices(self) -> List[str]:
+        """Configured devices whose account is not linked yet"""
+        linked = set(self.get_devices_where("isLinked", 1, True))
+        return [name for name in self.device_mapping.values() if name not in linked]
+    
+    def all_devices_linked(self) -> bool:
+        return not self.get_unlinked_devices()
+    
+    def set_remote_devices(self, device_ids: Iterable[str]):
+        """
+        Change which devices another process owns. Devices taken back are re-read from
+        their snapshot first (their owner flushed it), so local writes start from disk.
+        """
+        device_ids = set(device_ids)
+        for device_id in device_ids - self.remote_devices:
+            # The new owner takes the journal lock when it starts
+            with self._get_lock(device_id):
+                self._release_journal(device_id)
+        for device_id in self.remote_devices - device_ids:
+            with self._get_lock(device_id):
+                if self.store is None and self._acquire_journal(device_id):
+                    self._start_flusher()
+                self._file_mtimes.pop(device_id, None)  # Force the re-read
+                getattr(self._store_versions, 'devices', {}).pop(device_id, None)
+                self._reload_state(device_id)
+        self.remote_devices = device_ids
+    
+    def apply_remote_changes(self, device_id: str, changed: Dict[str, Any], removed: Iterable[str] = ()):
+        """Mirror a change the owning process made (in memory only) and notify subscribers"""
+        with self._get_lock(device_id):
+            state = self.states.setdefault(device_id, {})
+            journaled = self._journaled.setdefault(device_id, {})
+            removed = [key for key in removed if key in state]
+            for key, value in changed.items():
+                state[key] = value
+                journaled[key] = copy.deepcopy(value)
+            for key in removed:
+                state.pop(key, None)
+                journaled.pop(key, None)
+            version = self.versions.get(device_id, 0) + 1
+            self.versions[device_id] = version
+            self._notify(device_id, version, list(changed) + removed)
+    
+    def get_snapshot(self, device_id: str) -> Tuple[int, Dict[str, Any]]:
+        """(version, state copy) for a device - the version increases with every change"""
+        if device_id.startswith("DEVICE") and device_id[6:].isdigit():
+            device_id = self.reverse_mapping.get(device_id, device_id)
+        if device_id not in self.locks:
+            self.locks[device_id] = Lock()
+        with self.locks[device_id]:
+            return self.versions.get(device_id, 0), copy.deepcopy(self.states.get(device_id, {}))
+    
     def get_state(self, device_id: str) -> Dict[str, Any]:
         """Get current state for a device"""
         # If it's a DEVICE name, convert to IP address
@@ -276,7 +794,7 @@ class DeviceStateManager:
         else:
             actual_device_id = device_id
         
-        with self.locks.get(actual_device_id, Lock()):
+        with self._get_lock(actual_device_id):
             if actual_device_id not in self.states:
                 self.states[actual_device_id] = self._get_default_state()
             
@@ -327,7 +845,7 @@ class DeviceStateManager:
     
     def increment_kon_bonaza_skip(self, device_id: str):
         """Increment Skip_Kon_Bonaza_100Times counter and set Skip_Kon_Bonaza when reaching 100"""
-        with self.locks.get(device_id, Lock()):
+        with self._get_lock(device_id):
             if device_id not in self.states:
                 self.states[device_id] = self._get_default_state()
             
@@ -349,7 +867,7 @@ class DeviceStateManager:
     
     def increment_character_slots_count(self, device_id: str):
         """Increment Character_Slots_Count counter and set Character_Slots_Purchased when reaching 100"""
-        with self.locks.get(device_id, Lock()):
+        with self._get_lock(device_id):
             if device_id not in self.states:
                 self.states[device_id] = self._get_default_state()
             
@@ -371,17 +889,96 @@ class DeviceStateManager:
     
 
     def _reload_state(self, device_id: str):
-        """Reload state from file to ensure fresh data (for multi-device sync)"""
+        """
+        Pick up edits other processes/scripts made to the device file (multi-device sync).
+        Only re-reads the JSON when its mtime differs from the snapshot we last wrote or read;
+        the journal is replayed on top, so uncompacted changes survive the edit.
+        """
+        if self.store is not None:
+            self._reload_from_store(device_id)
+            return
+        
         device_name = self._get_device_name(device_id)
         state_file = self._get_state_file_path(device_name)
         
-        if os.path.exists(state_file):
-            try:
-                with open(state_file, 'r') as f:
-                    loaded_state = json.load(f)
-                self.states[device_id] = loaded_state
-            except Exception as e:
-                print(f"[STATE] Error reloading state for {device_name}: {e}")
+        try:
+            mtime = os.stat(state_file).st_mtime_ns
+        except OSError:
+            return  # Missing file - keep the in-memory state
+        
+        if mtime == self._file_mtimes.get(device_id):
+            return
+        
+        try:
+            with metrics.timer("state_reload", device_id), open(state_file, 'r') as f:
+                loaded_state = json.load(f)
+        except Exception as e:
+            print(f"[STATE] Error reloading state for {device_name}: {e}")
+            return
+        
+        # Changes journaled since the last compaction are newer than the snapshot: keep them on top
+        replayed = self._replay_journal(device_id, loaded_state)
+        if replayed and self.owns_journal(device_id):
+            print(f"[STATE] 🔀 {device_name}.json was edited externally - "
+                  f"re-applied {replayed} uncompacted journal entries")
+        
+        previous = self.states.get(device_id, {})
+        changed = [key for key in set(previous) | set(loaded_state) if previous.get(key) != loaded_state.get(key)]
+        
+        self.states[device_id] = loaded_state
+        self._file_mtimes[device_id] = mtime
+        self._journaled[device_id] = copy.deepcopy(loaded_state)
+        
+        if changed:
+            version = self.versions.get(device_id, 0) + 1
+            self.versions[device_id] = version
+            self._notify(device_id, version, changed)
+    
+    def _reload_from_store(self, device_id: str):
+        """
+        Pick up changes other processes committed to the SQLite store. data_version is
+        per connection (one per thread), so the last value seen is tracked per thread.
+        """
+        seen = getattr(self._store_versions, 'devices', None)
+        if seen is None:
+            seen = self._store_versions.devices = {}
+        data_version = self.store.data_version()
+        if seen.get(device_id) == data_version:
+            return
+        seen[device_id] = data_version
+        
+        device_name = self._get_device_name(device_id)
+        try:
+            with metrics.timer("state_reload", device_id):
+                loaded_state = self.store.load_state(device_name)
+        except Exception as e:
+            print(f"[STATE] Error reloading state for {device_name}: {e}")
+            return
+        if not loaded_state:
+            return
+        for key, value in self._get_default_state().items():
+            loaded_state.setdefault(key, value)
+        
+        previous = self.states.get(device_id, {})
+        changed = [key for key in set(previous) | set(loaded_state) if previous.get(key) != loaded_state.get(key)]
+        if not changed:
+            return
+        
+        self.states[device_id] = loaded_state
+        self._journaled[device_id] = copy.deepcopy(loaded_state)
+        self._dirty.setdefault(device_id, time.time())  # Refresh the JSON mirror
+        version = self.versions.get(device_id, 0) + 1
+        self.versions[device_id] = version
+        self._notify(device_id, version, changed)
+
+    def get_fresh_state(self, device_id: str) -> Dict[str, Any]:
+        """Pick up external edits (file mtime, or the SQLite data_version), then return a copy"""
+        if device_id not in self.locks:
+            self.locks[device_id] = Lock()
+        
+        with self.locks[device_id]:
+            self._reload_state(device_id)
+        return self.get_state(device_id)
 
     def increment_yukio_retry(self, device_id: str) -> int:
         """Increment Yukio Event retry counter with proper locking and state reload"""
@@ -443,8 +1040,7 @@ class DeviceStateManager:
             self.locks[device_id] = Lock()
         
         with self.locks[device_id]:
-            # Always get fresh state from file to avoid stale data
-            self._reload_state(device_id)
+            # In-memory state is authoritative; external file edits are picked up by the flusher thread
             state = self.states.get(device_id, self._get_default_state())
             
             # Special conditional check for Yukio retry count
@@ -453,26 +1049,8 @@ class DeviceStateManager:
                 return retry_count >= 3
             
             # Handle other flag mappings
-            flag_mapping = {
-                "json_EasyMode": "EasyMode",
-                "json_HardMode": "HardMode",
-                "json_SideMode": "SideMode",
-                "json_SubStory": "SubStory",
-                "json_Character_Slots_Purchased": "Character_Slots_Purchased",
-                "json_Recive_Gold_From_Box_For_Characters_Purchase": "Recive_Gold_From_Box_For_Characters_Purchase",
-                "json_Recive_GiftBox": "Recive_GiftBox",
-                "json_Skip_Kon_Bonaza_Complete": "Skip_Kon_Bonaza_100Times",
-                "json_Kon_Bonaza": "Skip_Kon_Bonaza",
-                "json_Skip_Yukio_Event": "Skip_Yukio_Event",
-                "json_Sort_Characters_Lowest_Level": "Sort_Characters_Lowest_Level",
-                "json_Sort_Filter_Ascension": "Sort_Filter_Ascension",
-                "json_Sort_Multi_Select_Garbage_First": "Sort_Multi_Select_Garbage_First",
-                "json_Upgrade_Characters_Level": "Upgrade_Characters_Level",
-                "json_Recive_Giftbox_Orbs": "Recive_Giftbox_Orbs"
-            }
-            
-            if stop_flag in flag_mapping:
-                state_key = flag_mapping[stop_flag]
+            if stop_flag in STOP_SUPPORT_FLAG_MAPPING:
+                state_key = STOP_SUPPORT_FLAG_MAPPING[stop_flag]
                 
                 # Special case for Skip_Kon_Bonaza
                 if stop_flag == "json_Skip_Kon_Bonaza_Complete":
@@ -489,7 +1067,7 @@ class DeviceStateManager:
             # This should only be called from kill_and_restart_game function
             pass
         
-        with self.locks.get(device_id, Lock()):
+        with self._get_lock(device_id):
             if device_id not in self.states:
                 self.states[device_id] = self._get_default_state()
             
@@ -508,7 +1086,7 @@ class DeviceStateManager:
     def update_account_info(self, device_id: str, account_id: str = None, username: str = None, 
                            orbs: int = None, email: str = None, password: str = None):
         """Update account information for a device"""
-        with self.locks.get(device_id, Lock()):
+        with self._get_lock(device_id):
             if device_id not in self.states:
                 self.states[device_id] = self._get_default_state()
             
@@ -531,7 +1109,7 @@ class DeviceStateManager:
     
     def mark_hard_mode_complete(self, device_id: str):
         """Mark HardMode as complete (and EasyMode if not already)"""
-        with self.locks.get(device_id, Lock()):
+        with self._get_lock(device_id):
             if device_id not in self.states:
                 self.states[device_id] = self._get_default_state()
             
@@ -541,7 +1119,7 @@ class DeviceStateManager:
     
     def mark_side_mode_active(self, device_id: str):
         """Mark that SideMode is active (EasyMode and HardMode must be complete)"""
-        with self.locks.get(device_id, Lock()):
+        with self._get_lock(device_id):
             if device_id not in self.states:
                 self.states[device_id] = self._get_default_state()
             
@@ -656,7 +1234,7 @@ class DeviceStateManager:
     
     def update_session_stats(self, device_id: str, task_name: str):
         """Update session statistics"""
-        with self.locks.get(device_id, Lock()):
+        with self._get_lock(device_id):
             if device_id not in self.states:
                 self.states[device_id] = self._get_default_state()
             
@@ -734,6 +1312,10 @@ class DeviceStateManager:
         """Initialize the currentlyStock.json file with auto-generation"""
         stock_file = self._get_stock_file_path()
         
+        if self.store is not None and self.store.get_stock() is None:
+            # First start with SQLite - seed the counter from the JSON file
+            self.store.set_stock(self._load_stock_data().get("STOCK", 1))
+        
         # Check if file exists, if not create it with default values
         if not os.path.exists(stock_file):
             self._create_default_stock_file()
@@ -799,16 +1381,28 @@ class DeviceStateManager:
     
     def get_current_stock(self) -> int:
         """Get current stock value"""
+        if self.store is not None:
+            stock = self.store.get_stock()
+            return stock if stock is not None else 1
         stock_data = self._load_stock_data()
         return stock_data.get("STOCK", 1)
     
     def increment_stock(self, device_id: str = None) -> int:
         """Increment stock value by 1 and return new value"""
-        stock_data = self._load_stock_data()
-        current_stock = stock_data.get("STOCK", 1)
-        new_stock = current_stock + 1
-        stock_data["STOCK"] = new_stock
-        self._save_stock_data(stock_data)
+        if self.stock_forwarder is not None:
+            return self.stock_forwarder(device_id)
+        
+        with self.stock_lock:
+            if self.store is not None:
+                # Atomic across processes; currentlyStock.json is kept as a mirror
+                current_stock, new_stock = self.store.increment_stock()
+                self._save_stock_data({"STOCK": new_stock})
+            else:
+                stock_data = self._load_stock_data()
+                current_stock = stock_data.get("STOCK", 1)
+                new_stock = current_stock + 1
+                stock_data["STOCK"] = new_stock
+                self._save_stock_data(stock_data)
         
         # Log the increment with device info if provided
         if device_id:
@@ -821,10 +1415,13 @@ class DeviceStateManager:
     
     def set_stock(self, value: int, device_id: str = None) -> int:
         """Set stock to a specific value"""
-        stock_data = self._load_stock_data()
-        old_stock = stock_data.get("STOCK", 1)
-        stock_data["STOCK"] = value
-        self._save_stock_data(stock_data)
+        with self.stock_lock:
+            old_stock = self.get_current_stock()
+            if self.store is not None:
+                self.store.set_stock(value)
+            stock_data = self._load_stock_data()
+            stock_data["STOCK"] = value
+            self._save_stock_data(stock_data)
         
         # Log the change with device info if provided
         if device_id:
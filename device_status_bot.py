@@ -1,3 +1,4 @@
+import html
 import json
 import os
 import asyncio
@@ -18,7 +19,10 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class DeviceStatusBot:
-    def __init__(self, bot_token: str, chat_id: str, thread_id: int = None):
+    UPDATE_INTERVAL = 300  # Periodic refresh (seconds)
+    MIN_CHANGE_UPDATE_INTERVAL = 30  # Rate limit for change-triggered refreshes (seconds)
+    
+    def __init__(self, bot_token: str, chat_id: str, thread_id: int = None, state_manager=None):
         """
         Initialize the Telegram bot for device status monitoring.
         
@@ -26,6 +30,8 @@ class DeviceStatusBot:
             bot_token: Telegram bot token
             chat_id: Target chat ID (-1001324257791)
             thread_id: Topic/thread ID for groups with topics (28415)
+            state_manager: In-process DeviceStateManager; when given, device data is read
+                from memory and state changes trigger refreshes instead of file polling
         """
         self.bot = Bot(token=bot_token)
         self.chat_id = chat_id
@@ -34,6 +40,11 @@ class DeviceStatusBot:
         self.message_id = None
         self.new_stock_requested = False  # Variable to track new stock requests
         
+        self.state_manager = state_manager
+        self.state_changed: Optional[asyncio.Event] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.last_message_text = None
+        
         # Timezone setup
         self.germany_tz = pytz.timezone('Europe/Berlin')
         self.istanbul_tz = pytz.timezone('Europe/Istanbul')
@@ -59,7 +70,11 @@ class DeviceStatusBot:
             return "🖥️ Unknown Server"
     
     def load_device_data(self, device_number: int) -> Optional[Dict]:
-        """Load device data from JSON file."""
+        """Load device data from the in-process state manager, or its JSON file."""
+        if self.state_manager is not None:
+            _, state = self.state_manager.get_snapshot(f"DEVICE{device_number}")
+            return state or None
+        
         file_path = os.path.join(self.device_states_dir, f"DEVICE{device_number}.json")
         
         if not os.path.exists(file_path):
@@ -275,6 +290,9 @@ class DeviceStatusBot:
     
     def check_all_devices_linked(self) -> bool:
         """Check if all 10 devices have isLinked: true"""
+        if self.state_manager is not None:
+            return self.state_manager.all_devices_linked()
+        
         for device_num in range(1, 11):
             device_data = self.load_device_data(device_num)
             if not device_data or not device_data.get("isLinked", False):
@@ -286,6 +304,9 @@ class DeviceStatusBot:
         try:
             message_text = self.create_full_message()
             
+            if self.message_id is not None and message_text == self.last_message_text:
+                return  # Telegram rejects edits that change nothing
+            
             if self.message_id is None:
                 # Send new message
                 send_kwargs = {
@@ -310,6 +331,8 @@ class DeviceStatusBot:
                 
                 await self.bot.edit_message_text(**edit_kwargs)
                 logger.info(f"Updated message ID: {self.message_id}")
+            
+            self.last_message_text = message_text
                 
         except Exception as e:
             error_message = str(e).lower()
@@ -332,15 +355,39 @@ class DeviceStatusBot:
                 # For other errors, keep trying to update the same message
                 logger.error(f"Error updating message (will retry with same message_id): {e}")
     
+    def _on_state_change(self, device_id: str, version: int, changed_keys: List[str]):
+        """DeviceStateManager subscriber - runs on the writer's thread, so only wake the loop"""
+        if self.loop is not None and changed_keys != ["LastUpdated"]:
+            self.loop.call_soon_threadsafe(self.state_changed.set)
+    
+    async def wait_for_next_update(self):
+        """Sleep until the periodic refresh, or until device state changes (rate limited)"""
+        if self.state_manager is None:
+            await asyncio.sleep(self.UPDATE_INTERVAL)
+            return
+        
+        await asyncio.sleep(self.MIN_CHANGE_UPDATE_INTERVAL)
+        try:
+            await asyncio.wait_for(self.state_changed.wait(),
+                                   self.UPDATE_INTERVAL - self.MIN_CHANGE_UPDATE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        self.state_changed.clear()
+    
     async def start_monitoring(self):
-        """Start the monitoring loop that updates every 5 minutes."""
+        """Start the monitoring loop that updates every 5 minutes (and on state changes when in-process)."""
         logger.info("Starting device status monitoring...")
         
+        if self.state_manager is not None:
+            self.loop = asyncio.get_running_loop()
+            self.state_changed = asyncio.Event()
+            self.state_manager.subscribe(self._on_state_change)
+        
         while True:
             try:
                 await self.send_or_update_message()
-                logger.info("Message updated successfully. Waiting 5 minutes...")
-                await asyncio.sleep(300)  # 5 minutes = 300 seconds
+                logger.info("Message updated successfully. Waiting for next update...")
+                await self.wait_for_next_update()
                 
             except KeyboardInterrupt:
                 logger.info("Monitoring stopped by user")
@@ -400,6 +447,17 @@ class DeviceStatusBot:
                                     **{"message_thread_id": self.thread_id} if self.thread_id else {}
                                 )
                                 logger.info(f"New stock request denied from {username} - Not all devices linked")
+                        
+                        # Handle /profile [seconds] - samples this process (and shard workers) for a while
+                        elif (text == "/profile" or
+                              text.startswith("/profile ") or
+                              text.startswith("/profile@") or
+                              "@bbs_farming_bot" in text.lower() and "/profile" in text):
+                            
+                            words = text.split()
+                            seconds = float(words[1]) if len(words) > 1 and words[1].replace(".", "", 1).isdigit() else None
+                            asyncio.create_task(self.run_profile(update.message, seconds))
+                            logger.info(f"Profile requested from {username} in {chat_type} chat")
                     
                     offset = update.update_id + 1
                         
@@ -407,6 +465,38 @@ class DeviceStatusBot:
                 logger.error(f"Error handling updates: {e}")
                 await asyncio.sleep(5)
     
+    async def run_profile(self, message, seconds: Optional[float] = None):
+        """Run the sampling profiler and reply with its top-functions summary."""
+        from sampling_profiler import sampling_profiler
+        
+        reply_kwargs = {"chat_id": message.chat_id, "reply_to_message_id": message.message_id}
+        if self.thread_id:
+            reply_kwargs["message_thread_id"] = self.thread_id
+        
+        if sampling_profiler.running:
+            await self.bot.send_message(text="⏳ A profile is already running", **reply_kwargs)
+            return
+        
+        duration = min(seconds or sampling_profiler.default_seconds, sampling_profiler.max_seconds)
+        await self.bot.send_message(text=f"🔬 Profiling for {duration:.0f}s...", **reply_kwargs)
+        try:
+            result = await sampling_profiler.profile(duration)
+        except Exception as e:
+            logger.error(f"Profiling failed: {e}")
+            await self.bot.send_message(text=f"❌ Profiling failed: {e}", **reply_kwargs)
+            return
+        if result is None:
+            await self.bot.send_message(text="⏳ A profile is already running", **reply_kwargs)
+            return
+        
+        # Telegram messages are limited to 4096 characters
+        summary = result.summary[:3500]
+        await self.bot.send_message(
+            text=f"{self.rdp_server} profile: {result.collapsed_path}\n\n<pre>{html.escape(summary)}</pre>",
+            parse_mode=ParseMode.HTML,
+            **reply_kwargs
+        )
+    
     async def run_bot(self):
         """Run both status monitoring and command listening."""
         # Start both tasks concurrently
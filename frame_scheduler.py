@@ -0,0 +1,192 @@
+"""
+Central frame scheduler: one owner for the capture cadence of every device.
+
+Each device loop used to sleep its own adaptive interval and capture whenever it woke up, so
+ten devices' captures overlapped in bursts and host load was whatever the loops added up to.
+Now a device loop reports its state after every frame and gets a deadline for the next one:
+
+    frame_scheduler.schedule(device_id, "static")      # or "active", "keep_checking", ...
+    await frame_scheduler.wait_turn(device_id)          # sleeps until the deadline
+    frame = await frame_scheduler.next_frame(device_id, tasks)
+
+next_frame() queues the request with the central dispatcher, which grants captures in
+earliest-deadline order, at most FRAME_CAPTURE_BUDGET_FPS per second across all devices (split
+between shard workers by how many devices each owns) and MAX_CONCURRENT_SCREENSHOTS at a time, captures the frame and hands it back to that device's
+matcher. When the budget is short every device slips by about the same amount instead of
+the fastest loops starving the rest.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import settings
+from actions import screenshot_manager
+from device_state_manager import OWNED_DEVICES_ENV
+
+# Seconds until the next frame per device state (FRAME_SCHEDULER_INTERVALS overrides)
+DEFAULT_INTERVALS = {
+    "keep_checking": 0.1,   # Waiting for one specific task to appear
+    "active": 0.2,          # Tasks matched recently
+    "idle": 0.4,            # No matches for 5+ frames (was the adaptive 1.5x/2x interval)
+    "static": 1.0,          # Frame fingerprint unchanged for several frames
+    "text_input": 0.5,      # Typing in progress - re-check when it should be done
+    "fetch": 1.0,           # Account fetch running - nothing to capture
+    "error": 1.0,
+}
+
+
+class FrameScheduler:
+    """Per-device deadlines plus a global capture budget, dispatched in deadline order"""
+
+    def __init__(self, budget_fps: float = 0, max_concurrent: int = 10,
+                 intervals: Optional[Dict[str, float]] = None, enabled: bool = True):
+        self.budget_fps = budget_fps
+        self.max_concurrent = max_concurrent
+        self.intervals = dict(DEFAULT_INTERVALS, **(intervals or {}))
+        self.enabled = enabled
+        self.deadlines: Dict[str, float] = {}
+        self.states: Dict[str, str] = {}
+        # Dispatcher state, bound to the event loop it runs in
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.dispatcher: Optional[asyncio.Task] = None
+        self.waiting: List[tuple] = []
+        self.wakeup: Optional[asyncio.Event] = None
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.sequence = itertools.count()
+        self.tokens = 0.0
+        self.last_refill = time.monotonic()
+        self.stats = defaultdict(lambda: {'frames': 0, 'lateness_total': 0.0, 'max_lateness': 0.0})
+        self.started_at = time.monotonic()
+
+    # --- Deadlines ---
+
+    def schedule(self, device_id: str, state: str, until: Optional[float] = None):
+        """Set the next frame deadline from the device's state (`until`: absolute time.time())"""
+        self.states[device_id] = state
+        if until is not None:
+            delay = until - time.time()
+        else:
+            delay = self.intervals.get(state, self.intervals["active"])
+        self.deadlines[device_id] = time.monotonic() + max(0.0, delay)
+
+    async def wait_turn(self, device_id: str):
+        """Sleep until the device's deadline (re-reading it, in case it was rescheduled)"""
+        while True:
+            remaining = self.deadlines.get(device_id, 0.0) - time.monotonic()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(min(remaining, 0.5))
+
+    # --- Capture dispatch ---
+
+    def _ensure_dispatcher(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop or self.dispatcher is None or self.dispatcher.done():
+            self.loop = loop
+            self.waiting = []
+            self.wakeup = asyncio.Event()
+            self.semaphore = asyncio.Semaphore(max(1, self.max_concurrent))
+            self.tokens = float(self.max_concurrent)
+            self.last_refill = time.monotonic()
+            self.dispatcher = loop.create_task(self._dispatch_loop())
+
+    async def next_frame(self, device_id: str, tasks: list):
+        """Capture this device's next frame once the dispatcher grants it (None if capture failed)"""
+        if not self.enabled:
+            return await self._capture(device_id, tasks)
+        self._ensure_dispatcher()
+        future = self.loop.create_future()
+        deadline = self.deadlines.get(device_id, time.monotonic())
+        heapq.heappush(self.waiting, (deadline, next(self.sequence), device_id, tasks, future))
+        self.wakeup.set()
+        return await future
+
+    async def _take_token(self):
+        """Token bucket: FRAME_CAPTURE_BUDGET_FPS refill, bursts up to max_concurrent"""
+        if self.budget_fps <= 0:
+            return
+        while True:
+            now = time.monotonic()
+            self.tokens = min(float(self.max_concurrent), self.tokens + (now - self.last_refill) * self.budget_fps)
+            self.last_refill = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.budget_fps)
+
+    async def _dispatch_loop(self):
+        while True:
+            if not self.waiting:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            await self._take_token()
+            await self.semaphore.acquire()
+            deadline, _, device_id, tasks, future = heapq.heappop(self.waiting)
+            if future.done():  # Device loop was cancelled while waiting
+                self.semaphore.release()
+                continue
+            lateness = max(0.0, time.monotonic() - deadline)
+            stats = self.stats[device_id]
+            stats['frames'] += 1
+            stats['lateness_total'] += lateness
+            stats['max_lateness'] = max(stats['max_lateness'], lateness)
+            self.loop.create_task(self._capture_for(device_id, tasks, future))
+
+    async def _capture_for(self, device_id: str, tasks: list, future: asyncio.Future):
+        try:
+            frame = await self._capture(device_id, tasks)
+        finally:
+            self.semaphore.release()
+        if not future.done():
+            future.set_result(frame)
+
+    async def _capture(self, device_id: str, tasks: list):
+        try:
+            # Only the rows these tasks read are captured when ROI_PARTIAL_CAPTURE is on
+            return await screenshot_manager.get_screenshot_for_tasks(device_id, tasks)
+        except Exception:
+            return None
+
+    # --- Stats ---
+
+    def format_stats(self, device_id: str) -> str:
+        stats = self.stats[device_id]
+        total_frames = sum(device['frames'] for device in self.stats.values())
+        elapsed = max(1e-6, time.monotonic() - self.started_at)
+        budget = f"{self.budget_fps:.0f}" if self.budget_fps > 0 else "unlimited"
+        lateness = stats['lateness_total'] / stats['frames'] * 1000 if stats['frames'] else 0.0
+        return (f"frame scheduler: state {self.states.get(device_id, '-')}, {stats['frames']} frames, "
+                f"late avg {lateness:.0f}ms (max {stats['max_lateness'] * 1000:.0f}ms); "
+                f"all devices {total_frames / elapsed:.1f} fps of {budget} budget, {len(self.waiting)} waiting")
+
+
+def _configured_intervals() -> Dict[str, float]:
+    """BACKGROUND_CHECK_INTERVAL sets the active cadence (idle is twice that), then the overrides"""
+    check_interval = getattr(settings, 'BACKGROUND_CHECK_INTERVAL', DEFAULT_INTERVALS["active"])
+    intervals = {"active": check_interval, "idle": check_interval * 2}
+    intervals.update(getattr(settings, 'FRAME_SCHEDULER_INTERVALS', None) or {})
+    return intervals
+
+
+def _process_budget_fps() -> float:
+    """This process's share of FRAME_CAPTURE_BUDGET_FPS: a shard worker gets its devices' fraction"""
+    budget = getattr(settings, 'FRAME_CAPTURE_BUDGET_FPS', 0)
+    owned = [device_id for device_id in os.environ.get(OWNED_DEVICES_ENV, "").split(",") if device_id]
+    device_count = len(getattr(settings, 'DEVICE_IDS', []))
+    if budget > 0 and owned and device_count:
+        return budget * min(1.0, len(owned) / device_count)
+    return budget
+
+
+# Global scheduler
+frame_scheduler = FrameScheduler(
+    budget_fps=_process_budget_fps(),
+    max_concurrent=getattr(settings, 'MAX_CONCURRENT_SCREENSHOTS', 10),
+    intervals=_configured_intervals(),
+    enabled=getattr(settings, 'FRAME_SCHEDULER_ENABLED', True),
+)
@@ -0,0 +1,299 @@
+"""
+Game-font glyph OCR for fixed-position fields (orb counter, account ID).
+
+The in-game font never changes and these fields always sit at the same place, so instead of
+running EasyOCR/Tesseract dozens of times and voting, the field's ROI is binarized, split into
+connected components (components stacked in the same column - ':' - are merged) and every
+glyph is matched against a glyph set harvested from recorded frames. Spaces are wide gaps,
+with the space width learned during harvesting. Each read takes well under a millisecond and
+returns the text plus a confidence per glyph; callers fall back to EasyOCR when it is low.
+
+    python glyph_ocr.py harvest orbs 21,137 frame1.png [frame2.png ...]
+    python glyph_ocr.py harvest account_id "ID: 95 473 697" frame.png
+    python glyph_ocr.py read orbs frame.png
+
+Glyph sets live in templates/glyphs/<field>.npz.
+"""
+import os
+import sys
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
+GLYPH_DIR = os.path.join("templates", "glyphs")
+
+# Field name -> ROI (x, y, w, h) on the 960x540 frame
+GLYPH_FIELDS: Dict[str, Tuple[int, int, int, int]] = {
+    "orbs": (722, 5, 57, 29),          # Union of extract_orbs_ultra_robust's ROI variations
+    "account_id": (453, 7, 137, 54),   # tasks/extract_account_id.py
+}
+
+# Normalized glyph bitmap size (rows, cols)
+GLYPH_SIZE = (24, 16)
+# Glyph boxes span this multiple of the digit height from the digit top (keeps comma position)
+GLYPH_BOX_RATIO = 1.35
+# Score penalty per unit of aspect ratio difference (a stretched '1' is not a '7')
+ASPECT_PENALTY = 0.5
+# A best-vs-runner-up score margin of this much or more keeps the full match score as confidence
+FULL_CONFIDENCE_MARGIN = 0.1
+# Samples kept per character; near-duplicates (score above this) are not added
+MAX_SAMPLES_PER_CHAR = 8
+DUPLICATE_SCORE = 0.985
+
+
+class GlyphReading(NamedTuple):
+    text: str
+    glyph_confidences: Tuple[float, ...]
+    confidence: float  # Lowest glyph confidence
+
+
+class _Glyph(NamedTuple):
+    x: int
+    width: int
+    vector: np.ndarray  # Zero-mean, unit-norm flattened bitmap
+    aspect: float
+
+
+def _binarize(roi_img: np.ndarray) -> np.ndarray:
+    """Otsu threshold with the minority class as text (light-on-dark or dark-on-light)"""
+    gray = cv2.cvtColor(roi_img, cv2.COLOR_RGB2GRAY) if roi_img.ndim == 3 else roi_img
+    _, binary = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    if binary.mean() > 0.5:
+        binary = 1 - binary
+    return binary
+
+
+def _normalize(bitmap: np.ndarray) -> np.ndarray:
+    vector = bitmap.astype(np.float32).ravel()
+    vector -= vector.mean()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def segment(roi_img: np.ndarray) -> List[_Glyph]:
+    """Split a field crop into glyphs, left to right"""
+    binary = _binarize(roi_img)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    roi_h = binary.shape[0]
+    boxes = []
+    for label in range(1, count):
+        x, y, w, h, area = stats[label]
+        # Specks and background bands spanning the whole ROI height
+        if area < 2 or h >= roi_h:
+            continue
+        boxes.append([x, y, x + w, y + h])
+    if not boxes:
+        return []
+
+    # Merge components sharing a column ('i', ':', broken strokes)
+    boxes.sort()
+    merged = [boxes[0]]
+    for box in boxes[1:]:
+        last = merged[-1]
+        overlap = min(last[2], box[2]) - max(last[0], box[0])
+        if overlap >= 0.5 * min(last[2] - last[0], box[2] - box[0]):
+            merged[-1] = [min(last[0], box[0]), min(last[1], box[1]), max(last[2], box[2]), max(last[3], box[3])]
+        else:
+            merged.append(box)
+
+    # Reference line from the tall glyphs (digits/letters), so commas keep their low position
+    heights = np.array([box[3] - box[1] for box in merged])
+    tall = [box for box, height in zip(merged, heights) if height >= 0.6 * heights.max()]
+    line_top = min(box[1] for box in tall)
+    line_h = max(box[3] - box[1] for box in tall)
+    box_h = int(round(line_h * GLYPH_BOX_RATIO))
+
+    padded = np.zeros((line_top + box_h + roi_h, binary.shape[1]), dtype=np.uint8)
+    padded[:roi_h] = binary
+    glyphs = []
+    for x0, _, x1, _ in merged:
+        cell = padded[line_top:line_top + box_h, x0:x1] * 255
+        bitmap = cv2.resize(cell, (GLYPH_SIZE[1], GLYPH_SIZE[0]), interpolation=cv2.INTER_AREA)
+        glyphs.append(_Glyph(x0, x1 - x0, _normalize(bitmap), (x1 - x0) / line_h))
+    return glyphs
+
+
+class GlyphSet:
+    """Labelled glyph samples for one field"""
+
+    def __init__(self, field: str):
+        self.field = field
+        self.path = os.path.join(GLYPH_DIR, f"{field}.npz")
+        self.vectors = np.zeros((0, GLYPH_SIZE[0] * GLYPH_SIZE[1]), dtype=np.float32)
+        self.labels: List[str] = []
+        self.aspects = np.zeros(0, dtype=np.float32)
+        # Widest gap seen inside a word / narrowest gap seen at a space (pixels)
+        self.char_gap_max = 0
+        self.space_gap_min = 0
+
+    @property
+    def space_gap(self) -> float:
+        """Gaps wider than this are spaces (never, if no space was harvested)"""
+        if not self.space_gap_min:
+            return float("inf")
+        return (self.char_gap_max + self.space_gap_min) / 2
+
+    def load(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        try:
+            data = np.load(self.path)
+            self.vectors = data["vectors"].astype(np.float32)
+            self.labels = [str(label) for label in data["labels"]]
+            self.aspects = data["aspects"].astype(np.float32)
+            self.char_gap_max, self.space_gap_min = (int(gap) for gap in data["gaps"])
+        except Exception as e:
+            print(f"[GLYPH] Could not load {self.path}: {e}")
+            return False
+        return True
+
+    def save(self):
+        os.makedirs(GLYPH_DIR, exist_ok=True)
+        tmp = self.path + ".tmp.npz"
+        np.savez(tmp, vectors=self.vectors, labels=np.array(self.labels),
+                 aspects=self.aspects, gaps=np.array([self.char_gap_max, self.space_gap_min]))
+        os.replace(tmp, self.path)
+
+    def add(self, glyph: _Glyph, label: str) -> bool:
+        same = [i for i, existing in enumerate(self.labels) if existing == label]
+        if len(same) >= MAX_SAMPLES_PER_CHAR:
+            return False
+        if same and float((self.vectors[same] @ glyph.vector).max()) > DUPLICATE_SCORE:
+            return False
+        self.vectors = np.vstack([self.vectors, glyph.vector[None, :]])
+        self.labels.append(label)
+        self.aspects = np.append(self.aspects, np.float32(glyph.aspect))
+        return True
+
+    def classify(self, glyphs: List[_Glyph]) -> List[Tuple[str, float]]:
+        """(label, confidence) per glyph: match score, reduced when the runner-up label is close"""
+        samples = np.stack([glyph.vector for glyph in glyphs])
+        aspects = np.array([glyph.aspect for glyph in glyphs], dtype=np.float32)
+        scores = samples @ self.vectors.T - ASPECT_PENALTY * np.abs(aspects[:, None] - self.aspects[None, :])
+
+        labels = np.array(self.labels)
+        results = []
+        for row in scores:
+            best = int(row.argmax())
+            others = row[labels != labels[best]]
+            runner_up = float(others.max()) if others.size else -1.0
+            score = max(0.0, float(row[best]))
+            margin = float(row[best]) - runner_up
+            results.append((self.labels[best], score * min(1.0, margin / FULL_CONFIDENCE_MARGIN)))
+        return results
+
+
+class GlyphOCR:
+    """Reads GLYPH_FIELDS with their harvested glyph sets"""
+
+    def __init__(self):
+        self.sets: Dict[str, Optional[GlyphSet]] = {}
+
+    def glyph_set(self, field: str) -> Optional[GlyphSet]:
+        if field not in self.sets:
+            glyph_set = GlyphSet(field)
+            self.sets[field] = glyph_set if glyph_set.load() and glyph_set.labels else None
+        return self.sets[field]
+
+    def available(self, field: str) -> bool:
+        return CV2_AVAILABLE and self.glyph_set(field) is not None
+
+    def read(self, screenshot: np.ndarray, field: str,
+             roi: Optional[Tuple[int, int, int, int]] = None) -> Optional[GlyphReading]:
+        """Read a field; None if it has no glyph set or nothing was segmented"""
+        if not self.available(field):
+            return None
+        x, y, w, h = roi or GLYPH_FIELDS[field]
+        roi_img = screenshot[y:y+h, x:x+w]
+        if roi_img.size == 0:
+            return None
+        glyphs = segment(roi_img)
+        if not glyphs:
+            return None
+
+        glyph_set = self.sets[field]
+        text = []
+        confidences = []
+        previous_end = None
+        for glyph, (label, confidence) in zip(glyphs, glyph_set.classify(glyphs)):
+            if previous_end is not None and glyph.x - previous_end > glyph_set.space_gap:
+                text.append(' ')
+            text.append(label)
+            confidences.append(round(confidence, 3))
+            previous_end = glyph.x + glyph.width
+        return GlyphReading(''.join(text), tuple(confidences), min(confidences))
+
+    def harvest(self, screenshot: np.ndarray, field: str, text: str,
+                roi: Optional[Tuple[int, int, int, int]] = None) -> int:
+        """Add the glyphs of a frame whose field reads `text`; returns how many samples were new"""
+        x, y, w, h = roi or GLYPH_FIELDS[field]
+        glyphs = segment(screenshot[y:y+h, x:x+w])
+        chars = [char for char in text if char != ' ']
+        if len(glyphs) != len(chars):
+            raise ValueError(f"segmented {len(glyphs)} glyphs but '{text}' has {len(chars)} characters")
+
+        glyph_set = self.glyph_set(field) or GlyphSet(field)
+        self.sets[field] = glyph_set
+        added = sum(glyph_set.add(glyph, char) for glyph, char in zip(glyphs, chars))
+
+        # Learn the space width from the gaps between consecutive glyphs
+        followed_by_space = [i + 1 < len(text) and text[i + 1] == ' '
+                             for i, char in enumerate(text) if char != ' ']
+        for glyph, following, space in zip(glyphs, glyphs[1:], followed_by_space):
+            gap = following.x - (glyph.x + glyph.width)
+            if space:
+                glyph_set.space_gap_min = min(glyph_set.space_gap_min or gap, gap)
+            else:
+                glyph_set.char_gap_max = max(glyph_set.char_gap_max, gap)
+        glyph_set.save()
+        return added
+
+
+# Global reader
+glyph_ocr = GlyphOCR()
+
+
+def _load_frame(path: str) -> np.ndarray:
+    frame = cv2.imread(path, cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError(f"can't read {path}")
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+
+if __name__ == "__main__":
+    # Run from the project root so templates/glyphs resolves
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    if not CV2_AVAILABLE or len(sys.argv) < 4 or sys.argv[1] not in ("harvest", "read"):
+        print(__doc__)
+        sys.exit(1)
+
+    command, field = sys.argv[1], sys.argv[2]
+    if command == "harvest":
+        text = sys.argv[3]
+        for path in sys.argv[4:]:
+            try:
+                added = glyph_ocr.harvest(_load_frame(path), field, text)
+                print(f"[GLYPH] {path}: {added} new samples")
+            except ValueError as e:
+                print(f"[GLYPH] ⚠️ {path}: {e}")
+        glyph_set = glyph_ocr.glyph_set(field)
+        if glyph_set is not None:
+            print(f"[GLYPH] {field}: {len(glyph_set.labels)} samples of {''.join(sorted(set(glyph_set.labels)))}, "
+                  f"space gap {glyph_set.space_gap:.1f}px")
+    else:
+        for path in sys.argv[3:]:
+            frame = _load_frame(path)
+            reading = glyph_ocr.read(frame, field)
+            runs = 200
+            start = time.perf_counter()
+            for _ in range(runs):
+                glyph_ocr.read(frame, field)
+            elapsed_ms = (time.perf_counter() - start) / runs * 1000
+            print(f"[GLYPH] {path}: {reading} ({elapsed_ms:.3f} ms/read)")
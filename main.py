@@ -17,8 +17,11 @@ try:
     from screenrecord_manager import cleanup_all_screenrecord
     from logical_process import run_hard_mode_swipes, handle_game_ready_routing, run_first_match_script
     from device_state_manager import device_state_manager
-    from actions import run_adb_command
+    from actions import run_adb_command, template_cache
     from device_status_bot import DeviceStatusBot  # Import the telegram bot
+    from sharded_runtime import ShardSupervisor
+    from metrics import metrics
+    from sampling_profiler import sampling_profiler
 except ImportError as e:
     print(f"❌ Import Error: {e}")
     print("\nPlease make sure all required modules are present and installed.")
@@ -63,7 +66,7 @@ async def start_telegram_bot():
     THREAD_ID = 28415
     
     print("📱 Starting Telegram bot...")
-    telegram_bot = DeviceStatusBot(BOT_TOKEN, CHAT_ID, THREAD_ID)
+    telegram_bot = DeviceStatusBot(BOT_TOKEN, CHAT_ID, THREAD_ID, state_manager=device_state_manager)
     
     try:
         await telegram_bot.run_bot()
@@ -135,6 +138,14 @@ async def run_monitoring_with_logical_tasks():
         
         await optimize_emulators()
         
+        print("🖼️ Loading template atlas...")
+        template_cache.preload()
+        
+        # Latency histograms on /metrics when ENABLE_PROFILING is on
+        metrics.start()
+        # Idle until a profile is requested (SIGUSR1, PROFILER_PORT or /profile in Telegram)
+        sampling_profiler.install()
+        
         print("📊 Printing device states...")
         device_state_manager.print_all_device_states()
         
@@ -142,15 +153,24 @@ async def run_monitoring_with_logical_tasks():
         bot_task = asyncio.create_task(start_telegram_bot())
         print("✅ Telegram bot started in background")
         
-        # Create monitoring tasks for each device
-        print("🚀 Creating monitoring tasks...")
         device_tasks = []
-        for device_id in settings.DEVICE_IDS:
-            print(f"📋 Creating task for {device_id}")
-            task = asyncio.create_task(monitor_single_device_with_logical_tasks(device_id))
-            device_tasks.append(task)
-        
-        print(f"✅ Created {len(device_tasks)} monitoring tasks")
+        shard_workers = getattr(settings, 'SHARD_WORKERS', 0)
+        if shard_workers > 1:
+            # Devices are monitored by worker processes; this process supervises them
+            print(f"🧩 Starting {shard_workers} shard worker processes...")
+            supervisor = ShardSupervisor(settings.DEVICE_IDS, shard_workers,
+                                         monitor_single_device_with_logical_tasks)
+            device_tasks.append(asyncio.create_task(supervisor.run()))
+        else:
+            # Create monitoring tasks for each device
+            print("🚀 Creating monitoring tasks...")
+            for device_id in settings.DEVICE_IDS:
+                print(f"📋 Creating task for {device_id}")
+                task = asyncio.create_task(monitor_single_device_with_logical_tasks(device_id),
+                                           name=f"device:{device_id}")
+                device_tasks.append(task)
+            
+            print(f"✅ Created {len(device_tasks)} monitoring tasks")
         print("🔄 Starting parallel monitoring...")
         
         # Run all tasks together (bot + device monitoring)
@@ -0,0 +1,235 @@
+"""
+Hot-path latency histograms and throughput counters.
+
+Enabled by ENABLE_PROFILING. Each hot-path stage (screencap, decode, task_filter, pixel_match,
+template_match, ocr, ocr_orbs, tap, adb, fsync, state_reload) is timed per device into a
+fixed-bucket histogram, and counters track frames, matches, adb calls, fsyncs and OCR calls:
+
+    with metrics.timer("screencap", device_id):
+        stdout = await run_adb_command("exec-out screencap", device_id)
+    metrics.count("frames", device_id)
+
+In streaming mode `screencap` is the copy of the latest published frame and `decode` the
+publish of each frame ffmpeg emits.
+
+metrics.start() serves everything in Prometheus text format on
+http://METRICS_HOST:METRICS_PORT/metrics and prints a one-line summary every
+METRICS_SUMMARY_INTERVAL seconds. Both the rates and the p95 per stage in that line cover only
+the time since the previous summary. Shard workers serve on METRICS_PORT + 1 + index.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+import settings
+
+# Histogram upper bounds in seconds (Prometheus `le` labels)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Counters shown as rates in the console summary (name -> label)
+SUMMARY_COUNTERS = {"frames": "frames", "matches": "matches", "adb_calls": "adb",
+                    "fsyncs": "fsyncs", "ocr_calls": "OCR"}
+
+
+class Histogram:
+    """Per-bucket (non-cumulative) counts plus sum/count; quantiles are bucket upper bounds"""
+
+    __slots__ = ("buckets", "total", "count")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)  # Last slot: above the largest bound
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def merge(self, other: "Histogram"):
+        for i, n in enumerate(other.buckets):
+            self.buckets[i] += n
+        self.total += other.total
+        self.count += other.count
+
+    def since(self, previous: Optional["Histogram"]) -> "Histogram":
+        """Observations added after the `previous` snapshot of this histogram"""
+        delta = Histogram()
+        delta.merge(self)
+        if previous is not None:
+            delta.buckets = [n - p for n, p in zip(delta.buckets, previous.buckets)]
+            delta.total -= previous.total
+            delta.count -= previous.count
+        return delta
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else float("inf")
+        return float("inf")
+
+
+def _label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    """Per-(stage, device) histograms and per-(counter, device) totals, safe across threads"""
+
+    def __init__(self, enabled: bool = False, prefix: str = "bleach"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+        self.counters: Dict[Tuple[str, str], float] = {}
+        self.lock = threading.Lock()
+        self.server: Optional[ThreadingHTTPServer] = None
+        self.summary_thread: Optional[threading.Thread] = None
+        # (time, counter totals, merged histogram per stage) at the previous summary
+        self.last_summary: Tuple[float, Dict[str, float], Dict[str, Histogram]] = (time.monotonic(), {}, {})
+
+    # --- Recording ---
+
+    def observe(self, stage: str, seconds: float, device: Optional[str] = ""):
+        if not self.enabled:
+            return
+        key = (stage, device or "")
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, name: str, device: Optional[str] = "", amount: float = 1):
+        if not self.enabled:
+            return
+        key = (name, device or "")
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, stage: str, device: Optional[str] = ""):
+        """Time the block into the stage histogram (also when it raises)"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, device)
+
+    # --- Export ---
+
+    def render(self) -> str:
+        """All metrics in Prometheus text exposition format"""
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+
+        name = f"{self.prefix}_stage_seconds"
+        lines = [f"# HELP {name} Time spent per hot-path stage, per device",
+                 f"# TYPE {name} histogram"]
+        for (stage, device), histogram in histograms:
+            labels = f'stage="{_label(stage)}",device="{_label(device)}"'
+            cumulative = 0
+            for bound, n in zip(BUCKETS, histogram.buckets):
+                cumulative += n
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f"{name}_sum{{{labels}}} {histogram.total:.6f}")
+            lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+        declared = set()
+        for (counter, device), value in counters:
+            name = f"{self.prefix}_{counter}_total"
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f'{name}{{device="{_label(device)}"}} {value:g}')
+        return "\n".join(lines) + "\n"
+
+    def summary_line(self) -> str:
+        """Rates and p95 per stage since the previous summary, over all devices"""
+        now = time.monotonic()
+        with self.lock:
+            totals: Dict[str, float] = {}
+            for (counter, _), value in self.counters.items():
+                totals[counter] = totals.get(counter, 0) + value
+            stages: Dict[str, Histogram] = {}
+            for (stage, _), histogram in self.histograms.items():
+                stages.setdefault(stage, Histogram()).merge(histogram)
+        since, previous, previous_stages = self.last_summary
+        self.last_summary = (now, totals, stages)
+        elapsed = max(1e-6, now - since)
+
+        rates = ", ".join(f"{(totals.get(counter, 0) - previous.get(counter, 0)) / elapsed:.1f} {label}/s"
+                          for counter, label in SUMMARY_COUNTERS.items())
+        windows = {stage: histogram.since(previous_stages.get(stage)) for stage, histogram in stages.items()}
+        p95 = " ".join(f"{stage} {window.quantile(0.95) * 1000:.0f}"
+                       for stage, window in sorted(windows.items()) if window.count)
+        return f"{rates} | p95 ms: {p95 or '-'}"
+
+    # --- Serving ---
+
+    def start(self, port: Optional[int] = None, host: Optional[str] = None,
+              summary_interval: Optional[float] = None):
+        """Serve /metrics and start the console summary (no-op when disabled or already running)"""
+        if not self.enabled or self.server is not None:
+            return
+        port = getattr(settings, 'METRICS_PORT', 9108) if port is None else port
+        host = host or getattr(settings, 'METRICS_HOST', "127.0.0.1")
+        if summary_interval is None:
+            summary_interval = getattr(settings, 'METRICS_SUMMARY_INTERVAL', 30)
+
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+            self.server.daemon_threads = True
+            threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+            print(f"[METRICS] 📈 Serving http://{host}:{port}/metrics")
+        except OSError as e:
+            print(f"[METRICS] ⚠️ Could not serve metrics on {host}:{port}: {e}")
+
+        if summary_interval and summary_interval > 0 and self.summary_thread is None:
+            self.summary_thread = threading.Thread(target=self._summary_loop, args=(summary_interval,),
+                                                   name="metrics-summary", daemon=True)
+            self.summary_thread.start()
+
+    def _summary_loop(self, interval: float):
+        while True:
+            time.sleep(interval)
+            print(f"[METRICS] 📈 {self.summary_line()}")
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+# Global registry
+metrics = MetricsRegistry(enabled=getattr(settings, 'ENABLE_PROFILING', False))
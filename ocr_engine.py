@@ -0,0 +1,122 @@
+"""
+Lazily loaded, process-wide EasyOCR engine.
+
+Importing actions.py used to construct up to three EasyOCR readers (torch import + model
+load, seconds and hundreds of MB) in every process, OCR tasks or not. Here nothing is
+imported until the first readtext() call, each network is loaded once, and only the ones
+actually used: "general" (English) and "digits" (the 'digit' recognition network, which
+falls back to the general reader when it isn't installed).
+
+GPU use follows OCR_USE_GPU: "auto" asks torch whether CUDA is usable, so CPU-only hosts
+don't attempt (and warn about) GPU initialization. preload_in_background() warms the
+models on a daemon thread, e.g. once the first frame loop is running.
+"""
+import importlib.util
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+import settings
+
+# Installed? (find_spec doesn't import torch)
+EASYOCR_INSTALLED = importlib.util.find_spec("easyocr") is not None
+
+# Model name -> extra easyocr.Reader arguments
+OCR_MODELS = {
+    "general": {},
+    "digits": {"recog_network": "digit"},
+}
+
+
+def detect_gpu() -> bool:
+    """OCR_USE_GPU: True/False forces it; "auto" uses CUDA only when torch can see a device"""
+    setting = getattr(settings, 'OCR_USE_GPU', "auto")
+    if setting != "auto":
+        return bool(setting)
+    try:
+        import torch
+        return torch.cuda.is_available()
+    except Exception:
+        return False
+
+
+class OCREngine:
+    """One EasyOCR reader per model, created on first use and shared by every caller"""
+
+    def __init__(self):
+        self.readers: Dict[str, object] = {}
+        self.failed: Dict[str, str] = {}
+        self.load_times: Dict[str, float] = {}
+        self.gpu: Optional[bool] = None
+        self.load_lock = threading.Lock()
+        # Readers share one torch model each and aren't documented as thread-safe
+        self.lock = threading.Lock()
+        self.preload_thread: Optional[threading.Thread] = None
+
+    @property
+    def available(self) -> bool:
+        return EASYOCR_INSTALLED and "general" not in self.failed
+
+    def get_reader(self, model: str = "general"):
+        """The reader for `model`, loading it on first use; None if EasyOCR can't be loaded"""
+        reader = self.readers.get(model)
+        if reader is not None or not EASYOCR_INSTALLED:
+            return reader
+        with self.load_lock:
+            if model in self.readers:
+                return self.readers[model]
+            if model in self.failed:
+                return self.readers.get("general") if model != "general" else None
+            return self._load(model)
+
+    def _load(self, model: str):
+        """Load one model (load_lock held)"""
+        start = time.perf_counter()
+        try:
+            import easyocr
+            if self.gpu is None:
+                self.gpu = detect_gpu()
+            reader = easyocr.Reader(['en'], gpu=self.gpu, verbose=False, **OCR_MODELS[model])
+        except Exception as e:
+            self.failed[model] = str(e)
+            if model == "general":
+                print(f"[OCR] ❌ EasyOCR unavailable ({e}) - falling back to Tesseract")
+                return None
+            # The digit network is optional - use the general reader for digits too
+            print(f"[OCR] '{model}' network unavailable ({e}) - using the general reader")
+            general = self.readers.get("general") or self._load("general")
+            if general is not None:
+                self.readers[model] = general
+            return general
+
+        self.readers[model] = reader
+        self.load_times[model] = time.perf_counter() - start
+        print(f"[OCR] Loaded EasyOCR '{model}' model on {'GPU' if self.gpu else 'CPU'} "
+              f"in {self.load_times[model]:.1f}s")
+        return reader
+
+    def readtext(self, img, model: str = "general", **kwargs) -> List[tuple]:
+        """reader.readtext(img, **kwargs) serialized across threads; [] if EasyOCR can't be loaded"""
+        reader = self.get_reader(model)
+        if reader is None:
+            return []
+        with self.lock:
+            return reader.readtext(img, **kwargs)
+
+    def preload(self, models: Iterable[str] = ("general",)):
+        for model in models:
+            self.get_reader(model)
+
+    def preload_in_background(self, models: Optional[Iterable[str]] = None):
+        """Load models on a daemon thread (once per process); OCR calls made meanwhile just wait"""
+        if not EASYOCR_INSTALLED or self.preload_thread is not None:
+            return
+        if models is None:
+            models = getattr(settings, 'OCR_PRELOAD_MODELS', ("general",))
+        self.preload_thread = threading.Thread(target=self.preload, args=(tuple(models),),
+                                               name="ocr-preload", daemon=True)
+        self.preload_thread.start()
+
+
+# Global engine
+ocr_engine = OCREngine()
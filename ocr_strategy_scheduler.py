@@ -0,0 +1,223 @@
+"""
+Adaptive OCR strategy scheduling with early-exit consensus.
+
+Every OCR field (orbs, account_id, numbers) has a set of strategy combinations - ROI variation,
+preprocessor, backend and Tesseract PSM, named like the candidate methods in actions.py
+("easyocr_roi0_strat3", "tesseract_roi1_strat2_psm7"). For each combination the scheduler
+counts how often it was attempted and how often its value won the final consensus, and
+orders attempts by smoothed success rate (wins + 1) / (attempts + 2), so untried
+combinations rank in the middle. A read stops as soon as OCR_STRATEGY_QUORUM attempts agree;
+attempts that report the same `source` (e.g. several PSMs on one crop) vote once, and a
+session's `validate` callback can veto a quorum value.
+
+    session = ocr_strategy_scheduler.session("orbs", combos)
+    while True:
+        batch = session.next_batch()
+        if not batch:
+            break
+        for combo in batch:
+            session.observe(combo, run(combo))
+    session.finish(session.winner or fallback_consensus)
+
+The counts persist in device_states/ocr_strategy_stats.json, saved at most every
+SAVE_INTERVAL seconds and at exit. Saves merge this process's new counts into the file under
+an exclusive file lock, so shard workers don't overwrite each other's learning.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, Hashable, List, Optional, Set
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import settings
+
+STATS_PATH = os.path.join("device_states", "ocr_strategy_stats.json")
+SAVE_INTERVAL = 30.0  # Seconds between merges of new counts into STATS_PATH
+
+# Agreeing attempts needed to stop early, per field (0 = run every combination)
+DEFAULT_QUORUM = {"orbs": 3, "account_id": 2, "numbers": 2}
+
+
+@contextmanager
+def _locked(path: str):
+    """Exclusive lock on `path` across processes (blocks until it is free)"""
+    with open(path, 'a+') as handle:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        else:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class StrategySession:
+    """One read of a field: hands out combinations in ranked order until a quorum agrees"""
+
+    def __init__(self, scheduler: "OCRStrategyScheduler", field: str, combos: List[str], quorum: int,
+                 validate: Optional[Callable[[str, float], bool]] = None):
+        self.scheduler = scheduler
+        self.field = field
+        self.pending = combos
+        self.quorum = quorum
+        self.validate = validate  # (value, best confidence) -> may this value win the quorum
+        self.observed: Dict[str, Optional[str]] = {}
+        self.votes: Counter = Counter()
+        self.sources: Dict[str, Set[Hashable]] = {}
+        self.confidence: Dict[str, float] = {}
+        self.winner: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self.winner is not None or not self.pending
+
+    def next_batch(self, size: int = 1, accept: Optional[Callable[[str], bool]] = None) -> List[str]:
+        """The next `size` (accepted) combinations to try ([] once a quorum agreed or all were tried)"""
+        if self.done:
+            return []
+        batch = [combo for combo in self.pending if accept is None or accept(combo)][:size]
+        self.pending = [combo for combo in self.pending if combo not in batch]
+        return batch
+
+    def requeue(self, combos: List[str]):
+        """Put combinations that couldn't be run back at the front"""
+        self.pending = list(combos) + self.pending
+
+    def observe(self, combo: str, value: Optional[str], source: Optional[Hashable] = None,
+                confidence: float = 1.0):
+        """
+        Result of one attempt (None/empty if it produced nothing usable). Attempts with the
+        same `source` (the crop they read) vote once per value.
+        """
+        self.observed[combo] = value or None
+        if not value:
+            return
+        self.confidence[value] = max(self.confidence.get(value, 0.0), confidence)
+        if source is not None:
+            seen = self.sources.setdefault(value, set())
+            if source in seen:
+                return
+            seen.add(source)
+        self.votes[value] += 1
+        if (self.quorum and self.winner is None and self.votes[value] >= self.quorum
+                and (self.validate is None or self.validate(value, self.confidence[value]))):
+            self.winner = value
+
+    def finish(self, winner: Optional[str]):
+        """Credit the attempts that produced the final value (which may come from a fallback consensus)"""
+        self.scheduler.record(self.field, self.observed, winner)
+
+
+class OCRStrategyScheduler:
+    """Per-field success counts for OCR strategy combinations"""
+
+    def __init__(self, path: str = STATS_PATH, enabled: bool = True,
+                 quorum: Optional[Dict[str, int]] = None):
+        self.path = path
+        self.enabled = enabled
+        self.quorum = dict(DEFAULT_QUORUM, **(quorum or {}))
+        self.lock = threading.Lock()
+        # field -> combo -> [wins, attempts]; `unsaved` holds the increments not yet in the file
+        self.stats: Dict[str, Dict[str, List[int]]] = {}
+        self.unsaved: Dict[str, Dict[str, List[int]]] = {}
+        self.loaded = False
+        self.last_save = time.monotonic()
+        atexit.register(self.flush)
+
+    def _load(self):
+        self.loaded = True
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                self.stats = {field: {combo: list(counts) for combo, counts in combos.items()}
+                              for field, combos in json.load(f).items()}
+        except Exception as e:
+            print(f"[OCR SCHEDULER] Could not load {self.path}: {e}")
+
+    def rate(self, field: str, combo: str) -> float:
+        wins, attempts = self.stats.get(field, {}).get(combo, (0, 0))
+        return (wins + 1) / (attempts + 2)
+
+    def order(self, field: str, combos: List[str]) -> List[str]:
+        """Combinations by success rate (the given order breaks ties, and is kept when disabled)"""
+        if not self.enabled:
+            return list(combos)
+        with self.lock:
+            if not self.loaded:
+                self._load()
+            return sorted(combos, key=lambda combo: -self.rate(field, combo))
+
+    def session(self, field: str, combos: List[str],
+                validate: Optional[Callable[[str, float], bool]] = None) -> StrategySession:
+        return StrategySession(self, field, self.order(field, combos), self.quorum.get(field, 0), validate)
+
+    def record(self, field: str, observed: Dict[str, Optional[str]], winner: Optional[str]):
+        if not self.enabled or not observed:
+            return
+        with self.lock:
+            for stats in (self.stats, self.unsaved):
+                combos = stats.setdefault(field, {})
+                for combo, value in observed.items():
+                    counts = combos.setdefault(combo, [0, 0])
+                    counts[0] += int(winner is not None and value == winner)
+                    counts[1] += 1
+            if time.monotonic() - self.last_save >= SAVE_INTERVAL:
+                self._save()
+
+    def flush(self):
+        """Save any counts not in the file yet (at exit)"""
+        with self.lock:
+            if self.unsaved:
+                self._save()
+
+    def _save(self):
+        """Merge unsaved increments into the file (self.lock held; the file lock covers other processes)"""
+        self.last_save = time.monotonic()
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with _locked(self.path + ".lock"):
+                on_disk = {}
+                if os.path.exists(self.path):
+                    with open(self.path, 'r') as f:
+                        on_disk = json.load(f)
+                for field, combos in self.unsaved.items():
+                    disk_combos = on_disk.setdefault(field, {})
+                    for combo, (wins, attempts) in combos.items():
+                        disk_wins, disk_attempts = disk_combos.get(combo, (0, 0))
+                        disk_combos[combo] = [disk_wins + wins, disk_attempts + attempts]
+                temp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(temp_path, 'w') as f:
+                    json.dump(on_disk, f, indent=2, sort_keys=True)
+                os.replace(temp_path, self.path)
+            self.stats = on_disk
+            self.unsaved = {}
+        except Exception as e:
+            print(f"[OCR SCHEDULER] Could not save {self.path}: {e}")
+
+    def format_ranking(self, field: str, top: int = 5) -> str:
+        combos = self.stats.get(field, {})
+        ranked = sorted(combos, key=lambda combo: -self.rate(field, combo))[:top]
+        return ", ".join(f"{combo} {combos[combo][0]}/{combos[combo][1]}" for combo in ranked)
+
+
+# Global scheduler
+ocr_strategy_scheduler = OCRStrategyScheduler(
+    enabled=getattr(settings, 'OCR_STRATEGY_SCHEDULER', True),
+    quorum=getattr(settings, 'OCR_STRATEGY_QUORUM', None),
+)
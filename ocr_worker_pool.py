@@ -0,0 +1,294 @@
+"""
+Out-of-process OCR worker pool with cross-device batching.
+
+OCR_WORKER_PROCESSES worker processes each hold their own EasyOCR models (ocr_engine, loaded
+on their first batch). Callers submit a list of preprocessed crops (with the model and
+allowlist for each) and get every candidate back as [(bbox, text, confidence), ...] per crop.
+
+Requests arriving within OCR_BATCH_WINDOW seconds of each other - e.g. several devices
+reaching the orb screen together - are merged into one batch, up to OCR_MAX_BATCH crops.
+A worker groups the batch by (model, allowlist), pads each group to a common size and runs
+it through Reader.readtext_batched in one call (falling back to per-crop readtext).
+
+    future = ocr_worker_pool.submit([(crop, "general", "0123456789,"), ...])
+    results = future.result(ocr_worker_pool.result_timeout)
+    # or: await asyncio.wait_for(asyncio.wrap_future(future), ocr_worker_pool.result_timeout)
+
+A worker that doesn't answer a batch within OCR_BATCH_TIMEOUT seconds is killed (its batch
+fails, callers fall back to in-process OCR) and replaced on the next batch.
+"""
+import multiprocessing as mp
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import settings
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
+# One crop to recognize: (image, model name, allowlist or None)
+OCRItem = Tuple[np.ndarray, str, Optional[str]]
+
+
+def _pad_to(image: np.ndarray, height: int, width: int) -> np.ndarray:
+    """Extend bottom/right edges to (height, width) - bbox coordinates stay valid"""
+    pad_bottom, pad_right = height - image.shape[0], width - image.shape[1]
+    if not pad_bottom and not pad_right:
+        return image
+    if CV2_AVAILABLE:
+        return cv2.copyMakeBorder(image, 0, pad_bottom, 0, pad_right, cv2.BORDER_REPLICATE)
+    padding = ((0, pad_bottom), (0, pad_right)) + ((0, 0),) * (image.ndim - 2)
+    return np.pad(image, padding, mode='edge')
+
+
+def _plain(results) -> List[tuple]:
+    """EasyOCR output -> picklable (bbox as int lists, text, float confidence) tuples"""
+    return [([[int(x), int(y)] for x, y in bbox], str(text), float(confidence))
+            for bbox, text, confidence in results]
+
+
+def recognize_batch(engine, items: List[OCRItem]) -> List[List[tuple]]:
+    """Run a batch through EasyOCR, one readtext_batched call per (model, allowlist, channels) group"""
+    results: List[List[tuple]] = [[] for _ in items]
+    groups: Dict[tuple, List[int]] = {}
+    for index, (image, model, allowlist) in enumerate(items):
+        groups.setdefault((model, allowlist, image.ndim), []).append(index)
+
+    for (model, allowlist, _), indexes in groups.items():
+        reader = engine.get_reader(model)
+        if reader is None:
+            continue
+        images = [items[index][0] for index in indexes]
+        height = max(image.shape[0] for image in images)
+        width = max(image.shape[1] for image in images)
+        try:
+            batched = reader.readtext_batched([_pad_to(image, height, width) for image in images],
+                                              batch_size=len(images), allowlist=allowlist, detail=1)
+            for index, result in zip(indexes, batched):
+                results[index] = _plain(result)
+        except Exception:
+            # Older EasyOCR / unsupported input: one call per crop, same results
+            for index, image in zip(indexes, images):
+                try:
+                    results[index] = _plain(reader.readtext(image, allowlist=allowlist, detail=1))
+                except Exception:
+                    results[index] = []
+    return results
+
+
+def _ocr_worker_main(conn):
+    """Worker process: receive (request_id, items), reply (request_id, results) until None"""
+    from ocr_engine import ocr_engine
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if message is None:
+            return
+        request_id, items = message
+        try:
+            conn.send((request_id, recognize_batch(ocr_engine, items)))
+        except Exception as e:
+            conn.send((request_id, e))
+
+
+class _Worker:
+    """One worker process and the dispatcher thread that feeds it"""
+
+    def __init__(self, pool: "OCRWorkerPool", index: int):
+        self.pool = pool
+        self.index = index
+        self.process: Optional[mp.Process] = None
+        self.conn = None
+        self.request_id = 0
+        self.thread = threading.Thread(target=self._dispatch_loop, name=f"ocr-dispatch-{index}", daemon=True)
+        self.thread.start()
+
+    def _ensure_process(self):
+        if self.process is not None and self.process.is_alive():
+            return
+        if self.process is not None:
+            print(f"[OCR POOL] ❌ Worker {self.index} exited (code {self.process.exitcode}) - restarting")
+            with self.pool.stats_lock:
+                self.pool.stats["restarts"] += 1
+        parent_conn, child_conn = self.pool.ctx.Pipe()
+        self.process = self.pool.ctx.Process(target=_ocr_worker_main, args=(child_conn,),
+                                             name=f"ocr-worker-{self.index}", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+
+    def _dispatch_loop(self):
+        pool = self.pool
+        while True:
+            first = pool.requests.get()
+            if first is None:
+                pool.requests.put(None)  # Let the other dispatchers see it too
+                self._stop()
+                return
+            requests = [first]
+            size = len(first[0])
+            deadline = time.perf_counter() + pool.batch_window
+            while size < pool.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    request = pool.requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    pool.requests.put(None)  # Let the other dispatchers see it too
+                    break
+                requests.append(request)
+                size += len(request[0])
+            self._run(requests)
+
+    def _run(self, requests: List[Tuple[List[OCRItem], Future, float]]):
+        # Callers that already gave up (asyncio.wait_for cancels the future) are skipped
+        requests = [request for request in requests if not request[1].cancelled()]
+        if not requests:
+            return
+        items = [item for request_items, _, _ in requests for item in request_items]
+        started = time.perf_counter()
+        try:
+            self._ensure_process()
+            self.request_id += 1
+            self.conn.send((self.request_id, items))
+            if not self.conn.poll(self.pool.batch_timeout):
+                self._kill()
+                raise TimeoutError(f"worker {self.index} gave no answer in {self.pool.batch_timeout:.0f}s "
+                                   f"({len(items)} crops) - killed")
+            request_id, results = self.conn.recv()
+            if isinstance(results, Exception):
+                raise results
+        except Exception as e:
+            if not isinstance(e, (EOFError, OSError, BrokenPipeError)):
+                print(f"[OCR POOL] Batch failed: {e}")
+            for _, future, _ in requests:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        offset = 0
+        for request_items, future, _ in requests:
+            if not future.done():
+                future.set_result(results[offset:offset + len(request_items)])
+            offset += len(request_items)
+
+        with self.pool.stats_lock:
+            stats = self.pool.stats
+            stats["batches"] += 1
+            stats["requests"] += len(requests)
+            stats["crops"] += len(items)
+            stats["max_batch"] = max(stats["max_batch"], len(items))
+            stats["wait_total"] += sum(started - queued_at for _, _, queued_at in requests)
+            stats["run_total"] += time.perf_counter() - started
+
+    def _kill(self):
+        """Kill a stuck worker; _ensure_process starts a new one (and a new pipe) for the next batch"""
+        with self.pool.stats_lock:
+            self.pool.stats["timeouts"] += 1
+        self.process.kill()
+        self.process.join(5)
+        self.conn.close()
+        # Counted as a timeout only - not as a crash restart
+        self.process = None
+        self.conn = None
+
+    def _stop(self):
+        if self.conn is not None:
+            try:
+                self.conn.send(None)
+            except Exception:
+                pass
+        if self.process is not None:
+            self.process.join(5)
+            if self.process.is_alive():
+                self.process.terminate()
+
+
+class OCRWorkerPool:
+    """Batches OCR requests from every device and runs them in worker processes"""
+
+    def __init__(self, processes: int = 0, batch_window: float = 0.02, max_batch: int = 128,
+                 batch_timeout: float = 60.0):
+        self.processes = processes
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.batch_timeout = batch_timeout
+        self.ctx = mp.get_context("spawn")
+        self.requests: "queue.Queue" = queue.Queue()
+        self.workers: List[_Worker] = []
+        self.start_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.stats = {"batches": 0, "requests": 0, "crops": 0, "max_batch": 0,
+                      "wait_total": 0.0, "run_total": 0.0, "restarts": 0, "timeouts": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.processes > 0
+
+    @property
+    def result_timeout(self) -> float:
+        """How long a caller waits for submit()'s future: a batch ahead of it plus its own"""
+        return 2 * self.batch_timeout + self.batch_window
+
+    def submit(self, items: List[OCRItem]) -> Future:
+        """Queue crops for recognition; the Future resolves to one candidate list per crop"""
+        future = Future()
+        if not items:
+            future.set_result([])
+            return future
+        if not self.workers:
+            with self.start_lock:
+                if not self.workers:
+                    self.workers = [_Worker(self, index) for index in range(self.processes)]
+        self.requests.put((list(items), future, time.perf_counter()))
+        return future
+
+    def recognize(self, items: List[OCRItem], timeout: Optional[float] = None) -> List[List[tuple]]:
+        """Blocking submit() (for code already running on a compute executor thread)"""
+        future = self.submit(items)
+        try:
+            return future.result(self.result_timeout if timeout is None else timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    def format_stats(self) -> str:
+        with self.stats_lock:
+            stats = self.stats
+            if not stats["batches"]:
+                return "OCR pool: no batches yet"
+            return (f"OCR pool: {stats['batches']} batches, {stats['crops'] / stats['batches']:.1f} crops "
+                    f"and {stats['requests'] / stats['batches']:.1f} requests/batch (max {stats['max_batch']}), "
+                    f"wait avg {stats['wait_total'] / stats['requests'] * 1000:.0f}ms, "
+                    f"run avg {stats['run_total'] / stats['batches'] * 1000:.0f}ms, restarts {stats['restarts']}, "
+                    f"timeouts {stats['timeouts']}")
+
+    def shutdown(self):
+        if self.workers:
+            self.requests.put(None)
+            for worker in self.workers:
+                worker.thread.join(10)
+            self.workers = []
+
+
+# Global pool (disabled unless OCR_WORKER_PROCESSES > 0)
+ocr_worker_pool = OCRWorkerPool(
+    processes=getattr(settings, 'OCR_WORKER_PROCESSES', 0),
+    batch_window=getattr(settings, 'OCR_BATCH_WINDOW', 0.02),
+    max_batch=getattr(settings, 'OCR_MAX_BATCH', 128),
+    batch_timeout=getattr(settings, 'OCR_BATCH_TIMEOUT', 60.0),
+)
@@ -0,0 +1,103 @@
+"""
+Compiled pixel-task matcher.
+A list of `type: "pixel"` tasks is compiled once into flat coordinate / expected-color
+arrays; every frame is then checked with one gather + compare + reduceat over all tasks.
+"""
+from collections import OrderedDict
+from typing import List, Tuple
+
+import numpy as np
+
+
+class CompiledPixelTasks:
+    """All pixel checks of a task list as flat arrays (task i owns pixels starts[i]:ends[i])"""
+
+    def __init__(self, tasks: List[dict], frame_shape: Tuple[int, ...]):
+        self.tasks = tasks
+        self.key = tuple(id(task) for task in tasks)
+        height, width = frame_shape[:2]
+
+        ys, xs, colors = [], [], []
+        starts = []
+        always_match = np.zeros(len(tasks), dtype=bool)  # Empty search_array matches trivially
+        never_match = np.zeros(len(tasks), dtype=bool)   # Out of bounds / malformed
+
+        for index, task in enumerate(tasks):
+            search_array = task.get("search_array", [])
+            try:
+                pixels = self._parse_search_array(search_array)
+            except (ValueError, IndexError, AttributeError):
+                print(f"[PIXEL] Invalid search_array in '{task.get('task_name')}' - task will never match")
+                never_match[index] = True
+                pixels = []
+
+            if not search_array:
+                always_match[index] = True
+                continue
+            if any(not (0 <= y < height and 0 <= x < width) for x, y, _ in pixels):
+                never_match[index] = True
+                continue
+            if not pixels:
+                continue
+
+            starts.append(len(ys))
+            for x, y, rgb in pixels:
+                xs.append(x)
+                ys.append(y)
+                colors.append(rgb)
+
+        self.ys = np.array(ys, dtype=np.intp)
+        self.xs = np.array(xs, dtype=np.intp)
+        self.colors = np.array(colors, dtype=np.uint8).reshape(-1, 3)
+        self.starts = np.array(starts, dtype=np.intp)
+        self.checked = ~(always_match | never_match)
+        self.always_match = always_match
+
+    @staticmethod
+    def _parse_search_array(search_array: List[str]) -> List[Tuple[int, int, Tuple[int, int, int]]]:
+        """[(x, y, (r, g, b)), ...] from ["x,y", "#rrggbb", ...] (same parsing as hex_to_rgb)"""
+        pixels = []
+        for i in range(0, len(search_array), 2):
+            coords_str, hex_color = search_array[i], search_array[i + 1]
+            x, y = map(int, coords_str.split(','))
+            hex_color = hex_color.lstrip('#')
+            pixels.append((x, y, tuple(int(hex_color[j:j + 2], 16) for j in (0, 2, 4))))
+        return pixels
+
+    def match(self, frame) -> np.ndarray:
+        """Boolean match vector aligned with self.tasks"""
+        matches = self.always_match.copy()
+        if len(self.starts) == 0:
+            return matches
+
+        # SparseFrame provides gather(); plain frames use fancy indexing
+        gather = getattr(frame, 'gather', None)
+        pixels = gather(self.ys, self.xs) if gather is not None else frame[self.ys, self.xs]
+
+        pixel_ok = np.all(pixels == self.colors, axis=1)
+        matches[self.checked] = np.logical_and.reduceat(pixel_ok, self.starts)
+        return matches
+
+
+class PixelMatcherCache:
+    """Compiled matchers keyed by task list identity and frame size"""
+
+    def __init__(self, max_entries: int = 64):
+        self.entries: "OrderedDict[tuple, CompiledPixelTasks]" = OrderedDict()
+        self.max_entries = max_entries
+
+    def get(self, tasks: List[dict], frame_shape: Tuple[int, ...]) -> CompiledPixelTasks:
+        key = (tuple(id(task) for task in tasks), tuple(frame_shape[:2]))
+        compiled = self.entries.get(key)
+        if compiled is None:
+            compiled = CompiledPixelTasks(tasks, frame_shape)
+            self.entries[key] = compiled
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        else:
+            self.entries.move_to_end(key)
+        return compiled
+
+
+# Global compiled matcher cache
+pixel_matcher_cache = PixelMatcherCache()
@@ -0,0 +1,261 @@
+"""
+On-demand sampling profiler.
+
+Nothing runs until a profile is requested, so it can stay installed in production:
+
+    kill -USR1 <pid>                                    # PROFILER_DEFAULT_SECONDS
+    echo "profile 60" | nc 127.0.0.1 9200              # PROFILER_PORT, replies with the summary
+    /profile 60                                         # Telegram (DeviceStatusBot)
+
+While active, a sampler thread reads the stack of every thread (the event loop thread is
+labelled with the asyncio task it is running) every PROFILER_SAMPLE_INTERVAL seconds, then
+writes to PROFILER_OUTPUT_DIR:
+
+    profile_<time>_<pid>.collapsed   one "thread;frame;frame;... count" line per stack
+                                     (flamegraph.pl, speedscope, inferno)
+    profile_<time>_<pid>.txt         busy share per thread and asyncio task, top functions
+
+Stacks that end in a blocking wait (select, Condition.wait, Queue.get, ...) count as idle and
+are left out of the top functions. In the sharded runtime a profile started in the supervisor
+is also started in every shard worker; each process writes its own files.
+"""
+import asyncio
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import settings
+
+# (file, function) of leaf frames that mean the thread is waiting, not working
+IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("socket.py", "accept"),
+    ("socketserver.py", "serve_forever"),
+    ("connection.py", "_recv"),
+    ("connection.py", "_poll"),
+}
+
+TOP_FUNCTIONS = 25
+
+
+class ProfileResult(NamedTuple):
+    collapsed_path: str
+    summary_path: str
+    samples: int
+    summary: str
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def _is_idle(frame) -> bool:
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES
+
+
+class SamplingProfiler:
+    """Stack sampler for all threads of this process, started on request"""
+
+    def __init__(self, interval: float = 0.005, output_dir: str = "profiles",
+                 default_seconds: float = 30, max_seconds: float = 300):
+        self.interval = interval
+        self.output_dir = output_dir
+        self.default_seconds = default_seconds
+        self.max_seconds = max_seconds
+        self.lock = threading.Lock()
+        self.running = False
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_thread: Optional[int] = None
+        self.server: Optional[socketserver.ThreadingTCPServer] = None
+        # Called with the duration whenever a profile starts (shard supervisor: forward to workers)
+        self.followers: List[Callable[[float], None]] = []
+        self.last_result: Optional[ProfileResult] = None
+
+    # --- Triggers ---
+
+    def install(self, port: Optional[int] = None):
+        """Remember the running event loop and set up the SIGUSR1 and socket triggers"""
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+
+        if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.start())
+
+        port = getattr(settings, 'PROFILER_PORT', 9200) if port is None else port
+        if port and self.server is None:
+            self._serve(port)
+
+    def _serve(self, port: int):
+        profiler = self
+
+        class CommandHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                words = self.rfile.readline().decode(errors="replace").split()
+                if words and words[0] == "profile":
+                    try:
+                        seconds = float(words[1]) if len(words) > 1 else None
+                    except ValueError:
+                        seconds = None
+                    result = profiler.run(seconds)
+                    reply = result.summary if result else "A profile is already running\n"
+                elif words and words[0] == "status":
+                    reply = "running\n" if profiler.running else "idle\n"
+                else:
+                    reply = "Commands: profile [seconds], status\n"
+                self.wfile.write(reply.encode())
+
+        try:
+            self.server = socketserver.ThreadingTCPServer(("127.0.0.1", port), CommandHandler)
+            self.server.daemon_threads = True
+            threading.Thread(target=self.server.serve_forever, name="profiler-commands", daemon=True).start()
+            print(f"[PROFILER] 🔬 Listening for profile requests on 127.0.0.1:{port} (pid {os.getpid()})")
+        except OSError as e:
+            print(f"[PROFILER] ⚠️ Could not listen on 127.0.0.1:{port}: {e}")
+
+    def start(self, seconds: Optional[float] = None) -> bool:
+        """Profile in a background thread (False if a profile is already running)"""
+        if self.running:
+            return False
+        threading.Thread(target=self.run, args=(seconds,), name="profiler-sampler", daemon=True).start()
+        return True
+
+    async def profile(self, seconds: Optional[float] = None) -> Optional[ProfileResult]:
+        """Profile without blocking the event loop (None if a profile is already running)"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.run, seconds)
+
+    # --- Sampling ---
+
+    def run(self, seconds: Optional[float] = None) -> Optional[ProfileResult]:
+        """Sample all threads for `seconds` and write the output files (blocks the caller)"""
+        with self.lock:
+            if self.running:
+                return None
+            self.running = True
+        try:
+            seconds = min(seconds or self.default_seconds, self.max_seconds)
+            for follower in list(self.followers):
+                try:
+                    follower(seconds)
+                except Exception as e:
+                    print(f"[PROFILER] ⚠️ Could not forward profile request: {e}")
+            print(f"[PROFILER] 🔬 Sampling pid {os.getpid()} for {seconds:.0f}s...")
+            stacks, idle_stacks, samples = self._sample(seconds)
+            self.last_result = self._write(stacks, idle_stacks, samples, seconds)
+            print(f"[PROFILER] ✅ {self.last_result.collapsed_path}, {self.last_result.summary_path}")
+            return self.last_result
+        finally:
+            self.running = False
+
+    def _current_task(self) -> Optional[str]:
+        if self.loop is None:
+            return None
+        try:
+            task = asyncio.current_task(self.loop)
+        except RuntimeError:
+            return None
+        return task.get_name() if task is not None else None
+
+    def _sample(self, seconds: float):
+        stacks: Counter = Counter()
+        idle_stacks = set()
+        samples = 0
+        sampler = threading.get_ident()
+        next_sample = time.monotonic()
+        deadline = next_sample + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            task = self._current_task()
+            for ident, frame in sys._current_frames().items():
+                if ident == sampler:
+                    continue
+                idle = _is_idle(frame)
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                root = [names.get(ident, f"thread-{ident}")]
+                if ident == self.loop_thread and task:
+                    root.append(f"task:{task}")
+                stack = ";".join(root + labels[::-1])
+                stacks[stack] += 1
+                if idle:
+                    idle_stacks.add(stack)
+            samples += 1
+            next_sample += self.interval
+            time.sleep(max(0.0, next_sample - time.monotonic()))
+        return stacks, idle_stacks, samples
+
+    def _write(self, stacks: Counter, idle_stacks: set, samples: int, seconds: float) -> ProfileResult:
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"profile_{datetime.now():%Y%m%d_%H%M%S}_{os.getpid()}")
+        collapsed_path, summary_path = base + ".collapsed", base + ".txt"
+
+        with open(collapsed_path, 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        summary = self._summarize(stacks, idle_stacks, samples, seconds)
+        with open(summary_path, 'w') as f:
+            f.write(summary)
+        return ProfileResult(collapsed_path, summary_path, samples, summary)
+
+    def _summarize(self, stacks: Counter, idle_stacks: set, samples: int, seconds: float) -> str:
+        threads: Dict[str, list] = {}  # thread -> [busy, total]
+        task_counts: Counter = Counter()
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        busy = 0
+        for stack, count in stacks.items():
+            frames = stack.split(";")
+            counts = threads.setdefault(frames[0], [0, 0])
+            counts[1] += count
+            if stack in idle_stacks:
+                continue
+            counts[0] += count
+            busy += count
+            if len(frames) > 1 and frames[1].startswith("task:"):
+                task_counts[frames[1][len("task:"):]] += count
+            functions = [label for label in frames[1:] if not label.startswith("task:")]
+            if functions:
+                self_counts[functions[-1]] += count
+            for label in set(functions):
+                total_counts[label] += count
+
+        lines = [f"Sampling profile of pid {os.getpid()}: {samples} samples over {seconds:.0f}s "
+                 f"({self.interval * 1000:.0f}ms interval)", "",
+                 "Busy share per thread (samples not in a blocking wait):"]
+        for name, (thread_busy, thread_total) in sorted(threads.items(), key=lambda item: -item[1][0]):
+            lines.append(f"  {thread_busy / max(1, thread_total):6.1%}  {name}")
+
+        if task_counts:
+            lines += ["", "Event loop share per asyncio task:"]
+            for name, count in task_counts.most_common(TOP_FUNCTIONS):
+                lines.append(f"  {count / max(1, samples):6.1%}  {name}")
+
+        lines += ["", f"Top functions by self time (% of {busy} busy thread-samples):"]
+        for label, count in self_counts.most_common(TOP_FUNCTIONS):
+            lines.append(f"  {count / max(1, busy):6.1%}  {label}")
+        lines += ["", "Top functions by total time (including callees):"]
+        for label, count in total_counts.most_common(TOP_FUNCTIONS):
+            lines.append(f"  {count / max(1, busy):6.1%}  {label}")
+        return "\n".join(lines) + "\n"
+
+
+# Global profiler
+sampling_profiler = SamplingProfiler(
+    interval=getattr(settings, 'PROFILER_SAMPLE_INTERVAL', 0.005),
+    output_dir=getattr(settings, 'PROFILER_OUTPUT_DIR', "profiles"),
+    default_seconds=getattr(settings, 'PROFILER_DEFAULT_SECONDS', 30),
+    max_seconds=getattr(settings, 'PROFILER_MAX_SECONDS', 300),
+)
@@ -11,6 +11,8 @@ from typing import Optional, Dict
 from dataclasses import dataclass
 import numpy as np
 import cv2
+import settings
+from metrics import metrics
 
 @dataclass
 class StreamFrame:
@@ -215,117 +217,222 @@ class ScreenrecordManager:
 
 # Alternative implementation using FFmpeg for better H264 handling
 class FFmpegScreenrecordManager:
-    """Enhanced version using FFmpeg for H264 decoding"""
-    
+    """
+    Enhanced version using FFmpeg for H264 decoding.
+
+    Frames are decoded at settings.EMULATOR_RESOLUTION and published through a
+    double buffer guarded by a sequence counter: the reader thread fills the back
+    buffer and bumps the counter, consumers copy the front buffer without locking
+    and retry if a publish overtook them.
+    """
+
+    # Android's screenrecord refuses anything above 180 seconds
+    SCREENRECORD_TIME_LIMIT = 180
+    # Start the replacement pipeline this long before the current one expires
+    RESTART_MARGIN = 10
+    # Give up on streaming after this many pipeline failures in a row
+    MAX_CONSECUTIVE_FAILURES = 3
+
     def __init__(self, device_id: str):
         self.device_id = device_id
         self.screenrecord_process = None
         self.ffmpeg_process = None
         self.running = False
-        self.last_frame: Optional[StreamFrame] = None
-        self.frame_lock = threading.Lock()
+        self.failed = False
         self.reader_thread = None
-        
+        self.supervisor_thread = None
+
+        self.width, self.height = settings.EMULATOR_RESOLUTION
+        self.frame_size = self.width * self.height * 3
+        self.bitrate = "8M"
+
+        # Double buffer + sequence counter (even = nothing published yet)
+        self.buffers = [np.zeros((self.height, self.width, 3), dtype=np.uint8) for _ in range(2)]
+        self.sequence = 0
+        self.last_frame_time = 0.0
+        self.publish_lock = threading.Lock()  # Only serializes writers (old/new pipeline overlap)
+
+        self.generation = 0
+        self.pipeline_started_at = 0.0
+        self.consecutive_failures = 0
+
     async def initialize(self):
         """Initialize with FFmpeg pipeline"""
         try:
-            # Check if FFmpeg is available
-            result = subprocess.run(["ffmpeg", "-version"], capture_output=True)
-            if result.returncode != 0:
+            # Check if FFmpeg is available (subprocesses are awaited - this runs on the event loop)
+            if await _run_quiet("ffmpeg", "-version") != 0:
                 print(f"[{self.device_id}] FFmpeg not found, using basic implementation")
                 return False
-            
-            await self._start_ffmpeg_pipeline()
-            
+
+            # Kill stale screenrecord processes from a previous run once, at startup
+            await _run_quiet("adb", "-s", self.device_id, "shell", "pkill -f screenrecord")
+
             self.running = True
-            self.reader_thread = threading.Thread(target=self._ffmpeg_frame_reader, daemon=True)
-            self.reader_thread.start()
-            
-            print(f"[{self.device_id}] FFmpeg screenrecord streaming initialized")
+            self._start_ffmpeg_pipeline()
+
+            # Wait briefly for the first decoded frame so callers can use the stream immediately
+            deadline = time.time() + 5.0
+            while self.sequence == 0 and time.time() < deadline:
+                if self.ffmpeg_process.poll() is not None:
+                    break
+                await asyncio.sleep(0.05)
+
+            if self.sequence == 0:
+                print(f"[{self.device_id}] FFmpeg stream produced no frames, disabling streaming")
+                self.cleanup()
+                return False
+
+            self.supervisor_thread = threading.Thread(target=self._supervise_pipeline, daemon=True)
+            self.supervisor_thread.start()
+
+            print(f"[{self.device_id}] FFmpeg screenrecord streaming initialized ({self.width}x{self.height})")
             return True
-            
+
         except Exception as e:
             print(f"[{self.device_id}] FFmpeg initialization failed: {e}")
+            self.cleanup()
             return False
-    
-    async def _start_ffmpeg_pipeline(self):
-        """Start screenrecord -> FFmpeg pipeline"""
-        # Kill existing processes
-        kill_cmd = f"adb -s {self.device_id} shell pkill -f screenrecord"
-        subprocess.run(kill_cmd, shell=True, capture_output=True)
-        
-        # Start screenrecord
+
+    def _start_ffmpeg_pipeline(self):
+        """Start screenrecord -> FFmpeg pipeline and its reader thread"""
         screenrecord_cmd = [
             "adb", "-s", self.device_id, "exec-out",
-            "screenrecord", "--output-format=h264", "--bit-rate=8M",
-            "--size=720x1280", "--time-limit=3600", "-"
+            "screenrecord", "--output-format=h264", f"--bit-rate={self.bitrate}",
+            f"--size={self.width}x{self.height}",
+            f"--time-limit={self.SCREENRECORD_TIME_LIMIT}", "-"
         ]
-        
-        self.screenrecord_process = subprocess.Popen(
+
+        screenrecord_process = subprocess.Popen(
             screenrecord_cmd,
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
+            stderr=subprocess.DEVNULL
         )
-        
-        # Start FFmpeg to decode H264 -> raw frames
+
+        # Decode H264 -> raw RGB at the emulator resolution; low-delay flags keep
+        # ffmpeg from buffering frames while it probes the stream
         ffmpeg_cmd = [
-            "ffmpeg", "-f", "h264", "-i", "pipe:0",
-            "-f", "rawvideo", "-pix_fmt", "rgb24", 
+            "ffmpeg", "-loglevel", "error",
+            "-fflags", "nobuffer", "-flags", "low_delay",
+            "-probesize", "32", "-analyzeduration", "0",
+            "-f", "h264", "-i", "pipe:0",
+            "-vf", f"scale={self.width}:{self.height}",
+            "-f", "rawvideo", "-pix_fmt", "rgb24",
             "-an", "-sn", "pipe:1"
         ]
-        
-        self.ffmpeg_process = subprocess.Popen(
+
+        ffmpeg_process = subprocess.Popen(
             ffmpeg_cmd,
-            stdin=self.screenrecord_process.stdout,
+            stdin=screenrecord_process.stdout,
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
+            stderr=subprocess.DEVNULL
         )
-        
+
         # Close screenrecord stdout in parent
-        self.screenrecord_process.stdout.close()
-    
-    def _ffmpeg_frame_reader(self):
-        """Read decoded frames from FFmpeg"""
-        if not self.ffmpeg_process:
-            return
-        
-        frame_size = 720 * 1280 * 3  # Width * Height * RGB
-        
-        while self.running and self.ffmpeg_process.poll() is None:
+        screenrecord_process.stdout.close()
+
+        old_processes = [self.ffmpeg_process, self.screenrecord_process]
+
+        self.generation += 1
+        self.screenrecord_process = screenrecord_process
+        self.ffmpeg_process = ffmpeg_process
+        self.pipeline_started_at = time.time()
+
+        self.reader_thread = threading.Thread(
+            target=self._ffmpeg_frame_reader,
+            args=(ffmpeg_process, self.generation),
+            daemon=True
+        )
+        self.reader_thread.start()
+
+        # The new pipeline is already running, so retiring the old one leaves no gap
+        self._terminate_processes(old_processes)
+
+    def _ffmpeg_frame_reader(self, ffmpeg_process, generation: int):
+        """Read decoded frames from FFmpeg into the back buffer"""
+        staging = bytearray(self.frame_size)
+        view = memoryview(staging)
+
+        while self.running and generation == self.generation:
             try:
-                # Read one frame worth of data
-                frame_data = self.ffmpeg_process.stdout.read(frame_size)
-                
-                if len(frame_data) == frame_size:
-                    # Convert raw RGB data to numpy array
-                    frame = np.frombuffer(frame_data, dtype=np.uint8)
-                    frame = frame.reshape((1280, 720, 3))
-                    
-                    with self.frame_lock:
-                        self.last_frame = StreamFrame(
-                            image=frame,
-                            timestamp=time.time(),
-                            width=720,
-                            height=1280
-                        )
-                
+                # Read exactly one frame worth of data
+                filled = 0
+                while filled < self.frame_size:
+                    count = ffmpeg_process.stdout.readinto(view[filled:])
+                    if not count:
+                        return  # Pipeline ended - the supervisor restarts it
+                    filled += count
+
+                with self.publish_lock:
+                    if generation != self.generation:
+                        return
+                    with metrics.timer("decode", self.device_id):
+                        back = self.buffers[(self.sequence + 1) & 1]
+                        back.reshape(-1)[:] = np.frombuffer(staging, dtype=np.uint8)
+                    self.last_frame_time = time.time()
+                    self.sequence += 1
+
             except Exception as e:
                 if self.running:
                     print(f"[{self.device_id}] FFmpeg reader error: {e}")
-                    time.sleep(0.1)
-    
+                return
+
+    def _supervise_pipeline(self):
+        """Restart the pipeline before screenrecord's time limit or after it dies"""
+        restart_after = self.SCREENRECORD_TIME_LIMIT - self.RESTART_MARGIN
+
+        while self.running:
+            time.sleep(0.5)
+            if not self.running:
+                break
+
+            pipeline_dead = self.ffmpeg_process is None or self.ffmpeg_process.poll() is not None
+            expiring = time.time() - self.pipeline_started_at >= restart_after
+
+            if not (pipeline_dead or expiring):
+                continue
+
+            if pipeline_dead:
+                self.consecutive_failures += 1
+                if self.consecutive_failures > self.MAX_CONSECUTIVE_FAILURES:
+                    print(f"[{self.device_id}] Screenrecord stream keeps failing, falling back to screencap")
+                    self.failed = True
+                    self.cleanup()
+                    break
+                print(f"[{self.device_id}] Screenrecord stream ended, restarting...")
+            else:
+                self.consecutive_failures = 0
+
+            try:
+                self._start_ffmpeg_pipeline()
+            except Exception as e:
+                print(f"[{self.device_id}] Failed to restart screenrecord stream: {e}")
+
+    def get_latest_frame(self) -> Optional[np.ndarray]:
+        """Copy of the most recent decoded frame, or None if the stream is not healthy"""
+        if not self.running or self.failed:
+            return None
+
+        # screenrecord only emits frames when the screen changes, so an old frame is
+        # still current as long as the pipeline is alive
+        if self.ffmpeg_process is None or self.ffmpeg_process.poll() is not None:
+            return None
+
+        while True:
+            sequence = self.sequence
+            if sequence == 0:
+                return None
+            frame = self.buffers[sequence & 1].copy()
+            # The writer only starts refilling this buffer after publishing sequence + 1, so
+            # the copy is whole if no publish happened while it ran (the copy releases the GIL)
+            if self.sequence == sequence:
+                return frame
+
     async def get_screenshot(self) -> Optional[np.ndarray]:
         """Get latest frame"""
-        with self.frame_lock:
-            if self.last_frame and time.time() - self.last_frame.timestamp < 1.0:
-                return self.last_frame.image
-        return None
-    
-    def cleanup(self):
-        """Cleanup FFmpeg processes"""
-        self.running = False
-        
-        for process in [self.ffmpeg_process, self.screenrecord_process]:
+        return self.get_latest_frame()
+
+    def _terminate_processes(self, processes):
+        for process in processes:
             if process:
                 try:
                     process.terminate()
@@ -336,6 +443,25 @@ class FFmpegScreenrecordManager:
                     except:
                         pass
 
+    def cleanup(self):
+        """Cleanup FFmpeg processes"""
+        self.running = False
+        self._terminate_processes([self.ffmpeg_process, self.screenrecord_process])
+
+async def _run_quiet(*args) -> int:
+    """Run a command without blocking the event loop; returns its exit code (-1 if it can't start)"""
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *args, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+    except OSError:
+        return -1
+    try:
+        return await asyncio.wait_for(process.wait(), 10)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        return -1
+
 # Global managers
 screenrecord_managers: Dict[str, ScreenrecordManager] = {}
 
@@ -351,7 +477,12 @@ async def get_screenrecord_manager(device_id: str) -> Optional[ScreenrecordManag
         
         screenrecord_managers[device_id] = manager
     
-    return screenrecord_managers.get(device_id)
+    manager = screenrecord_managers.get(device_id)
+    if getattr(manager, 'failed', False):
+        # Stream gave up after repeated pipeline failures
+        screenrecord_managers.pop(device_id, None)
+        return None
+    return manager
 
 def cleanup_all_screenrecord():
     """Clean up all screenrecord managers"""
@@ -34,13 +34,27 @@ MAX_CONCURRENT_SCREENSHOTS = 10  # Half of device count for optimal performance
 # Smart task prioritization - check high-priority tasks first
 USE_TASK_PRIORITIZATION = True
 
-# Skip checking stable devices as frequently
+# Skip checking stable devices as frequently (idle / static screen states of the frame scheduler)
 ADAPTIVE_CHECK_INTERVAL = True
 
+# Central frame scheduler: every device gets its next capture deadline from its state (active =
+# BACKGROUND_CHECK_INTERVAL, idle = twice that, keep_checking, static, text_input, sleeping) and
+# captures are granted in deadline order, at most FRAME_CAPTURE_BUDGET_FPS per second across all
+# devices (0 = unlimited) and MAX_CONCURRENT_SCREENSHOTS at a time. With SHARD_WORKERS each worker
+# gets the share of the budget for the devices it owns. Ten devices at the 0.2s active interval
+# already ask for 50 fps, so set a budget only at or above that demand, to cap host load.
+# FRAME_SCHEDULER_INTERVALS overrides per-state intervals, e.g. {"static": 2.0}. A device counts
+# as static after FRAME_STATIC_STREAK unchanged frames. False = devices capture as soon as their
+# deadline passes.
+FRAME_SCHEDULER_ENABLED = True
+FRAME_CAPTURE_BUDGET_FPS = 0
+FRAME_SCHEDULER_INTERVALS = {}
+FRAME_STATIC_STREAK = 5
+
 # Use async processing instead of threads (recommended)
 USE_ASYNC_PROCESSING = True
 
-# Maximum concurrent ADB connections per device
+# Maximum concurrent ADB connections per device (persistent shell sessions when USE_PERSISTENT_ADB)
 MAX_ADB_CONNECTIONS = 2
 
 # Enable GPU memory pooling for better performance
@@ -49,17 +63,147 @@ ENABLE_GPU_MEMORY_POOL = True
 # Screenshot quality (1-100) - lower = faster but less accurate
 SCREENSHOT_QUALITY = 85
 
+# Screenshot capture mode:
+#   "raw" - pull the raw RGBA framebuffer (`screencap` without -p) and drop the alpha channel
+#           in one copy (no PNG encode on the emulator, no decode on the host)
+#   "png" - legacy `screencap -p` + PIL decode
+# Devices whose pixel format is not supported, or that return several truncated raw
+# captures in a row, fall back to "png" automatically.
+SCREENSHOT_CAPTURE_MODE = "raw"
+
+# Stream frames with `screenrecord | ffmpeg` (decoded at EMULATOR_RESOLUTION) and serve the
+# latest one instead of running screencap per poll. Devices whose stream can't start
+# (no ffmpeg, screenrecord failure) fall back to SCREENSHOT_CAPTURE_MODE automatically.
+# Off by default: the H.264 stream is lossy (4:2:0 chroma, compression artifacts) and pixel
+# tasks compare exact RGB values, so most of them would never match on stream frames.
+# While a device's stream is healthy it takes precedence over ROI_PARTIAL_CAPTURE.
+USE_SCREENRECORD_STREAMING = False
+
+# When polling tasks with raw capture, only pull the framebuffer rows the active tasks read
+# (pixel coordinates + template ROIs) instead of the whole frame. Batches containing OCR,
+# orb extraction or ROI-less templates still capture full frames. Not used for devices
+# served by USE_SCREENRECORD_STREAMING (stream frames are already full frames).
+ROI_PARTIAL_CAPTURE = True
+
+# Fingerprint every polled frame and reuse the previous pixel/template detection results
+# while it is unchanged (loading screens, static menus). Cooldowns and actions still apply.
+FRAME_CHANGE_DETECTION = True
+
+# How often (seconds) each device prints its static frame statistics
+FRAME_STATS_LOG_INTERVAL = 60
+
+# Rebuild templates/template_atlas.json (+ its content-named .npy) at startup when it is missing or
+# a template PNG's content changed (otherwise stale templates are read from their PNGs).
+# Manual build: python template_atlas.py
+TEMPLATE_ATLAS_AUTO_BUILD = True
+
+# Coarse-to-fine template matching: a grayscale 1/TEMPLATE_PYRAMID_SCALE pass finds candidates,
+# which are re-verified in full color at full resolution against the task's confidence.
+# Tasks can override with "pyramid": True/False and "pyramid_scale": 2/4. Check
+# testing/pyramid_accuracy_report.py on recorded frames before enabling it globally.
+TEMPLATE_PYRAMID_MATCHING = False
+TEMPLATE_PYRAMID_SCALE = 2
+
+# Run template matching and OCR (preprocessing + EasyOCR/Tesseract) on a thread pool instead
+# of the asyncio event loop. Devices are served round-robin; each device may have at most
+# COMPUTE_MAX_PENDING_PER_DEVICE jobs queued. Queue depth / wait times are printed with the
+# frame statistics - raise COMPUTE_WORKERS if waits stay high while the CPU/GPU has headroom.
+COMPUTE_EXECUTOR_ENABLED = True
+COMPUTE_WORKERS = 4
+COMPUTE_MAX_PENDING_PER_DEVICE = 2
+
+# EasyOCR models load on first OCR use instead of at import. OCR_USE_GPU: "auto" (CUDA if torch
+# sees a device), True or False. The OCR_PRELOAD_MODELS ("general", "digits") are loaded on a
+# background thread as soon as a device's active task set contains OCR tasks; with
+# OCR_BACKGROUND_PRELOAD they are loaded once the first frame loop is running instead, whether or
+# not any OCR is ever needed (processes that never OCR then still pay the model memory).
+OCR_USE_GPU = "auto"
+OCR_BACKGROUND_PRELOAD = False
+OCR_PRELOAD_MODELS = ("general",)
+
+# Out-of-process OCR: digit/orb passes are sent to OCR_WORKER_PROCESSES worker processes (each
+# loads its own EasyOCR models) instead of running in-process. Requests from different devices
+# that arrive within OCR_BATCH_WINDOW seconds are merged into one batched inference of up to
+# OCR_MAX_BATCH crops. 0 = in-process OCR. With SHARD_WORKERS every shard starts its own pool.
+# A worker that takes longer than OCR_BATCH_TIMEOUT seconds on one batch (the first one includes
+# loading the models) is killed and restarted; that batch falls back to in-process OCR.
+OCR_WORKER_PROCESSES = 0
+OCR_BATCH_WINDOW = 0.02
+OCR_MAX_BATCH = 128
+OCR_BATCH_TIMEOUT = 60.0
+
+# Content-addressed OCR cache: results keyed by a hash of the crop pixels + preprocessing strategy +
+# backend, so identical crops (static screens, repeated consensus attempts) aren't OCR'd again.
+# Least recently used results are evicted beyond OCR_CACHE_MAX_ENTRIES (0 disables the cache).
+OCR_CACHE_MAX_ENTRIES = 2048
+
+# Keep Tesseract engines resident (one per PSM/whitelist, crops passed as in-memory buffers) instead
+# of running the tesseract CLI per call. Needs `pip install tesserocr`; pytesseract is used otherwise.
+# TESSDATA_PATH: tessdata directory if it isn't the one tesserocr was built with.
+TESSERACT_RESIDENT = True
+TESSERACT_LANG = "eng"
+TESSDATA_PATH = None
+
+# Read the orb counter and account ID (tasks with "glyph_field") by matching connected components
+# against the game-font glyphs in templates/glyphs/ (harvest them with glyph_ocr.py). Readings
+# whose lowest glyph confidence is under GLYPH_OCR_MIN_CONFIDENCE fall back to EasyOCR.
+GLYPH_OCR_ENABLED = True
+GLYPH_OCR_MIN_CONFIDENCE = 0.8
+
+# Order OCR attempts (ROI variation x preprocessing x backend x PSM) by how often each one produced
+# the winning value before, and stop once OCR_STRATEGY_QUORUM attempts agree (0 = try them all).
+# Learned counts persist in device_states/ocr_strategy_stats.json. False = fixed order.
+OCR_STRATEGY_SCHEDULER = True
+OCR_STRATEGY_QUORUM = {"orbs": 3, "account_id": 2, "numbers": 2}
+# Orb quorums count one vote per distinct crop (not per PSM/backend run on it), and the value only
+# wins early if it is a plausible orb count that some attempt read with at least this confidence
+# (Tesseract reports 0.5) - otherwise every attempt runs and the full consensus decides.
+OCR_ORB_QUORUM_MIN_CONFIDENCE = 0.85
+
+# Sharded runtime: split DEVICE_IDS across this many worker processes (each with its own event
+# loop, matching and OCR) under a supervisor that runs the Telegram bot, mirrors device state,
+# coordinates the all-linked account fetch and restarts crashed workers. 0 or 1 = one process.
+SHARD_WORKERS = 0
+# How often (seconds) workers copy each device's latest frame into its shared-memory slot
+SHARD_FRAME_PUBLISH_INTERVAL = 1.0
+
 # -------------------
 # OPTIMIZATION FLAGS
 # -------------------
 # Skip bounds checking for known good coordinates (small performance gain)
 SKIP_BOUNDS_CHECK = False
 
-# Use persistent ADB connections (experimental)
-USE_PERSISTENT_ADB = False
-
-# Enable performance profiling
+# Use persistent ADB connections: `shell`/`exec-out` commands go straight to the adb server
+# socket over per-device persistent sessions (MAX_ADB_CONNECTIONS each) instead of spawning
+# an adb process per command. Other commands (push, pull, ...) still use the adb binary.
+USE_PERSISTENT_ADB = True
+
+# Device state / stock storage: "json" (DEVICEn.json snapshots + append-only journals) or
+# "sqlite" (device_states/device_states.db in WAL mode - safe for the bot and the airtable/fix
+# scripts running in other processes, atomic stock increments, flag transition history).
+# JSON files are still written as mirrors in sqlite mode.
+STATE_BACKEND = "json"
+
+# Enable performance profiling: per-device latency histograms for each hot-path stage (screencap,
+# decode, task_filter, pixel_match, template_match, ocr, ocr_orbs, tap, adb, fsync, state_reload) and
+# frame/match/adb/fsync/OCR counters (metrics.py). Served in Prometheus text format on
+# http://METRICS_HOST:METRICS_PORT/metrics (shard workers: METRICS_PORT + 1 + shard index), with a
+# one-line console summary every METRICS_SUMMARY_INTERVAL seconds (0 = no summary).
 ENABLE_PROFILING = False
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+METRICS_SUMMARY_INTERVAL = 30
+
+# On-demand sampling profiler (sampling_profiler.py) - idle until triggered by SIGUSR1, the local
+# socket (echo "profile 60" | nc 127.0.0.1 PROFILER_PORT; 0 = no socket; shard workers listen on
+# PROFILER_PORT + 1 + shard index) or the /profile [seconds] Telegram command. Samples every
+# thread's stack each PROFILER_SAMPLE_INTERVAL seconds and writes a collapsed-stack file
+# (flamegraph) plus a top-functions summary to PROFILER_OUTPUT_DIR.
+PROFILER_PORT = 9200
+PROFILER_SAMPLE_INTERVAL = 0.005
+PROFILER_DEFAULT_SECONDS = 30
+PROFILER_MAX_SECONDS = 300
+PROFILER_OUTPUT_DIR = "profiles"
 
 # -------------------
 # GAME & APP SETTINGS
@@ -0,0 +1,520 @@
+"""
+Sharded runtime: settings.DEVICE_IDS split across SHARD_WORKERS worker processes.
+
+Each worker owns a subset of the devices and runs their monitoring coroutines on its own
+event loop, so template matching and OCR scale past one core. The supervisor (the main
+process, which also runs the Telegram bot):
+  - mirrors device state: workers forward every state change (and stock increment) to it,
+    so the bot and the all-linked check see all devices without touching other workers' files
+  - runs the all-devices-linked check and the account fetch (pause workers -> fetch ->
+    resume/reroll), which used to run inside whichever device loop noticed first
+  - restarts workers that crash or stop sending heartbeats, with backoff; each worker gets
+    fresh command/event queues on every start, so a worker killed mid-put can't leave a
+    queue lock held or a torn message behind for the others
+  - owns one shared-memory frame slot per device; workers publish their latest captured
+    frame into it, and latest_frame() reads it without pickling or adb
+
+Each process writes only the state of the devices it owns (DeviceStateManager.remote_devices).
+"""
+import asyncio
+import copy
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+import traceback
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+import settings
+from device_state_manager import OWNED_DEVICES_ENV
+from sampling_profiler import sampling_profiler
+
+FRAME_HEADER_FIELDS = 5  # seq, height, width, channels, timestamp_ns
+FRAME_HEADER_BYTES = FRAME_HEADER_FIELDS * 8
+
+
+def partition_devices(device_ids: List[str], shard_count: int) -> List[List[str]]:
+    """Round-robin device IDs into shard_count non-empty shards"""
+    shard_count = max(1, min(shard_count, len(device_ids)))
+    return [device_ids[index::shard_count] for index in range(shard_count)]
+
+
+class SharedFrameSlot:
+    """
+    Latest frame of one device in shared memory: one writer, any number of readers.
+    Seqlock: the sequence number is odd while a write is in progress, and a reader retries
+    if it changed during its copy.
+    """
+
+    def __init__(self, name: Optional[str] = None, max_bytes: int = 0):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=FRAME_HEADER_BYTES + max_bytes)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.header = np.ndarray((FRAME_HEADER_FIELDS,), dtype=np.int64, buffer=self.shm.buf)
+        if self.owner:
+            self.header[:] = 0
+        self.capacity = self.shm.size - FRAME_HEADER_BYTES
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def write(self, frame: np.ndarray) -> bool:
+        if frame.dtype != np.uint8 or frame.ndim not in (2, 3) or frame.nbytes > self.capacity:
+            return False
+        self.header[0] += 1  # Odd: write in progress
+        np.ndarray(frame.shape, dtype=np.uint8, buffer=self.shm.buf, offset=FRAME_HEADER_BYTES)[...] = frame
+        channels = frame.shape[2] if frame.ndim == 3 else 0
+        self.header[1:] = (frame.shape[0], frame.shape[1], channels, time.time_ns())
+        self.header[0] += 1
+        return True
+
+    def read(self, retries: int = 5) -> Optional[Tuple[int, float, np.ndarray]]:
+        """(sequence, capture time, frame copy), or None if nothing was published yet"""
+        for _ in range(retries):
+            seq = int(self.header[0])
+            if seq == 0:
+                return None
+            if seq % 2:
+                time.sleep(0.001)
+                continue
+            height, width, channels, timestamp_ns = (int(value) for value in self.header[1:])
+            shape = (height, width, channels) if channels else (height, width)
+            frame = np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf, offset=FRAME_HEADER_BYTES).copy()
+            if int(self.header[0]) == seq:
+                return seq, timestamp_ns / 1e9, frame
+        return None
+
+    def close(self):
+        del self.header  # Release the buffer export before closing
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class ShardWorker:
+    """Runs the device coroutines of one shard inside a worker process"""
+
+    HEARTBEAT_INTERVAL = 5.0
+    PAUSE_IDLE_TIMEOUT = 20.0  # Below ShardSupervisor.PAUSE_ACK_TIMEOUT: no ack means no fetch
+
+    def __init__(self, index: int, device_ids: List[str], commands, events,
+                 frame_slot_names: Dict[str, str], device_coroutine: Callable):
+        self.index = index
+        self.device_ids = device_ids
+        self.commands = commands
+        self.events = events
+        self.frame_slot_names = frame_slot_names
+        self.device_coroutine = device_coroutine
+        self.frame_slots: Dict[str, SharedFrameSlot] = {}
+        self.device_tasks: List[asyncio.Task] = []
+        self.last_publish: Dict[str, float] = {}
+        self.publish_interval = getattr(settings, 'SHARD_FRAME_PUBLISH_INTERVAL', 1.0)
+
+    def run(self):
+        try:
+            asyncio.run(self._main())
+        except KeyboardInterrupt:
+            pass
+
+    async def _main(self):
+        from actions import screenshot_manager, template_cache
+        from background_process import monitor
+        from device_state_manager import device_state_manager
+        from metrics import metrics
+        from screenrecord_manager import cleanup_all_screenrecord
+
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        self.monitor = monitor
+        self.state_manager = device_state_manager
+
+        monitor.coordinated_by_supervisor = True
+        device_state_manager.subscribe(self._forward_state_change)
+        device_state_manager.stock_forwarder = self._forward_stock_increment
+        for device_id, name in self.frame_slot_names.items():
+            self.frame_slots[device_id] = SharedFrameSlot(name)
+        screenshot_manager.frame_publisher = self._publish_frame
+        template_cache.preload()
+        metrics.start(port=getattr(settings, 'METRICS_PORT', 9108) + 1 + self.index)
+        profiler_port = getattr(settings, 'PROFILER_PORT', 9200)
+        sampling_profiler.install(port=profiler_port + 1 + self.index if profiler_port else 0)
+
+        threading.Thread(target=self._command_listener, name=f"shard-{self.index}-commands", daemon=True).start()
+        self.device_tasks = device_tasks = [
+            asyncio.create_task(self.device_coroutine(device_id), name=f"device:{device_id}")
+            for device_id in self.device_ids]
+        heartbeat_task = asyncio.create_task(self._heartbeat())
+        self.events.put(("started", self.index, os.getpid()))
+        print(f"[SHARD {self.index}] 🚀 Worker {os.getpid()} monitoring {len(self.device_ids)} devices: {self.device_ids}")
+
+        try:
+            await self.stopped.wait()
+        finally:
+            for task in device_tasks + [heartbeat_task]:
+                task.cancel()
+            await asyncio.gather(*device_tasks, heartbeat_task, return_exceptions=True)
+            device_state_manager.flush_all()
+            cleanup_all_screenrecord()
+            for slot in self.frame_slots.values():
+                slot.close()
+
+    async def _heartbeat(self):
+        while True:
+            self.events.put(("heartbeat", self.index, time.time()))
+            await asyncio.sleep(self.HEARTBEAT_INTERVAL)
+
+    def _command_listener(self):
+        while True:
+            command = self.commands.get()
+            asyncio.run_coroutine_threadsafe(self._handle_command(command), self.loop)
+            if command[0] == "stop":
+                return
+
+    async def _handle_command(self, command: tuple):
+        kind = command[0]
+        try:
+            if kind == "pause":
+                # Stop monitoring and make every journaled change durable in the snapshots
+                self.monitor.fetch_in_progress = True
+                self.state_manager.fetch_mode = True
+                if not await self._wait_devices_idle(self.PAUSE_IDLE_TIMEOUT):
+                    return  # No ack: the supervisor skips this fetch and sends resume
+                self.state_manager.flush_all()
+                # Hand the device files over: releases the journal locks and keeps the
+                # background writer from compacting or reloading them until resume
+                self.state_manager.set_remote_devices(self.state_manager.remote_devices | set(self.device_ids))
+                self.events.put(("paused", self.index))
+            elif kind == "resume":
+                reroll = command[1]
+                # Take the devices back; the supervisor may have rewritten their files, so they are re-read
+                self.state_manager.set_remote_devices(self.state_manager.remote_devices - set(self.device_ids))
+                self.state_manager.fetch_mode = False
+                if reroll:
+                    for device_id in self.device_ids:
+                        self.monitor.process_monitor.set_active_tasks(device_id, "reroll_earse_gamedata")
+                    for device_id in self.device_ids:
+                        await self.monitor.process_monitor.launch_bleach(device_id)
+                        await asyncio.sleep(0.5)  # Small delay between launches
+                    self.monitor.last_successful_fetch = time.time()
+                self.monitor.fetch_in_progress = False
+                self.events.put(("resumed", self.index))
+            elif kind == "profile":
+                sampling_profiler.start(command[1])
+            elif kind == "stop":
+                self.stopped.set()
+        except Exception as e:
+            print(f"[SHARD {self.index}] ❌ Command {kind} failed: {e}")
+            traceback.print_exc()
+
+    async def _wait_devices_idle(self, timeout: float) -> bool:
+        """Wait until every device loop is parked in the fetch-mode skip (or has exited)"""
+        from frame_scheduler import frame_scheduler
+
+        deadline = time.time() + timeout
+        while True:
+            busy = [device_id for device_id, task in zip(self.device_ids, self.device_tasks)
+                    if not task.done() and device_id not in self.monitor.fetch_parked]
+            if not busy:
+                return True
+            if time.time() > deadline:
+                print(f"[SHARD {self.index}] ⚠️ Devices still busy after {timeout:.0f}s, not pausing: {busy}")
+                return False
+            for device_id in busy:
+                # Cut short a long sleep/text-input deadline so the loop reaches the skip
+                frame_scheduler.schedule(device_id, "fetch", until=time.time())
+            await asyncio.sleep(0.1)
+
+    def _forward_state_change(self, device_id: str, version: int, changed_keys: List[str]):
+        if device_id in self.state_manager.remote_devices:
+            return
+        state = self.state_manager.states.get(device_id, {})
+        changed = {key: copy.deepcopy(state[key]) for key in changed_keys if key in state}
+        removed = [key for key in changed_keys if key not in state]
+        self.events.put(("state", device_id, changed, removed))
+
+    def _forward_stock_increment(self, device_id: Optional[str]) -> int:
+        """The supervisor does the increment (one writer); returns the expected new value"""
+        self.events.put(("stock_increment", device_id))
+        return self.state_manager.get_current_stock() + 1
+
+    def _publish_frame(self, device_id: str, frame):
+        slot = self.frame_slots.get(device_id)
+        if slot is None or not isinstance(frame, np.ndarray):
+            return
+        now = time.time()
+        if now - self.last_publish.get(device_id, 0) < self.publish_interval:
+            return
+        self.last_publish[device_id] = now
+        slot.write(frame)
+
+
+def _run_shard_worker(index: int, device_ids: List[str], commands, events,
+                      frame_slot_names: Dict[str, str], device_coroutine: Callable):
+    """Worker process entry point"""
+    ShardWorker(index, device_ids, commands, events, frame_slot_names, device_coroutine).run()
+
+
+class ShardSupervisor:
+    """Starts, watches and coordinates the shard worker processes"""
+
+    RESTART_BACKOFF_MIN = 2.0
+    RESTART_BACKOFF_MAX = 60.0
+    HEALTHY_RUN_RESET = 300.0  # A worker up this long starts its next restart from the minimum backoff
+    HEARTBEAT_TIMEOUT = 90.0
+    PAUSE_ACK_TIMEOUT = 30.0
+
+    def __init__(self, device_ids: List[str], shard_count: int, device_coroutine: Callable):
+        self.device_ids = list(device_ids)
+        self.shards = partition_devices(self.device_ids, shard_count)
+        self.device_coroutine = device_coroutine
+        self.ctx = mp.get_context("spawn")  # Same behavior on Windows and Linux; no forked locks/threads
+        # Per worker, replaced on every start (see _start_worker)
+        self.events: List = [None] * len(self.shards)
+        self.commands: List = [None] * len(self.shards)
+        self.processes: List[Optional[mp.Process]] = [None] * len(self.shards)
+        self.started_at = [0.0] * len(self.shards)
+        self.next_start = [0.0] * len(self.shards)
+        self.backoff = [self.RESTART_BACKOFF_MIN] * len(self.shards)
+        self.restarts = [0] * len(self.shards)
+        self.last_heartbeat = [0.0] * len(self.shards)
+        self.acks: Dict[str, Set[int]] = {"paused": set(), "resumed": set()}
+        self.frame_slots: Dict[str, SharedFrameSlot] = {}
+        self.fetch_in_progress = False
+        self.last_endgame_check = 0.0
+        self.last_successful_fetch = 0.0
+        self.running = False
+
+    def latest_frame(self, device_id: str) -> Optional[Tuple[int, float, np.ndarray]]:
+        """(sequence, capture time, frame) most recently published by the device's worker"""
+        slot = self.frame_slots.get(device_id)
+        return slot.read() if slot is not None else None
+
+    # -------------------
+    # Worker lifecycle
+    # -------------------
+    def _start_worker(self, index: int):
+        device_ids = self.shards[index]
+        slot_names = {device_id: self.frame_slots[device_id].name for device_id in device_ids}
+        # New queues every start: a killed worker may have died holding a queue lock or
+        # mid-message, and the old ones are simply abandoned with it
+        self.commands[index] = self.ctx.Queue()
+        self.events[index] = events = self.ctx.Queue()
+        threading.Thread(target=self._event_reader, args=(index, events),
+                         name=f"shard-{index}-events", daemon=True).start()
+        process = self.ctx.Process(
+            target=_run_shard_worker,
+            args=(index, device_ids, self.commands[index], events, slot_names, self.device_coroutine),
+            name=f"shard-{index}",
+            daemon=True,
+        )
+        # The child's DeviceStateManager reads its device ownership while importing
+        previous = os.environ.get(OWNED_DEVICES_ENV)
+        os.environ[OWNED_DEVICES_ENV] = ",".join(device_ids)
+        try:
+            process.start()
+        finally:
+            if previous is None:
+                os.environ.pop(OWNED_DEVICES_ENV, None)
+            else:
+                os.environ[OWNED_DEVICES_ENV] = previous
+        self.processes[index] = process
+        self.started_at[index] = time.time()
+        self.last_heartbeat[index] = time.time()
+        print(f"[SUPERVISOR] Started shard {index} (pid {process.pid}): {device_ids}")
+
+    async def _check_workers(self):
+        now = time.time()
+        for index, process in enumerate(self.processes):
+            if process is not None and process.is_alive():
+                if now - self.last_heartbeat[index] > self.HEARTBEAT_TIMEOUT:
+                    print(f"[SUPERVISOR] ⚠️ Shard {index} sent no heartbeat for {self.HEARTBEAT_TIMEOUT:.0f}s - stopping it")
+                    await asyncio.get_running_loop().run_in_executor(None, self._stop_worker, index, process)
+                else:
+                    continue
+            if process is not None:
+                uptime = now - self.started_at[index]
+                if uptime > self.HEALTHY_RUN_RESET:
+                    self.backoff[index] = self.RESTART_BACKOFF_MIN
+                print(f"[SUPERVISOR] ❌ Shard {index} exited (code {process.exitcode}) after {uptime:.0f}s - "
+                      f"restarting in {self.backoff[index]:.0f}s")
+                self.processes[index] = None
+                self.next_start[index] = now + self.backoff[index]
+                self.backoff[index] = min(self.backoff[index] * 2, self.RESTART_BACKOFF_MAX)
+                self.restarts[index] += 1
+            # Devices change hands during an account fetch - restart once it's over
+            if not self.fetch_in_progress and now >= self.next_start[index]:
+                self._start_worker(index)
+
+    def _stop_worker(self, index: int, process: mp.Process, timeout: float = 10.0):
+        """Ask the worker to stop (it flushes its state), then terminate / kill if it doesn't"""
+        try:
+            self.commands[index].put(("stop",))
+        except Exception:
+            pass
+        process.join(timeout)
+        if process.is_alive():
+            process.terminate()
+            process.join(5)
+        if process.is_alive():
+            process.kill()
+            process.join(5)
+
+    def _event_reader(self, index: int, events):
+        """Apply one worker's events (own thread per worker start; DeviceStateManager is thread-safe)"""
+        from device_state_manager import device_state_manager
+
+        while self.running and self.events[index] is events:
+            try:
+                event = events.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+            kind = event[0]
+            try:
+                if kind == "state":
+                    _, device_id, changed, removed = event
+                    device_state_manager.apply_remote_changes(device_id, changed, removed)
+                elif kind == "stock_increment":
+                    device_state_manager.increment_stock(event[1])
+                elif kind == "heartbeat":
+                    self.last_heartbeat[event[1]] = time.time()
+                elif kind == "started":
+                    self.last_heartbeat[event[1]] = time.time()
+                elif kind in self.acks:
+                    self.acks[kind].add(event[1])
+            except Exception as e:
+                print(f"[SUPERVISOR] Error applying {kind} event: {e}")
+
+    def _broadcast(self, command: tuple) -> Set[int]:
+        """Send a command to every live worker; returns their shard indexes"""
+        targets = set()
+        for index, process in enumerate(self.processes):
+            if process is not None and process.is_alive():
+                self.commands[index].put(command)
+                targets.add(index)
+        return targets
+
+    async def _broadcast_and_wait(self, command: tuple, ack: str, timeout: float) -> bool:
+        self.acks[ack].clear()
+        targets = self._broadcast(command)
+        deadline = time.time() + timeout
+        while not targets <= self.acks[ack]:
+            if time.time() > deadline:
+                print(f"[SUPERVISOR] ⚠️ No {ack} ack from shards {sorted(targets - self.acks[ack])}")
+                return False
+            await asyncio.sleep(0.1)
+        return True
+
+    # -------------------
+    # All-linked coordination
+    # -------------------
+    async def _check_all_linked(self):
+        from device_state_manager import device_state_manager
+
+        now = time.time()
+        if (self.fetch_in_progress or now - self.last_endgame_check <= 10
+                or now - self.last_successful_fetch <= 300):  # Wait 5 minutes between fetches
+            return
+        self.last_endgame_check = now
+        if device_state_manager.all_devices_linked():
+            await self._run_account_fetch()
+
+    async def _run_account_fetch(self):
+        """The all-linked fetch, with the workers paused while their device files are rewritten"""
+        from actions import run_adb_command
+        from airtable_stock_fetcher import check_and_fetch_all_accounts
+        from background_process import BLEACH_PACKAGE_NAME
+        from device_state_manager import device_state_manager
+
+        print("[SUPERVISOR] 🎉 All accounts linked! Starting fetch process...")
+        self.fetch_in_progress = True
+        result = False
+        try:
+            print("[ALL DEVICES] ⏸️ Pausing all workers...")
+            if not await self._broadcast_and_wait(("pause",), "paused", self.PAUSE_ACK_TIMEOUT):
+                print("[ALL DEVICES] ❌ Not every worker paused - skipping this fetch")
+                return
+
+            device_state_manager.fetch_mode = True  # Prevent auto-generation
+            device_state_manager.set_remote_devices(())  # Take over every device file
+
+            print("[ALL DEVICES] 🔴 Closing games...")
+            for device_id in self.device_ids:
+                await run_adb_command(f"shell am force-stop {BLEACH_PACKAGE_NAME}", device_id)
+            print("[ALL DEVICES] ⏳ Waiting for games to close...")
+            await asyncio.sleep(3)
+
+            print("[ALL DEVICES] 📥 Fetching new accounts from Airtable...")
+            result = await check_and_fetch_all_accounts()
+            await asyncio.sleep(2)
+            device_state_manager.flush_all()  # Workers re-read the snapshots on resume
+
+            if result:
+                print("[ALL DEVICES] ✅ New accounts fetched! Workers start the reroll cycle...")
+                self.last_successful_fetch = time.time()
+            else:
+                print("[ALL DEVICES] ❌ Failed to fetch accounts")
+        finally:
+            device_state_manager.fetch_mode = False
+            device_state_manager.set_remote_devices(self.device_ids)
+            await self._broadcast_and_wait(("resume", bool(result)), "resumed", self.PAUSE_ACK_TIMEOUT)
+            self.fetch_in_progress = False
+            print("[ALL DEVICES] ▶️ Resuming monitoring...")
+
+    # -------------------
+    # Main loop
+    # -------------------
+    async def run(self):
+        from device_state_manager import device_state_manager
+
+        width, height = getattr(settings, 'EMULATOR_RESOLUTION', (960, 540))
+        for device_id in self.device_ids:
+            self.frame_slots[device_id] = SharedFrameSlot(max_bytes=width * height * 4)
+
+        # Everything this process recovered at startup goes to the snapshots before handing over
+        device_state_manager.flush_all()
+        device_state_manager.set_remote_devices(self.device_ids)
+
+        print(f"[SUPERVISOR] 🧩 {len(self.device_ids)} devices across {len(self.shards)} worker processes")
+        self.running = True
+        # Profiles requested here (signal, socket, Telegram) also run in every worker
+        sampling_profiler.followers.append(lambda seconds: self._broadcast(("profile", seconds)))
+        try:
+            while True:
+                await self._check_workers()
+                await self._check_all_linked()
+                await asyncio.sleep(1)
+        finally:
+            self.shutdown()
+
+    def shutdown(self, timeout: float = 10.0):
+        """Stop every worker (they flush their state) and release the frame slots"""
+        self._broadcast(("stop",))
+        deadline = time.time() + timeout
+        for process in self.processes:
+            if process is not None:
+                process.join(max(0.1, deadline - time.time()))
+                if process.is_alive():
+                    process.terminate()
+        self.processes = [None] * len(self.shards)
+        self.running = False
+        for slot in self.frame_slots.values():
+            slot.close()
+        self.frame_slots.clear()
+
+    def format_status(self) -> str:
+        alive = sum(1 for process in self.processes if process is not None and process.is_alive())
+        return (f"Shards: {alive}/{len(self.shards)} alive, restarts {self.restarts}, "
+                f"fetch {'in progress' if self.fetch_in_progress else 'idle'}")
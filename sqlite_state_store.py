@@ -0,0 +1,177 @@
+"""
+SQLite (WAL) store for device state and stock.
+Used by DeviceStateManager when settings.STATE_BACKEND = "sqlite": one key/value row per
+device state key, an atomic stock counter and a history of flag transitions, shared
+safely between the monitor, the bot and the airtable/fix scripts.
+"""
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+# Keys that change on every task - not worth a history row
+HISTORY_IGNORED_KEYS = {"LastUpdated", "SessionStats"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS device_state (
+    device TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (device, key)
+);
+CREATE INDEX IF NOT EXISTS idx_device_state_key_value ON device_state (key, value);
+CREATE TABLE IF NOT EXISTS stock (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    value INTEGER NOT NULL,
+    updated TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS flag_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    device TEXT NOT NULL,
+    key TEXT NOT NULL,
+    old_value TEXT,
+    new_value TEXT,
+    changed_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_flag_history_device ON flag_history (device, key);
+"""
+
+
+class SQLiteStateStore:
+    """Device state / stock tables in one WAL-mode database (one connection per thread)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            # Manual transactions (isolation_level=None) so BEGIN IMMEDIATE can be used
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # WAL: durable at checkpoints, never corrupt
+            conn.execute("PRAGMA busy_timeout=10000")
+            self.local.conn = conn
+        return conn
+
+    def _transaction(self, durable: bool = False):
+        return _Transaction(self._connect(), durable)
+
+    # -------------------
+    # Device state
+    # -------------------
+    def load_state(self, device: str) -> Dict[str, Any]:
+        rows = self._connect().execute(
+            "SELECT key, value FROM device_state WHERE device = ?", (device,)).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def has_device(self, device: str) -> bool:
+        return self._connect().execute(
+            "SELECT 1 FROM device_state WHERE device = ? LIMIT 1", (device,)).fetchone() is not None
+
+    def data_version(self) -> int:
+        """PRAGMA data_version of this thread's connection: changes when any other connection commits"""
+        return self._connect().execute("PRAGMA data_version").fetchone()[0]
+
+    def apply_changes(self, device: str, changed: Dict[str, Any], removed: Iterable[str] = (),
+                      previous: Optional[Dict[str, Any]] = None, durable: bool = False):
+        """Upsert changed keys, delete removed ones and log flag transitions - one transaction"""
+        previous = previous or {}
+        now = datetime.now().isoformat()
+        with self._transaction(durable) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO device_state (device, key, value) VALUES (?, ?, ?)",
+                [(device, key, json.dumps(value)) for key, value in changed.items()])
+            removed = list(removed)
+            if removed:
+                conn.executemany("DELETE FROM device_state WHERE device = ? AND key = ?",
+                                 [(device, key) for key in removed])
+            history = [(device, key, json.dumps(previous.get(key)), json.dumps(value), now)
+                       for key, value in changed.items()
+                       if key not in HISTORY_IGNORED_KEYS and key in previous]
+            history += [(device, key, json.dumps(previous.get(key)), None, now) for key in removed]
+            if history:
+                conn.executemany(
+                    "INSERT INTO flag_history (device, key, old_value, new_value, changed_at) "
+                    "VALUES (?, ?, ?, ?, ?)", history)
+
+    def replace_state(self, device: str, state: Dict[str, Any]):
+        """Overwrite a device's whole state (imports, external edits)"""
+        with self._transaction(durable=True) as conn:
+            conn.execute("DELETE FROM device_state WHERE device = ?", (device,))
+            conn.executemany(
+                "INSERT INTO device_state (device, key, value) VALUES (?, ?, ?)",
+                [(device, key, json.dumps(value)) for key, value in state.items()])
+
+    def devices_where(self, key: str, *values: Any) -> List[str]:
+        """Devices whose `key` equals any of `values` (uses the (key, value) index)"""
+        placeholders = ", ".join("?" for _ in values)
+        rows = self._connect().execute(
+            f"SELECT device FROM device_state WHERE key = ? AND value IN ({placeholders}) ORDER BY device",
+            [key] + [json.dumps(value) for value in values]).fetchall()
+        return [row[0] for row in rows]
+
+    def flag_history(self, device: str, key: Optional[str] = None, limit: int = 100) -> List[tuple]:
+        """Most recent (key, old, new, changed_at) transitions for a device"""
+        query = "SELECT key, old_value, new_value, changed_at FROM flag_history WHERE device = ?"
+        params: list = [device]
+        if key is not None:
+            query += " AND key = ?"
+            params.append(key)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        return self._connect().execute(query, params).fetchall()
+
+    # -------------------
+    # Stock
+    # -------------------
+    def get_stock(self) -> Optional[int]:
+        row = self._connect().execute("SELECT value FROM stock WHERE id = 1").fetchone()
+        return row[0] if row else None
+
+    def set_stock(self, value: int) -> int:
+        with self._transaction(durable=True) as conn:
+            conn.execute("INSERT OR REPLACE INTO stock (id, value, updated) VALUES (1, ?, ?)",
+                         (value, datetime.now().isoformat()))
+        return value
+
+    def increment_stock(self, default: int = 1) -> tuple:
+        """Atomically add 1 to the stock; returns (old, new)"""
+        with self._transaction(durable=True) as conn:
+            row = conn.execute("SELECT value FROM stock WHERE id = 1").fetchone()
+            old = row[0] if row else default
+            conn.execute("INSERT OR REPLACE INTO stock (id, value, updated) VALUES (1, ?, ?)",
+                         (old + 1, datetime.now().isoformat()))
+        return old, old + 1
+
+    def close(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK; durable=True fsyncs the commit (synchronous=FULL)"""
+
+    def __init__(self, conn: sqlite3.Connection, durable: bool):
+        self.conn = conn
+        self.durable = durable
+
+    def __enter__(self) -> sqlite3.Connection:
+        if self.durable:
+            self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.execute("BEGIN IMMEDIATE")  # Take the write lock up front - no upgrade deadlocks
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            if self.durable:
+                self.conn.execute("PRAGMA synchronous=NORMAL")
+        return False
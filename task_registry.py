@@ -0,0 +1,238 @@
+"""
+Task-set registry.
+Each named task set is compiled once (base + Shared_Tasks + Switcher_Tasks, sorted by
+priority, bucketed by type). Per device, the filtered view is cached and only rebuilt
+when one of the device state values its filters depend on changes.
+"""
+from typing import Callable, Dict, List, Tuple
+
+import settings
+from device_state_manager import device_state_manager, STOP_SUPPORT_FLAG_MAPPING
+from pixel_matcher import pixel_matcher_cache
+from template_matching import template_plan_cache
+from tasks import (
+    StoryMode_Tasks,
+    Restarting_Tasks,
+    Shared_Tasks,
+    Switcher_Tasks,
+    GUILD_TUTORIAL_TASKS,
+    Guild_Rejoin,
+    Sell_Characters,
+    Sell_Accessury,
+    HardStory_Tasks,
+    SideStory,
+    SubStories,
+    SubStories_check,
+    Character_Slots_Purchase,
+    Recive_Gold_From_Box_For_Characters_Purchase,
+    Exchange_Gold_Characters,
+    Recive_GiftBox,
+    Recive_Giftbox_Check,
+    Recive_Giftbox_Orbs,
+    Recive_Giftbox_Orbs_Check,
+    Skip_Kon_Bonaza,
+    Kon_Bonaza_1Match_Tasks,
+    Skip_Yukio_Event_Tasks,
+    Sort_Characters_Lowest_Level_Tasks,
+    Sort_Filter_Ascension_Tasks,
+    Sort_Multi_Select_Garbage_First_Tasks,
+    Upgrade_Characters_Level,
+    Upgrade_Characters_Back_To_Edit,
+    Main_Screenshot_Tasks,
+    Extract_Orb_Counts_Tasks,
+    Extract_Account_ID_Tasks,
+    Login1_Prepare_For_Link_Tasks,
+    Login2_Klab_Login_Tasks,
+    Login3_Wait_For_2FA_Tasks,
+    Login4_Confirm_Link_Tasks,
+    Endgame_Tasks,
+    Wait_For_Other_Devices,
+    reroll_earse_gamedata_tasks,
+    reroll_earse_gamedatapart2_tasks,
+    reroll_tutorial_firstmatch_tasks,
+    reroll_tutorial_characterchoose_tasks,
+    reroll_tutorial_characterchoosepart2_tasks,
+    reroll_tutorial_secondmatch_tasks,
+    reroll_replaceichigowithfivestar_tasks,
+)
+
+TASK_SET_MAP = {
+    "main": StoryMode_Tasks,
+    "restarting": Restarting_Tasks,
+    "guild_tutorial": GUILD_TUTORIAL_TASKS,
+    "guild_rejoin": Guild_Rejoin,
+    "sell_characters": Sell_Characters,
+    "sell_accsesurry": Sell_Accessury,
+    "hardstory": HardStory_Tasks,
+    "sidestory": SideStory,
+    "substories": SubStories,
+    "substories_check": SubStories_check,
+    "character_slots_purchase": Character_Slots_Purchase,
+    "recive_gold_from_box_for_characters_purchase": Recive_Gold_From_Box_For_Characters_Purchase,
+    "exchange_gold_characters": Exchange_Gold_Characters,
+    "recive_giftbox": Recive_GiftBox,
+    "recive_giftbox_check": Recive_Giftbox_Check,
+    "recive_giftbox_orbs": Recive_Giftbox_Orbs,
+    "recive_giftbox_orbs_check": Recive_Giftbox_Orbs_Check,
+    "skip_kon_bonaza": Skip_Kon_Bonaza,
+    "kon_bonaza_1match_tasks": Kon_Bonaza_1Match_Tasks,
+    "skip_yukio_event": Skip_Yukio_Event_Tasks,
+    "sort_characters_lowest_level": Sort_Characters_Lowest_Level_Tasks,
+    "sort_filter_ascension": Sort_Filter_Ascension_Tasks,
+    "sort_multi_select_garbage_first": Sort_Multi_Select_Garbage_First_Tasks,
+    "upgrade_characters_level": Upgrade_Characters_Level,
+    "upgrade_characters_back_to_edit": Upgrade_Characters_Back_To_Edit,
+    # Reroll tasks
+    "reroll_earse_gamedata": reroll_earse_gamedata_tasks,
+    "reroll_earse_gamedatapart2": reroll_earse_gamedatapart2_tasks,
+    "reroll_tutorial_firstmatch": reroll_tutorial_firstmatch_tasks,
+    "reroll_tutorial_characterchoose": reroll_tutorial_characterchoose_tasks,
+    "reroll_tutorial_characterchoosepart2": reroll_tutorial_characterchoosepart2_tasks,
+    "reroll_tutorial_secondmatch": reroll_tutorial_secondmatch_tasks,
+    "reroll_replaceichigowithfivestar": reroll_replaceichigowithfivestar_tasks,
+    # Other tasks
+    "main_screenshot": Main_Screenshot_Tasks,
+    "extract_orb_counts": Extract_Orb_Counts_Tasks,
+    "extract_account_id": Extract_Account_ID_Tasks,
+    "login1_prepare_for_link": Login1_Prepare_For_Link_Tasks,
+    "login2_klab_login": Login2_Klab_Login_Tasks,
+    "login3_wait_for_2fa": Login3_Wait_For_2FA_Tasks,
+    "login4_confirm_link": Login4_Confirm_Link_Tasks,
+    "wait_for_other_devices": Wait_For_Other_Devices,
+    "endgame": Endgame_Tasks
+}
+
+
+def bucket_tasks(tasks: List[dict]) -> Dict[str, List[dict]]:
+    """Split tasks by how batch_check_pixels_enhanced processes them"""
+    buckets = {
+        "pixel": [],
+        "template": [],
+        "shared_detection": [],
+        "ocr": [],
+        "ultra_robust_orb": [],
+        "pixel_one_or_more": [],
+    }
+    for task in tasks:
+        task_type = task.get("type", "pixel")
+        if task_type == "pixel":
+            buckets["pixel"].append(task)
+        elif task_type == "ocr":
+            buckets["ocr"].append(task)
+        elif task_type == "ultra_robust_orb":
+            buckets["ultra_robust_orb"].append(task)
+        elif task_type == "template":
+            if task.get("shared_detection", False):
+                buckets["shared_detection"].append(task)
+            else:
+                buckets["template"].append(task)
+        elif task_type == "Pixel-OneOrMoreMatched":
+            buckets["pixel_one_or_more"].append(task)
+    return buckets
+
+
+def task_state_dependencies(task: dict) -> List[str]:
+    """Device state keys that should_skip_task reads for this task"""
+    keys = []
+    for flag_field in ("RequireSupport", "StopSupport"):
+        flag = task.get(flag_field)
+        if flag in STOP_SUPPORT_FLAG_MAPPING:
+            keys.append(STOP_SUPPORT_FLAG_MAPPING[flag])
+    for key in task.get("ConditionalRun") or []:
+        if key == "Skip_Yukio_Event_Retry_At_3":
+            keys.append("Skip_Yukio_Event_Retry_Count")
+        else:
+            keys.append(key)
+    for key, value in task.items():
+        if key.startswith("RequireFlag_") and value:
+            keys.append(key.replace("RequireFlag_", ""))
+    return keys
+
+
+class TaskView(list):
+    """Filtered, priority-sorted task list with its type buckets precomputed"""
+
+    def __init__(self, tasks: List[dict]):
+        super().__init__(tasks)
+        self.buckets = bucket_tasks(self)
+
+
+class CompiledTaskSet:
+    """One named task set: base + shared + switcher tasks, sorted once"""
+
+    def __init__(self, name: str, base_tasks: List[dict]):
+        self.name = name
+        self.base_count = len(base_tasks)
+        self.tasks = sorted(base_tasks + Shared_Tasks + Switcher_Tasks, key=lambda x: x.get('priority', 999))
+        self.buckets = bucket_tasks(self.tasks)
+
+        dependency_keys = set()
+        for task in self.tasks:
+            dependency_keys.update(task_state_dependencies(task))
+        self.dependency_keys = tuple(sorted(dependency_keys))
+
+        # TimeLimitedSearch tasks depend on elapsed time, so they are re-checked every poll
+        self.dynamic_indices = [i for i, task in enumerate(self.tasks) if task.get("TimeLimitedSearch")]
+
+
+class TaskRegistry:
+    """Compiled task sets plus a cached filtered view per device"""
+
+    def __init__(self):
+        self.compiled: Dict[str, CompiledTaskSet] = {}
+        # device_id -> (task set name, state signature, indices of static tasks that passed)
+        self.views: Dict[str, Tuple[str, tuple, List[int]]] = {}
+        self.last_view: Dict[str, TaskView] = {}
+        self.frame_shape = (settings.EMULATOR_RESOLUTION[1], settings.EMULATOR_RESOLUTION[0], 3)
+
+    def get_task_set(self, task_set: str) -> CompiledTaskSet:
+        """Compiled task set (unknown names fall back to restarting tasks)"""
+        if task_set not in self.compiled:
+            self.compiled[task_set] = CompiledTaskSet(task_set, TASK_SET_MAP.get(task_set, Restarting_Tasks))
+        return self.compiled[task_set]
+
+    def get_filtered_view(self, device_id: str, task_set: str,
+                          should_skip: Callable[[str, dict], bool]) -> Tuple[TaskView, bool]:
+        """
+        Tasks of `task_set` that pass should_skip for this device, sorted by priority.
+        Returns (view, changed) - changed is True when the view was rebuilt.
+        """
+        compiled = self.get_task_set(task_set)
+        state = device_state_manager.get_fresh_state(device_id)
+        signature = tuple(state.get(key, 0) for key in compiled.dependency_keys)
+
+        cached = self.views.get(device_id)
+        changed = cached is None or cached[0] != task_set or cached[1] != signature
+
+        if changed:
+            dynamic = set(compiled.dynamic_indices)
+            passed = [i for i, task in enumerate(compiled.tasks)
+                      if i not in dynamic and not should_skip(device_id, task)]
+            self.views[device_id] = (task_set, signature, passed)
+        else:
+            passed = cached[2]
+
+        if compiled.dynamic_indices:
+            passed_set = set(passed)
+            passed_set.update(i for i in compiled.dynamic_indices
+                              if not should_skip(device_id, compiled.tasks[i]))
+            indices = sorted(passed_set)
+        else:
+            indices = passed
+
+        view = self.last_view.get(device_id)
+        if changed or view is None or compiled.dynamic_indices:
+            new_view = TaskView([compiled.tasks[i] for i in indices])
+            # Keep the previous object when nothing changed so downstream caches stay warm
+            if view is None or changed or view != new_view:
+                view = new_view
+                pixel_matcher_cache.get(view.buckets["pixel"], self.frame_shape)
+                template_plan_cache.get(view.buckets["template"] + view.buckets["shared_detection"],
+                                        self.frame_shape)
+                self.last_view[device_id] = view
+
+        return view, changed
+
+
+# Global task registry
+task_registry = TaskRegistry()
@@ -25,6 +25,7 @@ Extract_Account_ID_Tasks = [
         "use_match_position": False,
         "click_location_str": "16,25",  # No click needed
         "is_id": True,
+        "glyph_field": "account_id",  # Game-font glyph OCR first (glyph_ocr.py), EasyOCR if unsure
         "priority": 2,
         "cooldown": 60.0,
         "sleep": 3,
@@ -0,0 +1,183 @@
+"""
+Template atlas: every template referenced by tasks/*.py packed into one memory-mapped
+bundle, already converted to RGB (the color order frames use).
+
+    python template_atlas.py          # build / rebuild templates/template_atlas.json + .npy
+
+The pixel data goes to templates/template_atlas.<hash>.npy, named after its content, and
+template_atlas.json names the data file it indexes; replacing the .json is the only step
+that switches readers to a new build, so an index and its data can never be mismatched.
+
+At runtime the .npy is memory-mapped once per process (copy-on-write, never written to);
+each template is a view into it, so all devices (and worker processes) share the same
+pages and the matching path never touches the PNGs. Entries whose PNG content changed
+since the build (SHA-1 of the file), or templates missing from the bundle, are loaded from
+disk once at startup instead.
+"""
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
+ATLAS_FORMAT_VERSION = 2
+ATLAS_DIR = "templates"
+ATLAS_INDEX_PATH = os.path.join(ATLAS_DIR, "template_atlas.json")
+ATLAS_DATA_PATTERN = os.path.join(ATLAS_DIR, "template_atlas.*.npy")
+
+
+def collect_template_paths() -> List[str]:
+    """Every template_path / template_paths entry in the task lists, in first-seen order"""
+    import tasks
+
+    paths = []
+    seen = set()
+    for name in tasks.__all__:
+        for task in getattr(tasks, name):
+            candidates = list(task.get("template_paths", []))
+            if task.get("template_path"):
+                candidates.append(task["template_path"])
+            for path in candidates:
+                path = os.path.normpath(path)
+                if path not in seen:
+                    seen.add(path)
+                    paths.append(path)
+    return paths
+
+
+def _source_hash(path: str) -> str:
+    """SHA-1 of the PNG file (mtimes change on checkout/copy without the content changing)"""
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def load_template_png(path: str) -> Optional[np.ndarray]:
+    """PNG -> RGB uint8 array (the same conversion TemplateCache always did)"""
+    if not CV2_AVAILABLE or not os.path.exists(path):
+        return None
+    template = cv2.imread(path, cv2.IMREAD_COLOR)
+    if template is None:
+        return None
+    return np.ascontiguousarray(cv2.cvtColor(template, cv2.COLOR_BGR2RGB))
+
+
+def build_atlas(paths: Optional[List[str]] = None) -> Dict:
+    """Pack templates into a content-named .npy and point ATLAS_INDEX_PATH at it"""
+    if not CV2_AVAILABLE:
+        raise RuntimeError("OpenCV is required to build the template atlas")
+    if paths is None:
+        paths = collect_template_paths()
+
+    chunks = []
+    entries = {}
+    offset = 0
+    for path in paths:
+        template = load_template_png(path)
+        if template is None:
+            print(f"[ATLAS] ⚠️ Skipping missing/unreadable template: {path}")
+            continue
+        entries[path] = {
+            "offset": offset,
+            "shape": list(template.shape),
+            "sha1": _source_hash(path),
+        }
+        chunks.append(template.ravel())
+        offset += template.size
+
+    data = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.uint8)
+    data_sha1 = hashlib.sha1(data.tobytes()).hexdigest()
+    data_path = os.path.join(ATLAS_DIR, f"template_atlas.{data_sha1[:16]}.npy")
+    index = {
+        "version": ATLAS_FORMAT_VERSION,
+        "built_at": time.time(),
+        "color": "RGB",
+        "data": os.path.basename(data_path),
+        "data_sha1": data_sha1,
+        "total_bytes": int(data.size),
+        "entries": entries,
+    }
+
+    # The data file is complete under its own name before the index points at it; a process
+    # started mid-build still reads the previous index together with the previous data file
+    tmp_suffix = f".{os.getpid()}.tmp"
+    if not os.path.exists(data_path):
+        np.save(data_path + tmp_suffix + ".npy", data)
+        os.replace(data_path + tmp_suffix + ".npy", data_path)
+    with open(ATLAS_INDEX_PATH + tmp_suffix, 'w') as f:
+        json.dump(index, f, indent=2)
+    os.replace(ATLAS_INDEX_PATH + tmp_suffix, ATLAS_INDEX_PATH)
+
+    # Older builds: mapped copies stay valid on POSIX; on Windows the delete fails until unmapped
+    for old_path in glob.glob(ATLAS_DATA_PATTERN):
+        if os.path.normpath(old_path) != os.path.normpath(data_path):
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+    print(f"[ATLAS] Packed {len(entries)} templates ({data.size / 1024:.0f} KB) into {data_path}")
+    return index
+
+
+class TemplateAtlas:
+    """Views into the memory-mapped atlas, keyed by normalized template path"""
+
+    def __init__(self):
+        self.templates: Dict[str, np.ndarray] = {}
+        self.stale: List[str] = []
+        self.loaded = False
+
+    def load(self) -> bool:
+        """Map the atlas if it exists and matches this format version"""
+        if not os.path.exists(ATLAS_INDEX_PATH):
+            return False
+        try:
+            with open(ATLAS_INDEX_PATH, 'r') as f:
+                index = json.load(f)
+            if index.get("version") != ATLAS_FORMAT_VERSION:
+                print(f"[ATLAS] Atlas format {index.get('version')} != {ATLAS_FORMAT_VERSION}, ignoring it")
+                return False
+            # 'c' keeps the arrays writeable for OpenCV's bindings while pages stay shared
+            data = np.load(os.path.join(ATLAS_DIR, index["data"]), mmap_mode='c')
+            if data.size != index["total_bytes"]:
+                print(f"[ATLAS] {index['data']} does not match its index, ignoring it")
+                return False
+        except Exception as e:
+            print(f"[ATLAS] Could not load template atlas: {e}")
+            return False
+
+        self.templates.clear()
+        self.stale = []
+        for path, entry in index["entries"].items():
+            try:
+                if _source_hash(path) != entry["sha1"]:
+                    self.stale.append(path)
+                    continue
+            except OSError:
+                pass  # PNG deleted after the build - the packed copy is still valid
+            shape = tuple(entry["shape"])
+            count = int(np.prod(shape))
+            self.templates[path] = np.asarray(data[entry["offset"]:entry["offset"] + count]).reshape(shape)
+
+        self.loaded = True
+        return True
+
+    def get(self, path: str) -> Optional[np.ndarray]:
+        return self.templates.get(os.path.normpath(path))
+
+
+if __name__ == "__main__":
+    # Run from the project root so relative template paths resolve
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, os.getcwd())
+    build_atlas()
@@ -0,0 +1,362 @@
+"""
+ROI-grouped template matching.
+Template tasks of a task set are planned once: identical or heavily overlapping ROIs are
+merged into regions. Per frame each region is cropped (and converted to uint8 if needed)
+once, the first time any of its templates is checked; every template in the region then
+matches against a view of that shared buffer instead of slicing + astype-copying the frame
+(and the template) itself.
+"""
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+Roi = Tuple[int, int, int, int]
+
+# Merge two ROIs when their bounding box is at most this much larger than the area they cover
+MERGE_SLACK = 1.5
+
+# Coarse pyramid pass: candidates scoring >= confidence - PYRAMID_RELAX are re-verified at
+# full resolution; at most PYRAMID_MAX_CANDIDATES per template, and templates that would
+# shrink below PYRAMID_MIN_TEMPLATE_SIDE pixels are matched at full resolution only
+PYRAMID_RELAX = 0.15
+PYRAMID_MAX_CANDIDATES = 5
+PYRAMID_MIN_TEMPLATE_SIDE = 8
+
+
+def _clip_roi(roi: Iterable[int], frame_shape: Tuple[int, ...]) -> Roi:
+    x, y, w, h = (int(v) for v in roi)
+    height, width = frame_shape[:2]
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(width, x + w), min(height, y + h)
+    return x0, y0, max(0, x1 - x0), max(0, y1 - y0)
+
+
+def _union(a: Roi, b: Roi) -> Roi:
+    x0, y0 = min(a[0], b[0]), min(a[1], b[1])
+    x1, y1 = max(a[0] + a[2], b[0] + b[2]), max(a[1] + a[3], b[1] + b[3])
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def _should_merge(a: Roi, b: Roi) -> bool:
+    ix = max(0, min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1]))
+    if ix == 0 or iy == 0:
+        return False
+    covered = a[2] * a[3] + b[2] * b[3] - ix * iy
+    union = _union(a, b)
+    return union[2] * union[3] <= MERGE_SLACK * covered
+
+
+class TemplateInstance(NamedTuple):
+    """One match of a template: center in frame coordinates and TM_CCOEFF_NORMED score"""
+    x: int
+    y: int
+    score: float
+
+
+def extract_peaks(result: np.ndarray, threshold: float, min_distance: int,
+                  max_instances: Optional[int] = None) -> List[Tuple[int, int, float]]:
+    """
+    (x, y, score) of match peaks >= threshold, best first, no two closer than min_distance.
+    A dilation local-max mask reduces the (possibly huge) set of hits to a few peaks, then
+    greedy suppression runs vectorized over just those peaks.
+    """
+    mask = result >= threshold
+    if not mask.any():
+        return []
+
+    # Square window inscribed in the min_distance circle: peaks it removes would be suppressed anyway
+    half = max(1, int(min_distance / np.sqrt(2)))
+    dilated = cv2.dilate(result, np.ones((2 * half + 1, 2 * half + 1), np.uint8))
+    ys, xs = np.nonzero(mask & (result >= dilated))
+    scores = result[ys, xs]
+    order = np.argsort(-scores, kind='stable')
+    ys, xs, scores = ys[order], xs[order], scores[order]
+
+    keep = []
+    suppressed = np.zeros(len(scores), dtype=bool)
+    min_distance_sq = min_distance * min_distance
+    for i in range(len(scores)):
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        if max_instances is not None and len(keep) >= max_instances:
+            break
+        suppressed |= (xs - xs[i]) ** 2 + (ys - ys[i]) ** 2 < min_distance_sq
+    return [(int(xs[i]), int(ys[i]), float(scores[i])) for i in keep]
+
+
+def _downscale_gray(pixels: np.ndarray, scale: int) -> np.ndarray:
+    gray = cv2.cvtColor(pixels, cv2.COLOR_RGB2GRAY)
+    height, width = gray.shape[:2]
+    return cv2.resize(gray, (max(1, width // scale), max(1, height // scale)), interpolation=cv2.INTER_AREA)
+
+
+# (template_path, scale) -> grayscale downscaled template (templates never change at runtime)
+_coarse_templates: Dict[Tuple[str, int], np.ndarray] = {}
+
+
+def pyramid_scale_for(task: dict, default_enabled: bool, default_scale: int) -> int:
+    """Downscale factor for a task's coarse pass (0 = full resolution only).
+    Tasks override the global setting with "pyramid": True/False and "pyramid_scale": 2/4."""
+    if not task.get("pyramid", default_enabled):
+        return 0
+    return int(task.get("pyramid_scale", default_scale))
+
+
+class TemplateMatchPlan:
+    """Region assignment for a set of template ROIs (built once per task set)"""
+
+    def __init__(self, rois: Iterable[Iterable[int]], frame_shape: Tuple[int, ...]):
+        self.frame_shape = tuple(frame_shape[:2])
+        unique = list(OrderedDict.fromkeys(tuple(int(v) for v in roi) for roi in rois))
+
+        # Greedy merge until no pair of regions qualifies
+        regions: List[Roi] = [_clip_roi(roi, frame_shape) for roi in unique]
+        members: List[List[Roi]] = [[roi] for roi in unique]
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(regions)):
+                for j in range(i + 1, len(regions)):
+                    if _should_merge(regions[i], regions[j]):
+                        regions[i] = _union(regions[i], regions[j])
+                        members[i].extend(members[j])
+                        del regions[j], members[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+
+        self.regions = regions
+        self.region_of: Dict[Roi, int] = {}
+        for index, roi_list in enumerate(members):
+            for roi in roi_list:
+                self.region_of[roi] = index
+
+    def frame(self, frame, get_template: Callable[[str], Optional[np.ndarray]]) -> "TemplateFrame":
+        return TemplateFrame(frame, get_template, self)
+
+
+class TemplateFrame:
+    """One frame's template matching; region buffers are cropped lazily and shared"""
+
+    def __init__(self, frame, get_template: Callable[[str], Optional[np.ndarray]],
+                 plan: Optional[TemplateMatchPlan] = None):
+        self.frame = frame
+        self.get_template = get_template
+        self.plan = plan
+        self.buffers: Dict[int, Optional[np.ndarray]] = {}
+        self.coarse_buffers: Dict[Tuple[Roi, int], np.ndarray] = {}
+        self.checks = 0
+        self.crops = 0
+
+    def _crop(self, roi: Roi) -> Optional[np.ndarray]:
+        x, y, w, h = roi
+        try:
+            region = self.frame[y:y + h, x:x + w]
+        except IndexError:
+            return None  # Rows not captured in a partial (SparseFrame) capture
+        self.crops += 1
+        if region.dtype == np.uint8 and region.strides[-1] == 1 and region.strides[-2] == region.shape[-1]:
+            return region  # Row-strided uint8 view - OpenCV reads it without a copy
+        return np.ascontiguousarray(region, dtype=np.uint8)
+
+    def region(self, roi: Iterable[int]) -> Tuple[Optional[np.ndarray], int, int]:
+        """(pixels of roi clipped to the frame, x, y of its top-left corner)"""
+        roi = tuple(int(v) for v in roi)
+        self.checks += 1
+        x, y, w, h = _clip_roi(roi, self.frame.shape)
+
+        index = self.plan.region_of.get(roi) if self.plan is not None else None
+        if index is not None:
+            if index not in self.buffers:
+                self.buffers[index] = self._crop(self.plan.regions[index])
+            buffer = self.buffers[index]
+            if buffer is not None:
+                rx, ry = self.plan.regions[index][:2]
+                return buffer[y - ry:y - ry + h, x - rx:x - rx + w], x, y
+
+        return self._crop((x, y, w, h)), x, y
+
+    def match(self, template_path: str, roi: Iterable[int]):
+        """(TM_CCOEFF_NORMED result, template, x, y) or None when nothing can be matched"""
+        template = self.get_template(template_path)
+        if template is None:
+            return None
+        pixels, x, y = self.region(roi)
+        if pixels is None or pixels.size == 0:
+            return None
+        if pixels.shape[0] < template.shape[0] or pixels.shape[1] < template.shape[1]:
+            return None
+        return cv2.matchTemplate(pixels, template, cv2.TM_CCOEFF_NORMED), template, x, y
+
+    def _coarse_template(self, template_path: str, template: np.ndarray, scale: int) -> Optional[np.ndarray]:
+        key = (template_path, scale)
+        if key not in _coarse_templates:
+            coarse = None
+            if min(template.shape[:2]) // scale >= PYRAMID_MIN_TEMPLATE_SIDE:
+                coarse = _downscale_gray(template, scale)
+            _coarse_templates[key] = coarse
+        return _coarse_templates[key]
+
+    def find_best_pyramid(self, template_path: str, roi: Iterable[int], confidence: float,
+                          scale: int) -> Optional[Tuple[int, int]]:
+        """
+        find_best via a grayscale 1/scale pass over the ROI: candidates above the relaxed
+        threshold are re-matched in full color at full resolution in a small neighborhood,
+        so the result still honors `confidence` exactly.
+        """
+        template = self.get_template(template_path)
+        if template is None:
+            return None
+        coarse_template = self._coarse_template(template_path, template, scale)
+        pixels, x, y = self.region(roi)
+        if pixels is None or pixels.size == 0:
+            return None
+        template_h, template_w = template.shape[:2]
+        if pixels.shape[0] < template_h or pixels.shape[1] < template_w:
+            return None
+        if coarse_template is None:
+            return self._best_full(pixels, template, x, y, confidence)
+
+        coarse_key = ((x, y) + pixels.shape[:2], scale)
+        coarse_pixels = self.coarse_buffers.get(coarse_key)
+        if coarse_pixels is None:
+            coarse_pixels = _downscale_gray(pixels, scale)
+            self.coarse_buffers[coarse_key] = coarse_pixels
+        if coarse_pixels.shape[0] < coarse_template.shape[0] or coarse_pixels.shape[1] < coarse_template.shape[1]:
+            return self._best_full(pixels, template, x, y, confidence)
+
+        coarse = cv2.matchTemplate(coarse_pixels, coarse_template, cv2.TM_CCOEFF_NORMED)
+        # Only local maxima compete for the candidate slots (not neighbors of one strong peak)
+        peaks = np.where(coarse >= cv2.dilate(coarse, np.ones((3, 3), np.uint8)), coarse, -1.0)
+        flat = peaks.ravel()
+        candidate_count = min(PYRAMID_MAX_CANDIDATES, flat.size)
+        top = np.argpartition(flat, -candidate_count)[-candidate_count:]
+        top = top[flat[top] >= confidence - PYRAMID_RELAX]
+        if len(top) == 0:
+            return None
+
+        best_val, best_loc = -1.0, None
+        margin = scale + 1
+        for index in top[np.argsort(flat[top])[::-1]]:
+            cy, cx = divmod(int(index), coarse.shape[1])
+            # Neighborhood of the candidate at full resolution, clipped to the ROI
+            x0 = max(0, cx * scale - margin)
+            y0 = max(0, cy * scale - margin)
+            x1 = min(pixels.shape[1], cx * scale + template_w + margin)
+            y1 = min(pixels.shape[0], cy * scale + template_h + margin)
+            if x1 - x0 < template_w or y1 - y0 < template_h:
+                continue
+            result = cv2.matchTemplate(pixels[y0:y1, x0:x1], template, cv2.TM_CCOEFF_NORMED)
+            _, max_val, _, max_loc = cv2.minMaxLoc(result)
+            if max_val > best_val:
+                best_val, best_loc = max_val, (x0 + max_loc[0], y0 + max_loc[1])
+
+        if best_loc is None or best_val < confidence:
+            return None
+        return (x + best_loc[0] + template_w // 2, y + best_loc[1] + template_h // 2)
+
+    @staticmethod
+    def _best_full(pixels: np.ndarray, template: np.ndarray, x: int, y: int,
+                   confidence: float) -> Optional[Tuple[int, int]]:
+        return TemplateFrame._best_in_result(
+            cv2.matchTemplate(pixels, template, cv2.TM_CCOEFF_NORMED), template, x, y, confidence)
+
+    @staticmethod
+    def _best_in_result(result: np.ndarray, template: np.ndarray, x: int, y: int,
+                        confidence: float) -> Optional[Tuple[int, int]]:
+        _, max_val, _, max_loc = cv2.minMaxLoc(result)
+        if max_val < confidence:
+            return None
+        template_h, template_w = template.shape[:2]
+        return (x + max_loc[0] + template_w // 2, y + max_loc[1] + template_h // 2)
+
+    def find_best(self, template_path: str, roi: Iterable[int], confidence: float,
+                  pyramid_scale: int = 0) -> Optional[Tuple[int, int]]:
+        """Center of the best match when it reaches `confidence` (coarse-to-fine when pyramid_scale > 1)"""
+        if pyramid_scale > 1:
+            return self.find_best_pyramid(template_path, roi, confidence, pyramid_scale)
+        matched = self.match(template_path, roi)
+        if matched is None:
+            return None
+        result, template, x, y = matched
+        return self._best_in_result(result, template, x, y, confidence)
+
+    def find_instances(self, template_path: str, roi: Iterable[int], confidence: float,
+                       min_distance: int = 30, max_instances: Optional[int] = None) -> List[TemplateInstance]:
+        """Every match >= confidence, ranked by score, at least min_distance apart"""
+        matched = self.match(template_path, roi)
+        if matched is None:
+            return []
+        result, template, x, y = matched
+        template_h, template_w = template.shape[:2]
+        return [TemplateInstance(x + px + template_w // 2, y + py + template_h // 2, score)
+                for px, py, score in extract_peaks(result, confidence, min_distance, max_instances)]
+
+    def find_all(self, templates_to_check: List[Tuple[str, Iterable[int], float]],
+                 min_distance: int = 30) -> Dict[str, List[Tuple[int, int]]]:
+        """template_path -> centers of every match >= confidence (best first), at least min_distance apart"""
+        all_matches = {}
+        for template_path, roi, confidence in templates_to_check:
+            try:
+                instances = self.find_instances(template_path, roi, confidence, min_distance)
+            except cv2.error:
+                continue
+            if instances:
+                all_matches[template_path] = [(instance.x, instance.y) for instance in instances]
+        return all_matches
+
+
+class TemplatePlanCache:
+    """Plans keyed by the set of ROIs and frame size"""
+
+    def __init__(self, max_entries: int = 64):
+        self.entries: "OrderedDict[tuple, TemplateMatchPlan]" = OrderedDict()
+        self.max_entries = max_entries
+
+    def get(self, tasks: List[dict], frame_shape: Tuple[int, ...]) -> TemplateMatchPlan:
+        height, width = frame_shape[:2]
+        rois = [tuple(task.get("roi", [0, 0, width, height])) for task in tasks]
+        key = (tuple(sorted(set(rois))), (height, width))
+        plan = self.entries.get(key)
+        if plan is None:
+            plan = TemplateMatchPlan(rois, frame_shape)
+            self.entries[key] = plan
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        else:
+            self.entries.move_to_end(key)
+        return plan
+
+
+class TemplateMatchStats:
+    """Per-device counters of template checks vs region crops actually made"""
+
+    def __init__(self):
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def record(self, device_id: str, template_frame: TemplateFrame):
+        if template_frame.checks == 0:
+            return
+        stats = self.stats.setdefault(device_id, {"frames": 0, "checks": 0, "crops": 0})
+        stats["frames"] += 1
+        stats["checks"] += template_frame.checks
+        stats["crops"] += template_frame.crops
+
+    def format_stats(self, device_id: str) -> str:
+        stats = self.stats.get(device_id)
+        if not stats or not stats["frames"]:
+            return "Templates: no template frames yet"
+        saved = stats["checks"] - stats["crops"]
+        return (f"Templates: {stats['checks'] / stats['frames']:.1f} checks/frame, "
+                f"{saved / stats['frames']:.1f} crops+conversions saved/frame "
+                f"({saved / max(stats['checks'], 1):.0%})")
+
+
+# Global plan cache and stats
+template_plan_cache = TemplatePlanCache()
+template_match_stats = TemplateMatchStats()
@@ -0,0 +1,177 @@
+"""
+Resident Tesseract engine.
+
+pytesseract runs the tesseract CLI for every call: a process fork, the crop written to a
+temp image and the language data loaded again - tens of milliseconds before any recognition,
+and the orb path makes dozens of calls per read. With tesserocr installed, one TessBaseAPI
+per (PSM, whitelist) configuration is created on first use and kept for the life of the
+process; crops are passed as in-memory pixel buffers (SetImageBytes). Without tesserocr
+(or with TESSERACT_RESIDENT = False) calls go through pytesseract as before, and so does
+everything after the first engine that tesserocr fails to create (missing tessdata/lang).
+
+    text = tesseract_engine.image_to_string(crop, psm=7, whitelist="0123456789,")
+    words = tesseract_engine.words(crop)    # [{'text', 'conf', 'left', 'top', 'width', 'height'}]
+
+Latency comparison: python testing/bench_tesseract_engine.py
+"""
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import settings
+
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
+try:
+    import pytesseract
+    PYTESSERACT_AVAILABLE = True
+    # Configure Tesseract path for Windows (adjust as needed)
+    # pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+except ImportError:
+    PYTESSERACT_AVAILABLE = False
+
+# --oem 3: Tesseract's default engine mode (LSTM when available)
+OEM_DEFAULT = 3
+
+
+class TesseractEngine:
+    """Tesseract OCR through resident per-configuration engines, or the pytesseract CLI"""
+
+    def __init__(self, resident: bool = True, lang: str = "eng", tessdata_path: Optional[str] = None):
+        self.resident = resident and TESSEROCR_AVAILABLE
+        self.lang = lang
+        self.tessdata_path = tessdata_path
+        # (psm, whitelist) -> (TessBaseAPI, lock); an API instance isn't thread-safe
+        self.engines: Dict[Tuple[int, Optional[str]], Tuple[object, threading.Lock]] = {}
+        self.engines_lock = threading.Lock()
+        self.resident_error: Optional[str] = None  # Why tesserocr was given up on, if it was
+        self.calls = 0
+        self.total_time = 0.0
+
+    @property
+    def available(self) -> bool:
+        return self.resident or PYTESSERACT_AVAILABLE
+
+    @property
+    def backend(self) -> str:
+        return "tesserocr" if self.resident else "pytesseract"
+
+    def _engine(self, psm: int, whitelist: Optional[str]) -> Optional[Tuple[object, threading.Lock]]:
+        """Resident engine for the configuration, or None to use the CLI (creation failures are remembered)"""
+        key = (psm, whitelist)
+        engine = self.engines.get(key)
+        if engine is not None or not self.resident:
+            return engine
+        with self.engines_lock:
+            if key not in self.engines and self.resident:
+                kwargs = {"lang": self.lang, "psm": psm, "oem": OEM_DEFAULT}
+                if self.tessdata_path:
+                    kwargs["path"] = self.tessdata_path
+                try:
+                    api = tesserocr.PyTessBaseAPI(**kwargs)
+                except Exception as e:
+                    # Same tessdata/lang for every configuration - don't retry on every crop
+                    self.resident = False
+                    self.resident_error = str(e)
+                    fallback = "using pytesseract" if PYTESSERACT_AVAILABLE else "no Tesseract backend left"
+                    print(f"[TESSERACT] ⚠️ tesserocr engine creation failed ({e}) - {fallback}")
+                    return None
+                if whitelist:
+                    api.SetVariable("tessedit_char_whitelist", whitelist)
+                self.engines[key] = (api, threading.Lock())
+            return self.engines.get(key)
+
+    def _require_cli(self):
+        if not PYTESSERACT_AVAILABLE:
+            raise RuntimeError(f"tesserocr unavailable ({self.resident_error or 'not installed'}) "
+                               f"and pytesseract is not installed")
+
+    @staticmethod
+    def _set_image(api, img: np.ndarray):
+        """Hand a grayscale/RGB/RGBA uint8 array to the engine without encoding it"""
+        img = np.ascontiguousarray(img, dtype=np.uint8)
+        height, width = img.shape[:2]
+        bytes_per_pixel = 1 if img.ndim == 2 else img.shape[2]
+        api.SetImageBytes(img.tobytes(), width, height, bytes_per_pixel, width * bytes_per_pixel)
+
+    @staticmethod
+    def _cli_config(psm: int, whitelist: Optional[str]) -> str:
+        config = f"--oem {OEM_DEFAULT} --psm {psm}"
+        if whitelist:
+            config += f" -c tessedit_char_whitelist={whitelist}"
+        return config
+
+    def image_to_string(self, img: np.ndarray, psm: int = 7, whitelist: Optional[str] = None) -> str:
+        """Recognized text of a crop (pytesseract.image_to_string equivalent)"""
+        start = time.perf_counter()
+        try:
+            engine = self._engine(psm, whitelist)
+            if engine is not None:
+                api, lock = engine
+                with lock:
+                    self._set_image(api, img)
+                    return api.GetUTF8Text()
+            self._require_cli()
+            return pytesseract.image_to_string(img, config=self._cli_config(psm, whitelist))
+        finally:
+            self.calls += 1
+            self.total_time += time.perf_counter() - start
+
+    def words(self, img: np.ndarray, psm: int = 3, whitelist: Optional[str] = None) -> List[dict]:
+        """Recognized words with confidence and box (pytesseract.image_to_data equivalent)"""
+        start = time.perf_counter()
+        try:
+            engine = self._engine(psm, whitelist)
+            if engine is None:
+                self._require_cli()
+                data = pytesseract.image_to_data(img, config=self._cli_config(psm, whitelist),
+                                                 output_type=pytesseract.Output.DICT)
+                return [{"text": data['text'][i], "conf": float(data['conf'][i]),
+                         "left": data['left'][i], "top": data['top'][i],
+                         "width": data['width'][i], "height": data['height'][i]}
+                        for i in range(len(data['text']))]
+
+            api, lock = engine
+            words = []
+            with lock:
+                self._set_image(api, img)
+                api.Recognize()
+                iterator = api.GetIterator()
+                level = tesserocr.RIL.WORD
+                for word in tesserocr.iterate_level(iterator, level):
+                    box = word.BoundingBox(level)
+                    if box is None:
+                        continue
+                    left, top, right, bottom = box
+                    words.append({"text": word.GetUTF8Text(level) or "", "conf": word.Confidence(level),
+                                  "left": left, "top": top, "width": right - left, "height": bottom - top})
+            return words
+        finally:
+            self.calls += 1
+            self.total_time += time.perf_counter() - start
+
+    def format_stats(self) -> str:
+        average = self.total_time / self.calls * 1000 if self.calls else 0.0
+        return (f"Tesseract ({self.backend}): {self.calls} calls, {average:.1f}ms avg, "
+                f"{len(self.engines)} resident engines")
+
+    def close(self):
+        with self.engines_lock:
+            for api, lock in self.engines.values():
+                with lock:
+                    api.End()
+            self.engines.clear()
+
+
+# Global engine
+tesseract_engine = TesseractEngine(
+    resident=getattr(settings, 'TESSERACT_RESIDENT', True),
+    lang=getattr(settings, 'TESSERACT_LANG', "eng"),
+    tessdata_path=getattr(settings, 'TESSDATA_PATH', None),
+)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark: raw framebuffer capture vs PNG screencap.
+
+Captures N frames from each device with both ScreenshotManager capture paths and
+reports frames/sec plus host CPU seconds per frame (this process = decode work,
+children = adb client processes).
+
+Usage: python testing/bench_capture_modes.py [frames_per_device] [device_id ...]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+# Add the project root to the path so we can import the modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import settings
+from actions import ScreenshotManager
+
+
+async def bench_mode(mode: str, device_ids, frames: int) -> dict:
+    """Capture `frames` screenshots per device using the given capture mode"""
+    manager = ScreenshotManager(cache_duration=0)
+    manager.capture_mode = mode
+
+    captured = 0
+    failed = 0
+    shape = None
+
+    start_times = os.times()
+    start_wall = time.perf_counter()
+
+    for _ in range(frames):
+        results = await asyncio.gather(*[
+            manager.get_screenshot(device_id) for device_id in device_ids
+        ])
+        for img in results:
+            if img is None:
+                failed += 1
+            else:
+                captured += 1
+                shape = img.shape
+
+    wall = time.perf_counter() - start_wall
+    end_times = os.times()
+
+    host_cpu = (end_times.user - start_times.user) + (end_times.system - start_times.system)
+    child_cpu = ((end_times.children_user - start_times.children_user) +
+                 (end_times.children_system - start_times.children_system))
+
+    return {
+        'mode': mode,
+        'captured': captured,
+        'failed': failed,
+        'shape': shape,
+        'wall': wall,
+        'fps': captured / wall if wall > 0 else 0.0,
+        'host_cpu_per_frame_ms': host_cpu / max(captured, 1) * 1000,
+        'child_cpu_per_frame_ms': child_cpu / max(captured, 1) * 1000,
+        'fallback_devices': sorted(manager.png_fallback_devices),
+    }
+
+
+async def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    device_ids = sys.argv[2:] or settings.DEVICE_IDS
+
+    print("=" * 70)
+    print(f"CAPTURE BENCHMARK - {len(device_ids)} device(s), {frames} frames each")
+    print("=" * 70)
+
+    results = []
+    for mode in ("png", "raw"):
+        print(f"\nRunning '{mode}' capture...")
+        result = await bench_mode(mode, device_ids, frames)
+        results.append(result)
+        print(f"   Captured: {result['captured']} (failed: {result['failed']}), shape: {result['shape']}")
+        print(f"   Frames/sec: {result['fps']:.1f}")
+        print(f"   Host CPU per frame: {result['host_cpu_per_frame_ms']:.2f} ms (python) + "
+              f"{result['child_cpu_per_frame_ms']:.2f} ms (adb processes)")
+        if result['fallback_devices']:
+            print(f"   Fell back to PNG on: {result['fallback_devices']}")
+
+    png, raw = results
+    if png['fps'] > 0 and raw['fps'] > 0:
+        print("\n" + "=" * 70)
+        print(f"raw vs png: {raw['fps'] / png['fps']:.2f}x frames/sec, "
+              f"{png['host_cpu_per_frame_ms'] / max(raw['host_cpu_per_frame_ms'], 1e-6):.2f}x less decode CPU")
+        print("=" * 70)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark: process startup cost of OCR before/after lazy model loading.
+
+Each mode runs in a fresh interpreter and reports wall time and peak RSS:
+  eager      - import actions, then build the three readers actions.py used to build at
+               import (module reader + OCRManager general + digit network) - the old startup
+  lazy       - import actions only (what background_process, logical_process, task_runner
+               and the testing tools pay now)
+  first_ocr  - import actions, then one readtext() on a small crop (time to first OCR result)
+
+    python testing/bench_ocr_startup.py [runs]
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+import actions
+from ocr_engine import EASYOCR_INSTALLED, OCR_MODELS, detect_gpu
+mode = {mode!r}
+if mode == "eager" and EASYOCR_INSTALLED:
+    import easyocr
+    gpu = detect_gpu()
+    readers = [easyocr.Reader(['en'], gpu=gpu, verbose=False)]
+    readers.append(easyocr.Reader(['en'], gpu=gpu, verbose=False))
+    try:
+        readers.append(easyocr.Reader(['en'], gpu=gpu, verbose=False, **OCR_MODELS["digits"]))
+    except Exception:
+        pass
+elif mode == "first_ocr":
+    import numpy as np
+    actions.ocr_engine.readtext(np.full((40, 120, 3), 255, dtype=np.uint8), detail=1)
+elapsed = time.perf_counter() - start
+try:
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+except ImportError:
+    try:
+        import psutil
+        peak_mb = psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except Exception:
+        peak_mb = float("nan")
+print("RESULT " + json.dumps({{"seconds": elapsed, "peak_mb": peak_mb, "easyocr": EASYOCR_INSTALLED}}))
+"""
+
+
+def run_mode(mode: str) -> dict:
+    code = CHILD.format(root=PROJECT_ROOT, mode=mode)
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-c", code], cwd=PROJECT_ROOT,
+                               capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    for line in completed.stdout.splitlines():
+        if line.startswith("RESULT "):
+            result = json.loads(line[len("RESULT "):])
+            result["process_seconds"] = wall
+            return result
+    print(f"{mode} failed:\n{completed.stderr[-2000:]}")
+    return {}
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    print("=" * 64)
+    print(f"OCR STARTUP BENCHMARK ({runs} runs per mode, fresh interpreter each)")
+    print("=" * 64)
+    print(f"{'mode':<11}{'import+load s':>15}{'process s':>12}{'peak RSS MB':>14}")
+
+    summary = {}
+    for mode in ("eager", "lazy", "first_ocr"):
+        results = [result for result in (run_mode(mode) for _ in range(runs)) if result]
+        if not results:
+            continue
+        best = min(results, key=lambda result: result["seconds"])
+        summary[mode] = best
+        print(f"{mode:<11}{best['seconds']:>15.2f}{best['process_seconds']:>12.2f}{best['peak_mb']:>14.0f}")
+
+    if "eager" in summary and "lazy" in summary:
+        eager, lazy = summary["eager"], summary["lazy"]
+        print(f"\nStartup saved per process: {eager['seconds'] - lazy['seconds']:.2f}s, "
+              f"{eager['peak_mb'] - lazy['peak_mb']:.0f} MB")
+        if not lazy.get("easyocr"):
+            print("(EasyOCR isn't installed here - eager and lazy only differ where it is)")
+
+
+if __name__ == "__main__":
+    main()
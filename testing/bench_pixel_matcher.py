@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: legacy per-task pixel loop vs the compiled pixel matcher.
+
+Uses every pixel task from the real task lists in tasks/, paints the expected
+colors of a random subset of them onto a noise frame, checks that both
+implementations agree and reports the time per frame.
+
+Usage: python testing/bench_pixel_matcher.py [iterations]
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add the project root to the path so we can import the modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import settings
+import tasks
+from pixel_matcher import CompiledPixelTasks
+
+
+def hex_to_rgb(hex_color: str):
+    hex_color = hex_color.lstrip('#')
+    return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+
+
+def legacy_match(frame: np.ndarray, pixel_tasks) -> np.ndarray:
+    """The per-task loop batch_check_pixels_enhanced used before compilation"""
+    matches = np.zeros(len(pixel_tasks), dtype=bool)
+    for index, task in enumerate(pixel_tasks):
+        search_array = task["search_array"]
+        all_match = True
+        try:
+            for i in range(0, len(search_array), 2):
+                coords_str, hex_color = search_array[i], search_array[i+1]
+                x, y = map(int, coords_str.split(','))
+                expected_rgb_gpu = np.array(hex_to_rgb(hex_color))
+                if 0 <= y < frame.shape[0] and 0 <= x < frame.shape[1]:
+                    if not np.array_equal(frame[y, x], expected_rgb_gpu):
+                        all_match = False
+                        break
+                else:
+                    all_match = False
+                    break
+        except (ValueError, IndexError):
+            all_match = False  # The legacy loop raised here; the compiled matcher never matches
+        matches[index] = all_match
+    return matches
+
+
+def load_pixel_tasks():
+    pixel_tasks = []
+    for name in tasks.__all__:
+        for task in getattr(tasks, name):
+            if task.get("type", "pixel") == "pixel":
+                pixel_tasks.append(task)
+    return pixel_tasks
+
+
+def build_frame(pixel_tasks, width: int, height: int, painted_fraction: float = 0.3) -> np.ndarray:
+    rng = np.random.default_rng(42)
+    frame = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    for task in pixel_tasks:
+        if rng.random() >= painted_fraction:
+            continue
+        try:
+            pixels = CompiledPixelTasks._parse_search_array(task["search_array"])
+        except (ValueError, IndexError):
+            continue
+        for x, y, rgb in pixels:
+            if 0 <= y < height and 0 <= x < width:
+                frame[y, x] = rgb
+    return frame
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    width, height = settings.EMULATOR_RESOLUTION
+
+    pixel_tasks = load_pixel_tasks()
+    frame = build_frame(pixel_tasks, width, height)
+
+    start = time.perf_counter()
+    compiled = CompiledPixelTasks(pixel_tasks, frame.shape)
+    compile_time = time.perf_counter() - start
+
+    legacy_result = legacy_match(frame, pixel_tasks)
+    compiled_result = compiled.match(frame)
+    mismatches = np.flatnonzero(legacy_result != compiled_result)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        legacy_match(frame, pixel_tasks)
+    legacy_time = (time.perf_counter() - start) / iterations
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        compiled.match(frame)
+    compiled_time = (time.perf_counter() - start) / iterations
+
+    print("=" * 70)
+    print(f"PIXEL MATCHER BENCHMARK - {len(pixel_tasks)} pixel tasks, {len(compiled.ys)} pixels, "
+          f"{width}x{height} frame")
+    print("=" * 70)
+    print(f"Matched tasks: {int(compiled_result.sum())}")
+    print(f"Compile time:  {compile_time * 1000:.2f} ms (once per task set)")
+    print(f"Legacy loop:   {legacy_time * 1000:.3f} ms/frame")
+    print(f"Compiled:      {compiled_time * 1000:.3f} ms/frame")
+    print(f"Speedup:       {legacy_time / max(compiled_time, 1e-9):.1f}x")
+    if len(mismatches):
+        print(f"❌ {len(mismatches)} task(s) disagree: "
+              f"{[pixel_tasks[i].get('task_name') for i in mismatches[:5]]}")
+    else:
+        print("✅ Results identical")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-mutation JSON rewrite (old _save_state) vs the append-only state journal.
+
+Replays a synthetic account run - mostly update_session_stats calls (one per executed
+task, device_test.json recorded 19,646 in one session) with a flag change every 50
+tasks - against a scratch device_states/ directory, and reports mutations/second and
+fsyncs per second for both.
+
+The journal is driven for several JOURNAL_FSYNC_INTERVAL windows so its fsyncs come from the
+background group commit and compaction, not just the final flush at close().
+
+Usage: python testing/bench_state_journal.py [mutations] [fsync_intervals]
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+DEVICE_ID = "127.0.0.1:16800"
+FLAG_KEYS = ["EasyMode", "Recive_GiftBox", "Skip_Kon_Bonaza", "Sort_Filter_Ascension", "Upgrade_Characters_Level"]
+
+
+def tasks_per_account_run() -> int:
+    try:
+        with open(os.path.join(PROJECT_ROOT, "device_test.json"), 'r') as f:
+            return json.load(f)["SessionStats"]["TasksExecuted"]
+    except Exception:
+        return 19646
+
+
+def legacy_save(state: dict, state_file: str):
+    """What every update_state did before: backup copy + indent=2 rewrite + fsync + rename"""
+    if os.path.exists(state_file):
+        shutil.copy2(state_file, state_file + ".backup")
+    temp_file = state_file + ".tmp"
+    with open(temp_file, 'w') as f:
+        json.dump(state, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, state_file)
+
+
+def run_legacy(manager, mutations: int) -> float:
+    state = manager.get_state(DEVICE_ID)
+    state_file = manager._get_state_file_path("DEVICE1")
+    start = time.perf_counter()
+    for i in range(mutations):
+        if i % 50 == 0:
+            state[FLAG_KEYS[(i // 50) % len(FLAG_KEYS)]] = i % 2
+        else:
+            state["SessionStats"]["TasksExecuted"] += 1
+            state["SessionStats"]["LastTaskExecuted"] = f"Task {i}"
+        legacy_save(state, state_file)
+    return time.perf_counter() - start
+
+
+def run_journal(manager, seconds: float):
+    """Mutate as fast as possible for `seconds`; returns (mutations, elapsed)"""
+    start = time.perf_counter()
+    deadline = start + seconds
+    i = 0
+    while time.perf_counter() < deadline:
+        if i % 50 == 0:
+            manager.update_state(DEVICE_ID, FLAG_KEYS[(i // 50) % len(FLAG_KEYS)], i % 2)
+        else:
+            manager.update_session_stats(DEVICE_ID, f"Task {i}")
+        i += 1
+    manager.close()  # Final group commit + compaction, as at process exit
+    return i, time.perf_counter() - start
+
+
+def main():
+    mutations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    intervals = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    per_run = tasks_per_account_run()
+
+    workdir = tempfile.mkdtemp(prefix="state_bench_")
+    os.chdir(workdir)  # device_state_manager uses relative device_states/
+    try:
+        from device_state_manager import device_state_manager as manager
+
+        window = intervals * manager.JOURNAL_FSYNC_INTERVAL
+        legacy_time = run_legacy(manager, mutations)
+        manager.persist_stats.update(mutations=0, journal_bytes=0, fsyncs=0, compactions=0)
+        journal_mutations, journal_time = run_journal(manager, window)
+        stats = dict(manager.persist_stats)
+    finally:
+        os.chdir(PROJECT_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    legacy_rate = mutations / legacy_time
+    journal_rate = journal_mutations / journal_time
+    print("=" * 70)
+    print(f"STATE PERSISTENCE BENCHMARK - legacy {mutations} mutations, journal {window:.0f}s "
+          f"({intervals} x {manager.JOURNAL_FSYNC_INTERVAL:g}s fsync windows)")
+    print("=" * 70)
+    print(f"Legacy rewrite: {legacy_rate:10.0f} mutations/s   "
+          f"fsyncs/s: {legacy_rate:8.0f}   fsyncs/account run: {per_run}")
+    print(f"Journal:        {journal_rate:10.0f} mutations/s   "
+          f"fsyncs/s: {stats['fsyncs'] / journal_time:8.1f}   "
+          f"fsyncs/1000 mutations: {stats['fsyncs'] * 1000 / max(journal_mutations, 1):.2f}")
+    print(f"Speedup:        {journal_rate / max(legacy_rate, 1e-9):.1f}x")
+    print(f"Journal bytes/mutation: {stats['journal_bytes'] / max(stats['mutations'], 1):.0f}   "
+          f"compactions: {stats['compactions']}")
+    print("Journal fsyncs scale with wall time (one group commit per window plus compactions),")
+    print("not with mutations: an account run costs about fsyncs/s x its busy seconds.")
+
+
+if __name__ == "__main__":
+    main()
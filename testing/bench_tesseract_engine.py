@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark: pytesseract (CLI process per call) vs resident tesserocr engines.
+
+Renders orb-counter style crops ("21,137" - white digits on a dark background, upscaled
+like the orb preprocessors do), runs the orb path's calls (4 PSM modes, digit whitelist)
+through both backends and reports per-call latency and whether the texts agree.
+Pass recorded crops (PNG) to use them instead of synthetic ones.
+
+Usage: python testing/bench_tesseract_engine.py [iterations] [crop.png ...]
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import cv2
+
+# Add the project root to the path so we can import the modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tesseract_engine import PYTESSERACT_AVAILABLE, TESSEROCR_AVAILABLE, TesseractEngine
+
+PSMS = (7, 8, 11, 13)
+WHITELIST = "0123456789,"
+
+
+def synthetic_crops() -> list:
+    crops = []
+    for value, scale in (("21,137", 3), ("9,480", 3), ("45,002", 2), ("1,999", 4)):
+        crop = np.full((29, 57), 30, dtype=np.uint8)
+        cv2.putText(crop, value, (2, 21), cv2.FONT_HERSHEY_SIMPLEX, 0.55, 255, 1, cv2.LINE_AA)
+        crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+        crops.append(cv2.bitwise_not(crop))  # Dark text on white, as Tesseract prefers
+    return crops
+
+
+def run(engine: TesseractEngine, crops: list, iterations: int):
+    """(per-call latencies in ms, texts of the first iteration)"""
+    latencies, texts = [], []
+    for iteration in range(iterations):
+        for crop in crops:
+            for psm in PSMS:
+                start = time.perf_counter()
+                text = engine.image_to_string(crop, psm=psm, whitelist=WHITELIST).strip()
+                latencies.append((time.perf_counter() - start) * 1000)
+                if iteration == 0:
+                    texts.append(text)
+    return np.array(latencies), texts
+
+
+def report(name: str, latencies: np.ndarray):
+    print(f"{name:<24}{latencies.mean():>10.2f}{np.median(latencies):>10.2f}"
+          f"{np.percentile(latencies, 95):>10.2f}{latencies.max():>10.2f}")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    crops = [cv2.imread(path, cv2.IMREAD_GRAYSCALE) for path in sys.argv[2:]] or synthetic_crops()
+    crops = [crop for crop in crops if crop is not None]
+
+    print("=" * 64)
+    print(f"TESSERACT BENCHMARK ({len(crops)} crops x {len(PSMS)} PSM modes x {iterations} iterations)")
+    print("=" * 64)
+    if not PYTESSERACT_AVAILABLE or not TESSEROCR_AVAILABLE:
+        print(f"pytesseract installed: {PYTESSERACT_AVAILABLE}, tesserocr installed: {TESSEROCR_AVAILABLE}")
+        print("Both are needed for the comparison (pip install pytesseract tesserocr)")
+        return
+
+    cli = TesseractEngine(resident=False)
+    resident = TesseractEngine(resident=True)
+
+    # First resident calls create the engines - report that separately
+    start = time.perf_counter()
+    for psm in PSMS:
+        resident.image_to_string(crops[0], psm=psm, whitelist=WHITELIST)
+    warmup_ms = (time.perf_counter() - start) * 1000
+
+    cli_latencies, cli_texts = run(cli, crops, iterations)
+    resident_latencies, resident_texts = run(resident, crops, iterations)
+
+    print(f"{'backend (ms/call)':<24}{'mean':>10}{'median':>10}{'p95':>10}{'max':>10}")
+    report("pytesseract (CLI)", cli_latencies)
+    report("tesserocr (resident)", resident_latencies)
+    print(f"\nResident engine creation: {warmup_ms:.0f}ms for {len(PSMS)} configurations (once per process)")
+    print(f"Speedup: {cli_latencies.mean() / resident_latencies.mean():.1f}x per call, "
+          f"{(cli_latencies.mean() - resident_latencies.mean()) * len(PSMS) * 32 / 1000:.2f}s saved "
+          f"per full orb read (4 ROIs x 8 strategies x {len(PSMS)} PSMs)")
+
+    agree = sum(a == b for a, b in zip(cli_texts, resident_texts))
+    print(f"Identical text: {agree}/{len(cli_texts)} calls")
+    for a, b in zip(cli_texts, resident_texts):
+        if a != b:
+            print(f"  pytesseract '{a}' vs tesserocr '{b}'")
+    resident.close()
+
+
+if __name__ == "__main__":
+    main()
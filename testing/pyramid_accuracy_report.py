@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Accuracy vs speed report for coarse-to-fine (pyramid) template matching.
+
+Runs every template task from tasks/ over a folder of recorded frames, once at full
+resolution (the reference) and once per pyramid scale, and reports per scale:
+agreement with the reference, missed detections, extra detections, position drift and
+time per check - plus the tasks that disagree, so they can be pinned to "pyramid": False.
+
+Record frames first (PNG screenshots at the emulator resolution), e.g.:
+    python testing/pyramid_accuracy_report.py --capture 127.0.0.1:16800 50 recorded_frames
+Then:
+    python testing/pyramid_accuracy_report.py recorded_frames [scales...]   (default: 2 4)
+"""
+
+import glob
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import cv2
+
+# Add the project root to the path so we can import the modules
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+import tasks
+from template_atlas import load_template_png
+from template_matching import TemplateFrame
+
+MAX_POSITION_DRIFT = 2  # Pixels; larger differences count as disagreement
+
+
+def capture_frames(device_id: str, count: int, out_dir: str, interval: float = 1.0):
+    os.makedirs(out_dir, exist_ok=True)
+    for index in range(count):
+        png = subprocess.run(["adb", "-s", device_id, "exec-out", "screencap", "-p"],
+                             capture_output=True).stdout
+        path = os.path.join(out_dir, f"{device_id.replace(':', '_')}_{int(time.time())}_{index:04d}.png")
+        with open(path, 'wb') as f:
+            f.write(png)
+        print(f"Saved {path}")
+        time.sleep(interval)
+
+
+def load_template_tasks():
+    template_tasks = []
+    for name in tasks.__all__:
+        for task in getattr(tasks, name):
+            if task.get("type") != "template":
+                continue
+            paths = [task["template_path"]] if task.get("template_path") else task.get("template_paths", [])
+            for path in paths:
+                template_tasks.append((task.get("task_name", "?"), path, task.get("roi"), task.get("confidence", 0.9)))
+    return template_tasks
+
+
+def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == "--capture":
+        capture_frames(sys.argv[2], int(sys.argv[3]), sys.argv[4] if len(sys.argv) > 4 else "recorded_frames")
+        return
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return
+
+    frame_dir = os.path.abspath(sys.argv[1])
+    scales = [int(s) for s in sys.argv[2:]] or [2, 4]
+    os.chdir(PROJECT_ROOT)  # Template paths are relative to the project root
+
+    frames = []
+    for path in sorted(glob.glob(os.path.join(frame_dir, "*.png"))):
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is not None:
+            frames.append((os.path.basename(path), cv2.cvtColor(image, cv2.COLOR_BGR2RGB)))
+    if not frames:
+        print(f"No PNG frames found in {frame_dir}")
+        return
+
+    templates = {}
+
+    def get_template(path):
+        if path not in templates:
+            templates[path] = load_template_png(path)
+        return templates[path]
+
+    template_tasks = load_template_tasks()
+    checks = len(frames) * len(template_tasks)
+
+    # Reference: full resolution
+    reference = {}
+    start = time.perf_counter()
+    for frame_name, frame in frames:
+        matcher = TemplateFrame(frame, get_template)
+        height, width = frame.shape[:2]
+        for task_name, path, roi, confidence in template_tasks:
+            reference[(frame_name, task_name, path)] = matcher.find_best(path, roi or [0, 0, width, height], confidence)
+    full_time = (time.perf_counter() - start) / checks
+
+    print("=" * 78)
+    print(f"PYRAMID ACCURACY REPORT - {len(frames)} frames x {len(template_tasks)} template checks")
+    print("=" * 78)
+    print(f"{'mode':<10}{'ms/check':>10}{'speedup':>9}{'agree':>9}{'missed':>8}{'extra':>7}{'drift':>7}")
+    print(f"{'full':<10}{full_time * 1000:>10.3f}{'1.0x':>9}{'100%':>9}{0:>8}{0:>7}{0:>7}")
+
+    reference_hits = sum(1 for value in reference.values() if value is not None)
+    for scale in scales:
+        missed = extra = drift = 0
+        disagreements = defaultdict(int)
+        start = time.perf_counter()
+        results = {}
+        for frame_name, frame in frames:
+            matcher = TemplateFrame(frame, get_template)
+            height, width = frame.shape[:2]
+            for task_name, path, roi, confidence in template_tasks:
+                results[(frame_name, task_name, path)] = matcher.find_best(
+                    path, roi or [0, 0, width, height], confidence, pyramid_scale=scale)
+        scale_time = (time.perf_counter() - start) / checks
+
+        for key, expected in reference.items():
+            got = results[key]
+            if expected is None and got is None:
+                continue
+            if expected is None:
+                extra += 1
+            elif got is None:
+                missed += 1
+            elif max(abs(expected[0] - got[0]), abs(expected[1] - got[1])) > MAX_POSITION_DRIFT:
+                drift += 1
+            else:
+                continue
+            disagreements[(key[1], key[2])] += 1
+
+        agree = 1 - (missed + extra + drift) / max(len(reference), 1)
+        print(f"{'1/' + str(scale):<10}{scale_time * 1000:>10.3f}{full_time / max(scale_time, 1e-9):>8.1f}x"
+              f"{agree:>9.1%}{missed:>8}{extra:>7}{drift:>7}")
+        for (task_name, path), count in sorted(disagreements.items(), key=lambda item: -item[1])[:10]:
+            print(f"    ⚠️ {count:>3}x  {task_name}  ({path})")
+
+    print(f"\nReference detections: {reference_hits} of {len(reference)} checks")
+    print("Missed = found at full resolution only; extra = found only with the pyramid "
+          "(should be 0: every hit is verified at full resolution).")
+
+
+if __name__ == "__main__":
+    main()